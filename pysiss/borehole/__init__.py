@@ -7,14 +7,16 @@
     description: Initialisation of the pysiss.borehole module.
 """
 
-from .borehole import Borehole, Feature
+from .borehole import Borehole, Feature, Survey, desurvey_boreholes, \
+    composite_boreholes
 from .datasets import DataSet, PointDataSet, IntervalDataSet
-from .properties import Property, PropertyType
+from .properties import Property, PropertyType, PropertyBlock
+from .store import BoreholeStore
 from pysiss.borehole.siss.borehole_generator import SISSBoreholeGenerator
 from . import plotting, analysis
 
-__all__ = [Borehole, Feature,
+__all__ = [Borehole, Feature, Survey, desurvey_boreholes, composite_boreholes,
            DataSet, PointDataSet, IntervalDataSet,
-           Property, PropertyType,
+           Property, PropertyType, PropertyBlock, BoreholeStore,
            SISSBoreholeGenerator,
            plotting, analysis]
@@ -9,4 +9,9 @@
 """
 
 from .regularizer import ReSampler, unique
-from .detrend import detrend, demean
\ No newline at end of file
+from .detrend import detrend, demean
+from .interpolate import nearest_indices, linear_weights, \
+    interpolate_linear, interpolate
+from .segments import interval_index, range_reduce, segment_reduce, \
+    label_reduce
+from .composite import composite, composite_boundaries
@@ -0,0 +1,131 @@
+""" file: composite.py (pysiss.borehole.analysis)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Friday 23 January, 2015
+
+    description: Length-weighted compositing of interval data
+
+    The sample intervals are sorted and don't overlap, so the integral of a
+    property down the hole is piecewise linear, with a kink at each interval
+    boundary. We tabulate the integral at the start of each sample interval
+    with a cumulative sum; the integral at any other depth is then one
+    binary search and a linear step away. The length-weighted mean over a
+    composite interval is the difference of the integrals at its ends divided
+    by the length of sampled core between them, which we get in the same way
+    by integrating one over the sampled intervals. So compositing costs a
+    cumulative sum and two binary searches for all the composites and all
+    the properties at once.
+"""
+
+import numpy
+
+
+def composite_boundaries(from_depth, to_depth, length=None, breaks=None,
+                         origin=0.):
+    """ Generate composite intervals covering a range of depths
+
+        :param from_depth, to_depth: The range of depths to cover
+        :type from_depth, to_depth: float
+        :param length: The length of each composite. Optional, if None each
+            domain (the intervals between breaks) forms a single composite.
+        :type length: float
+        :param breaks: Depths where composites must end, such as domain
+            boundaries. Fixed-length composites restart at each break, so the
+            last composite before a break may be short. Optional, defaults
+            to None.
+        :type breaks: `numpy.ndarray`
+        :param origin: The depth the fixed-length composites are aligned
+            with, so that the first composite starts at `origin + k * length`
+            for some integer k. Optional, defaults to 0.
+        :type origin: float
+        :returns: arrays of the from and to depths of the composites
+    """
+    if length is not None:
+        if length <= 0:
+            raise ValueError("Composite length must be positive, not "
+                             "{0}".format(length))
+        from_depth = origin + numpy.floor(
+            (from_depth - origin) / float(length)) * length
+    edges = [[from_depth], [to_depth]]
+    if breaks is not None:
+        breaks = numpy.asarray(breaks, dtype=numpy.float_)
+        edges.append(breaks[(breaks > from_depth) & (breaks < to_depth)])
+    edges = numpy.unique(numpy.concatenate(edges))
+    if length is None:
+        return edges[:-1], edges[1:]
+
+    # Split each domain into pieces of the given length, all at once
+    starts, stops = edges[:-1], edges[1:]
+    counts = numpy.maximum(numpy.ceil(
+        numpy.round((stops - starts) / float(length), 9)), 1).astype(int)
+    domain = numpy.repeat(numpy.arange(len(counts)), counts)
+    offsets = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    piece = numpy.arange(counts.sum()) - offsets[domain]
+    comp_from = starts[domain] + piece * length
+    comp_to = numpy.minimum(comp_from + length, stops[domain])
+    return comp_from, comp_to
+
+
+def composite(from_depths, to_depths, values, comp_from, comp_to,
+              min_coverage=0.5):
+    """ Calculate length-weighted means of some interval data over a set of
+        composite intervals
+
+        NaN values are treated as unsampled, so each property is averaged
+        over the core where it has a value.
+
+        :param from_depths, to_depths: The sample intervals, which must be
+            sorted and not overlap
+        :type from_depths, to_depths: `numpy.ndarray`
+        :param values: The values of each property, one row per property
+        :type values: `numpy.ndarray` with shape `(nproperties, nsamples)`
+        :param comp_from, comp_to: The composite intervals, which may overlap
+        :type comp_from, comp_to: `numpy.ndarray`
+        :param min_coverage: The fraction of each composite which must be
+            sampled (for that property) for a composite value to be
+            calculated. Composites with less coverage are NaN. Optional,
+            defaults to 0.5.
+        :type min_coverage: float
+        :returns: the composited values, with shape
+            `(nproperties, ncomposites)`, and the fraction of each composite
+            which is covered by a sample interval
+    """
+    from_depths = numpy.asarray(from_depths, dtype=numpy.float_)
+    to_depths = numpy.asarray(to_depths, dtype=numpy.float_)
+    values = numpy.atleast_2d(numpy.asarray(values, dtype=numpy.float_))
+    comp_from = numpy.asarray(comp_from, dtype=numpy.float_)
+    comp_to = numpy.asarray(comp_to, dtype=numpy.float_)
+
+    # Integrate the sampled length, the sampled length for each property
+    # and each property's values in one block
+    isnan = numpy.isnan(values)
+    rates = numpy.vstack([numpy.ones((1, values.shape[1])), ~isnan,
+                          numpy.where(isnan, 0, values)])
+    sums = _integrate(from_depths, to_depths, rates, comp_to) \
+        - _integrate(from_depths, to_depths, rates, comp_from)
+    nprops = values.shape[0]
+    sampled, weights, totals = sums[0], sums[1:nprops + 1], sums[nprops + 1:]
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        coverage = sampled / (comp_to - comp_from)
+        result = totals / weights
+        result[weights < min_coverage * (comp_to - comp_from)] = numpy.nan
+    result[weights <= 0] = numpy.nan
+    return result, coverage
+
+
+def _integrate(from_depths, to_depths, rates, depths):
+    """ Integrate piecewise constant rates over the given intervals from
+        the top of the hole to each of the given depths
+    """
+    lengths = to_depths - from_depths
+    cumulative = numpy.zeros((rates.shape[0], rates.shape[1] + 1))
+    numpy.cumsum(rates * lengths, axis=1, out=cumulative[:, 1:])
+
+    # Add the part of the interval containing each depth (if any)
+    index = numpy.searchsorted(from_depths, depths, side='right') - 1
+    above = index < 0
+    index[above] = 0
+    partial = numpy.clip(depths - from_depths[index], 0, lengths[index])
+    partial[above] = 0
+    return cumulative[:, index] + rates[:, index] * partial
@@ -0,0 +1,171 @@
+""" file: interpolate.py (pysiss.borehole.analysis)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Thursday 15 January, 2015
+
+    description: Interpolation engines for resampling data defined on
+        monotonically increasing depths.
+
+    Since PointDataSet depths are always sorted, we can find the neighbours
+    of each new depth with a binary search (`numpy.searchsorted`) rather
+    than by comparing every old depth against every new depth. This keeps
+    the time at O(M log N) and the memory linear in the number of depths.
+"""
+
+import numpy
+from scipy.interpolate import make_interp_spline, \
+    InterpolatedUnivariateSpline
+
+
+def nearest_indices(depths, new_depths):
+    """ Return the indices of the nearest depth for each new depth.
+
+        Ties are resolved towards the shallower sample, so that this gives
+        the same result as taking the `argmin` of the distance matrix between
+        the two depth arrays.
+
+        Example usage:
+
+            indices = nearest_indices(depths, new_depths)
+            new_values = values[indices]
+
+        :param depths: The sample depths. Must be monotonically increasing.
+        :type depths: `numpy.ndarray`
+        :param new_depths: The depths to find neighbours for
+        :type new_depths: `numpy.ndarray`
+        :returns: an integer `numpy.ndarray` the same length as `new_depths`
+    """
+    depths = numpy.asarray(depths)
+    new_depths = numpy.asarray(new_depths)
+
+    if len(depths) == 1:
+        return numpy.zeros(len(new_depths), dtype=int)
+
+    # Get the index of the first depth >= each new depth, and compare with
+    # the depth immediately above
+    upper = numpy.clip(numpy.searchsorted(depths, new_depths, side='left'),
+                       1, len(depths) - 1)
+    lower = upper - 1
+    use_lower = \
+        (new_depths - depths[lower]) <= (depths[upper] - new_depths)
+    return numpy.where(use_lower, lower, upper)
+
+
+def linear_weights(depths, new_depths):
+    """ Return the bracketing indices and weights for linear interpolation.
+
+        New depths outside the range of `depths` are linearly extrapolated
+        from the first or last pair of samples, which matches the behaviour
+        of a first-order `scipy.interpolate.InterpolatedUnivariateSpline`.
+
+        Example usage:
+
+            lower, weight = linear_weights(depths, new_depths)
+            new_values = (1 - weight) * values[lower] \
+                + weight * values[lower + 1]
+
+        :param depths: The sample depths. Must be monotonically increasing
+            and contain at least two values.
+        :type depths: `numpy.ndarray`
+        :param new_depths: The depths to interpolate at
+        :type new_depths: `numpy.ndarray`
+        :returns: the indices of the sample above each new depth, and the
+            weight to give the sample below it.
+    """
+    depths = numpy.asarray(depths, dtype=numpy.float_)
+    new_depths = numpy.asarray(new_depths, dtype=numpy.float_)
+    if len(depths) < 2:
+        raise ValueError("Linear interpolation needs at least two depths")
+
+    lower = numpy.clip(
+        numpy.searchsorted(depths, new_depths, side='right') - 1,
+        0, len(depths) - 2)
+    weight = (new_depths - depths[lower]) \
+        / (depths[lower + 1] - depths[lower])
+    return lower, weight
+
+
+def interpolate_linear(depths, values, new_depths):
+    """ Linearly interpolate values onto a new set of depths.
+
+        :param depths: The sample depths. Must be monotonically increasing.
+        :type depths: `numpy.ndarray`
+        :param values: The values at each depth
+        :type values: `numpy.ndarray`
+        :param new_depths: The depths to interpolate at
+        :type new_depths: `numpy.ndarray`
+        :returns: the interpolated values as a `numpy.ndarray`
+    """
+    values = numpy.asarray(values, dtype=numpy.float_)
+    lower, weight = linear_weights(depths, new_depths)
+    return (1 - weight) * values[lower] + weight * values[lower + 1]
+
+
+def interpolate(depths, values, new_depths, degree=1):
+    """ Interpolate a block of values onto a new set of depths in one pass.
+
+        The values are given as a two-dimensional array with one row per
+        property, and all rows are interpolated against the shared depth
+        vector together. This is much faster than fitting each property
+        separately when a dataset has many properties.
+
+        The interpolation method depends on the degree:
+            - `degree=0` uses nearest-neighbour interpolation
+            - `degree=1` uses linear interpolation
+            - `degree>1` (up to 5) uses the same interpolating spline of
+                the given degree as
+                `scipy.interpolate.InterpolatedUnivariateSpline`. For degree
+                2 and odd degrees the spline coefficients for every row are
+                solved for at once; scipy can't do this for even degrees
+                above 2, so for degree 4 each row is fitted separately.
+
+        In all cases values are extrapolated beyond the range of `depths`.
+
+        :param depths: The sample depths. Must be monotonically increasing.
+        :type depths: `numpy.ndarray`
+        :param values: The values at each depth, with shape
+            `(nproperties, len(depths))`. A one-dimensional array is treated
+            as a single property.
+        :type values: `numpy.ndarray`
+        :param new_depths: The depths to interpolate at
+        :type new_depths: `numpy.ndarray`
+        :param degree: The degree of the interpolation, from 0 to 5.
+            Optional, defaults to 1 (i.e. linear interpolation).
+        :type degree: int
+        :returns: the interpolated values, with shape
+            `(nproperties, len(new_depths))`, or a one-dimensional array if
+            `values` was one-dimensional.
+        :raises: ValueError if the degree isn't between 0 and 5.
+    """
+    if degree not in range(6):
+        raise ValueError("Interpolation degree must be an integer from 0 "
+                         "to 5, not {0}".format(degree))
+    depths = numpy.asarray(depths, dtype=numpy.float_)
+    new_depths = numpy.asarray(new_depths, dtype=numpy.float_)
+    values = numpy.asarray(values)
+    if values.shape[-1] != len(depths):
+        raise ValueError("Values must have the same number of samples "
+                         "as depths (got {0} values for {1} depths)".format(
+                             values.shape[-1], len(depths)))
+    if values.ndim == 1:
+        return interpolate(depths, values[numpy.newaxis], new_depths,
+                           degree=degree)[0]
+    elif values.shape[0] == 0:
+        return numpy.empty((0, len(new_depths)), dtype=numpy.float_)
+
+    if degree == 0:
+        return values[:, nearest_indices(depths, new_depths)]
+    elif degree == 1:
+        values = numpy.asarray(values, dtype=numpy.float_)
+        lower, weight = linear_weights(depths, new_depths)
+        return (1 - weight) * values[:, lower] \
+            + weight * values[:, lower + 1]
+    elif degree == 2 or degree % 2:
+        values = numpy.asarray(values, dtype=numpy.float_)
+        spline = make_interp_spline(depths, values, k=degree, axis=1)
+        return spline(new_depths)
+    else:
+        values = numpy.asarray(values, dtype=numpy.float_)
+        return numpy.vstack([
+            InterpolatedUnivariateSpline(depths, row, k=degree)(new_depths)
+            for row in values])
@@ -0,0 +1,294 @@
+""" file: segments.py (pysiss.borehole.analysis)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Thursday 22 January, 2015
+
+    description: Vectorized operations on sorted depth intervals and
+        contiguous runs of samples
+
+    Gaps, subdatasets and intervals are all sorted, non-overlapping
+    `(from, to)` depth pairs, so we can find which one contains each of a
+    set of depths with a single binary search. Likewise the samples in each
+    subdataset form a contiguous run of a sorted dataset, so statistics over
+    runs can be computed for every run (and every property) at once with
+    prefix sums and a single sort, rather than looping over the runs.
+"""
+
+import numpy
+
+
+def interval_index(from_depths, to_depths, depths, closed='both'):
+    """ Find the interval containing each depth
+
+        :param from_depths: The start of each interval, sorted
+        :type from_depths: `numpy.ndarray`
+        :param to_depths: The end of each interval. Intervals must not
+            overlap.
+        :type to_depths: `numpy.ndarray`
+        :param depths: The depths to look up
+        :type depths: `numpy.ndarray`
+        :param closed: 'both' if the intervals include both ends, or 'left'
+            if they include the start but not the end. Optional, defaults to
+            'both'.
+        :type closed: string
+        :returns: an integer array giving the index of the interval
+            containing each depth, or -1 for depths which aren't in any
+            interval.
+    """
+    from_depths = numpy.asarray(from_depths)
+    to_depths = numpy.asarray(to_depths)
+    depths = numpy.asarray(depths)
+    if len(from_depths) == 0:
+        return -numpy.ones(depths.shape, dtype=numpy.int_)
+    index = numpy.searchsorted(from_depths, depths, side='right') - 1
+    candidate = numpy.maximum(index, 0)
+    if closed == 'both':
+        inside = depths <= to_depths[candidate]
+    elif closed == 'left':
+        inside = depths < to_depths[candidate]
+    else:
+        raise ValueError(
+            "closed must be 'both' or 'left', not {0}".format(closed))
+    return numpy.where((index >= 0) & inside, index, -1)
+
+
+def range_reduce(values, starts, stops, method='mean'):
+    """ Reduce the values in each of a set of index ranges
+
+        The ranges may overlap. Ranges containing a NaN give NaN, and empty
+        ranges give NaN.
+
+        :param values: The values to reduce, one property per row
+        :type values: `numpy.ndarray` with shape `(nproperties, nsamples)`
+            or `(nsamples,)`
+        :param starts, stops: The start and (exclusive) stop index of each
+            range
+        :type starts, stops: integer `numpy.ndarray`s
+        :param method: 'mean' or 'median'
+        :type method: string
+        :returns: an array with shape `(nproperties, nranges)` (or
+            `(nranges,)` for one-dimensional values)
+    """
+    values = numpy.asarray(values, dtype=numpy.float_)
+    flat = values.ndim == 1
+    values = numpy.atleast_2d(values)
+    starts = numpy.asarray(starts, dtype=numpy.int_)
+    stops = numpy.asarray(stops, dtype=numpy.int_)
+    counts = stops - starts
+
+    if method == 'mean':
+        # Prefix sums of values and NaN counts, so a NaN only affects the
+        # ranges which contain it
+        isnan = numpy.isnan(values)
+        sums = _prefix_sum(numpy.where(isnan, 0, values))
+        nans = _prefix_sum(isnan)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            result = (sums[:, stops] - sums[:, starts]) / counts
+        result[(nans[:, stops] - nans[:, starts]) > 0] = numpy.nan
+
+    elif method == 'median':
+        result = _range_median(values, starts, stops)
+
+    else:
+        raise ValueError(
+            "Unknown reduction {0}, expected 'mean' or 'median'".format(
+                method))
+
+    result[:, counts <= 0] = numpy.nan
+    return result[0] if flat else result
+
+
+def _prefix_sum(values):
+    """ Return cumulative sums along each row, starting with zero
+    """
+    result = numpy.zeros((values.shape[0], values.shape[1] + 1))
+    numpy.cumsum(values, axis=1, out=result[:, 1:])
+    return result
+
+
+def _expand_ranges(starts, stops):
+    """ Return the indices in each range, concatenated, along with the range
+        each index belongs to and the offset of each range in the result.
+    """
+    counts = numpy.maximum(stops - starts, 0)
+    offsets = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    group = numpy.repeat(numpy.arange(len(counts)), counts)
+    index = numpy.arange(counts.sum()) - offsets[group] + starts[group]
+    return index, group, offsets
+
+
+def _range_median(values, starts, stops):
+    """ Compute the median of each range of each row with a single sort
+    """
+    nrows, nranges = values.shape[0], len(starts)
+    result = numpy.empty((nrows, nranges))
+    result.fill(numpy.nan)
+    index, group, offsets = _expand_ranges(starts, stops)
+    if len(index) == 0:
+        return result
+    counts = numpy.tile(stops - starts, (nrows, 1))
+    result[:] = _group_median(values[:, index], group, offsets, counts)
+
+    # Ranges with NaNs have NaN medians, as for numpy.median
+    nans = _prefix_sum(numpy.isnan(values))
+    result[(nans[:, stops] - nans[:, starts]) > 0] = numpy.nan
+    return result
+
+
+def _group_median(values, group, offsets, counts):
+    """ Compute the median of the first `counts` sorted values in each
+        group of each row, with a single sort
+
+        The values in each group must be contiguous, and NaNs sort to the
+        end of each group, so passing the number of non-NaN values as counts
+        ignores NaNs.
+    """
+    nrows, ngroups = values.shape[0], len(offsets)
+    result = numpy.empty((nrows, ngroups))
+    result.fill(numpy.nan)
+    if values.shape[1] == 0:
+        return result
+
+    # Sort the values within each (row, group) pair
+    keys = group + ngroups * numpy.arange(nrows)[:, numpy.newaxis]
+    order = numpy.lexsort((values.ravel(), keys.ravel()))
+    ordered = values.ravel()[order].reshape(values.shape)
+
+    # Pick out the middle of each group
+    row, nonempty = numpy.nonzero(counts > 0)
+    valid = counts[row, nonempty]
+    lower = offsets[nonempty] + (valid - 1) // 2
+    upper = offsets[nonempty] + valid // 2
+    result[row, nonempty] = \
+        (ordered[row, lower] + ordered[row, upper]) / 2.
+    return result
+
+
+SEGMENT_METHODS = ('count', 'sum', 'mean', 'median', 'min', 'max', 'std')
+
+
+def segment_reduce(values, starts, method='mean', ddof=0):
+    """ Reduce the values in each of a set of contiguous segments
+
+        The segments start at the given indices and run up to the start of
+        the next segment (or the end of the values), like the indices for
+        `numpy.ufunc.reduceat`. Sums, means, standard deviations and counts
+        use prefix sums, minima and maxima use `reduceat`, and medians sort
+        all the values once, so every segment and every property is reduced
+        at once.
+
+        NaNs are treated as missing values and ignored. Segments with no
+        (non-NaN) values give NaN, except for counts and sums which give
+        zero.
+
+        :param values: The values to reduce, one property per row
+        :type values: `numpy.ndarray` with shape `(nproperties, nsamples)`
+            or `(nsamples,)`
+        :param starts: The start index of each segment, in increasing order
+        :type starts: integer `numpy.ndarray`
+        :param method: One of 'count', 'sum', 'mean', 'median', 'min', 'max'
+            or 'std'. Optional, defaults to 'mean'.
+        :type method: string
+        :param ddof: The delta degrees of freedom for standard deviations.
+            Optional, defaults to 0 as for `numpy.std`.
+        :type ddof: int
+        :returns: an array with shape `(nproperties, nsegments)` (or
+            `(nsegments,)` for one-dimensional values)
+    """
+    if method not in SEGMENT_METHODS:
+        raise ValueError(
+            "Unknown reduction {0}, expected one of {1}".format(
+                method, ', '.join(SEGMENT_METHODS)))
+    values = numpy.asarray(values, dtype=numpy.float_)
+    flat = values.ndim == 1
+    values = numpy.atleast_2d(values)
+    nsamples = values.shape[1]
+    starts = numpy.asarray(starts, dtype=numpy.int_)
+    assert numpy.all(numpy.diff(starts) >= 0), \
+        "segment starts must be in increasing order"
+    stops = numpy.concatenate([starts[1:], [nsamples]])[:len(starts)]
+    first = starts[0] if len(starts) else nsamples
+    lengths = stops - starts
+    segment = numpy.repeat(numpy.arange(len(starts)), lengths)
+
+    # Everything is NaN-aware, so we need counts of the real values
+    isnan = numpy.isnan(values)
+    filled = numpy.where(isnan, 0, values)
+    valid = _prefix_sum(~isnan)
+    counts = valid[:, stops] - valid[:, starts]
+    sums = _prefix_sum(filled)
+    totals = sums[:, stops] - sums[:, starts]
+    empty = counts == 0
+
+    if method == 'count':
+        result = counts
+    elif method == 'sum':
+        result = totals
+    elif method in ('mean', 'std'):
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            result = totals / counts
+        if method == 'std':
+            # Sum the squared deviations from each segment's mean, which is
+            # more accurate than using the sum of the squared values
+            deviations = numpy.zeros_like(values)
+            deviations[:, first:] = filled[:, first:] - result[:, segment]
+            deviations[isnan] = 0
+            squares = _prefix_sum(deviations ** 2)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                result = numpy.sqrt(
+                    (squares[:, stops] - squares[:, starts])
+                    / (counts - ddof))
+            empty |= counts <= ddof
+    elif method in ('min', 'max'):
+        result = numpy.empty((values.shape[0], len(starts)))
+        result.fill(numpy.nan)
+        nonempty = numpy.flatnonzero(lengths > 0)
+        if len(nonempty):
+            # fmin and fmax skip NaNs. Empty segments have no effect on the
+            # ranges reduceat uses for the others, so we can leave them out.
+            ufunc = numpy.fmin if method == 'min' else numpy.fmax
+            result[:, nonempty] = ufunc.reduceat(
+                values, starts[nonempty], axis=1)
+    else:
+        result = _group_median(values[:, first:], segment, starts - first,
+                               counts.astype(numpy.int_))
+
+    if method not in ('count', 'sum'):
+        result[empty] = numpy.nan
+    return result[0] if flat else result
+
+
+def label_reduce(values, labels, method='mean', ddof=0):
+    """ Reduce the values with each label
+
+        This groups the samples by label (which needn't be contiguous) with
+        a single stable sort, then reduces each group with `segment_reduce`.
+
+        :param values: The values to reduce, one property per row
+        :type values: `numpy.ndarray` with shape `(nproperties, nsamples)`
+            or `(nsamples,)`
+        :param labels: The label for each sample
+        :type labels: `numpy.ndarray` with length nsamples
+        :param method: One of 'count', 'sum', 'mean', 'median', 'min', 'max'
+            or 'std'. Optional, defaults to 'mean'.
+        :type method: string
+        :param ddof: The delta degrees of freedom for standard deviations.
+            Optional, defaults to 0.
+        :type ddof: int
+        :returns: the sorted unique labels, and an array with shape
+            `(nproperties, nlabels)` (or `(nlabels,)` for one-dimensional
+            values) of the reduced values
+    """
+    values = numpy.asarray(values, dtype=numpy.float_)
+    labels = numpy.asarray(labels)
+    assert len(labels) == values.shape[-1], \
+        "there must be one label for each sample"
+    order = numpy.argsort(labels, kind='mergesort')
+    labels = labels[order]
+    if len(labels):
+        starts = numpy.flatnonzero(numpy.concatenate(
+            [[True], labels[1:] != labels[:-1]]))
+    else:
+        starts = numpy.array([], dtype=numpy.int_)
+    reduced = segment_reduce(values[..., order], starts, method, ddof=ddof)
+    return labels[starts], reduced
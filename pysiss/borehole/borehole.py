@@ -9,7 +9,10 @@
 from .details import Details, detail_type
 from .datasets import DataSet, PointDataSet, IntervalDataSet
 from .properties import Property
-from ..utilities import id_object
+from ..utilities import id_object, transform_coordinates, collar_position
+
+import multiprocessing
+import numpy
 
 
 class Borehole(id_object):
@@ -155,16 +158,101 @@ class Borehole(id_object):
         return self.add_dataset(PointDataSet(name=name,
                                              depths=depths))
 
-    def desurvey(self, depths, crs):
+    def add_survey(self, depths, azimuths, dips):
+        """ Add and return a Survey of the borehole path
+
+            :param depths: Survey station down-hole depths in metres from
+                collar
+            :type depths: iterable of numeric values
+            :param azimuths: Azimuth at each station in degrees clockwise
+                from north
+            :type azimuths: iterable of numeric values
+            :param dips: Dip at each station in degrees below horizontal
+            :type dips: iterable of numeric values
+            :returns: the new `pysiss.borehole.Survey` instance.
+        """
+        self.survey = Survey(depths, azimuths, dips)
+        return self.survey
+
+    def desurvey(self, depths, crs=None, method='minimum_curvature',
+                 collar_crs='EPSG:4326'):
         """ Return the depths as three-dimensional points in the given
             coordinate reference system
+
+            If the borehole doesn't have a survey it is assumed to be
+            vertical.
+
+            :param depths: Down-hole depths in metres from collar. If this is
+                a PointDataSet its depths are used, and if it is an
+                IntervalDataSet the from and to depths are both desurveyed.
+            :type depths: iterable of numeric values or a DataSet
+            :param crs: The coordinate reference system for the points, as an
+                EPSG code or srsName. This should be a projected system in
+                metres. Optional, if None the points are given as offsets in
+                metres from the collar.
+            :type crs: string or int
+            :param method: Either 'minimum_curvature' or 'tangential'
+            :type method: string
+            :param collar_crs: The reference system of the collar latitude
+                and longitude. Optional, defaults to 'EPSG:4326'.
+            :type collar_crs: string or int
+            :returns: an array with shape `(len(depths), 3)` of (easting,
+                northing, elevation) coordinates, or a tuple of two such
+                arrays for the from and to depths of an IntervalDataSet.
         """
-        raise NotImplementedError
+        collar = None
+        if crs is not None:
+            collar = self.collar_coordinates(crs, collar_crs)
+        return self._desurvey(depths, method, collar)
 
-    def add_merged_interval_dataset(self, name, source_name_a, source_name_b):
-        """ Add a new merged interval dataset from the two sources
+    def _desurvey(self, depths, method, collar):
+        """ Desurvey depths or a dataset, given the collar coordinates
         """
-        raise NotImplementedError
+        survey = self.survey or Survey([0], [0], [90])
+        if isinstance(depths, IntervalDataSet):
+            return (survey.desurvey(depths.from_depths, method, collar),
+                    survey.desurvey(depths.to_depths, method, collar))
+        elif isinstance(depths, PointDataSet):
+            depths = depths.depths
+        return survey.desurvey(depths, method, collar)
+
+    def collar_coordinates(self, crs, collar_crs='EPSG:4326'):
+        """ Return the (easting, northing, elevation) of the collar in the
+            given coordinate reference system
+
+            :param crs: The coordinate reference system, as an EPSG code or
+                srsName
+            :type crs: string or int
+            :param collar_crs: The reference system of the collar latitude
+                and longitude. Optional, defaults to 'EPSG:4326'.
+            :type collar_crs: string or int
+            :returns: a float array with three elements
+        """
+        if self.origin_position is None:
+            raise ValueError('Borehole {0} has no origin position'.format(
+                self.name))
+        return transform_coordinates(collar_position(self), collar_crs,
+                                     crs)[0]
+
+    def add_merged_interval_dataset(self, name, source_name_a, source_name_b,
+                                    *source_names):
+        """ Add and return a new IntervalDataSet merged from two or more
+            existing interval datasets
+
+            The merged dataset's intervals have the union of the boundaries
+            of the source datasets, and it has the properties of all the
+            sources. See `IntervalDataSet.merge` for details.
+
+            :param name: The identifier for the new IntervalDataSet
+            :type name: `string`
+            :param source_name_a, source_name_b, *source_names: The names of
+                the interval datasets to merge
+            :type source_name_a, source_name_b, *source_names: `string`
+            :returns: the new `pysiss.borehole.IntervalDataSet` instance.
+        """
+        sources = [self.interval_datasets[source_name] for source_name in
+                   (source_name_a, source_name_b) + source_names]
+        return self.add_dataset(IntervalDataSet.merge(name, sources))
 
     def add_detail(self, name, values, property_type=None):
         """ Add a detail to this borehole object.
@@ -236,10 +324,165 @@ class Survey(object):
 
         Used to convert a sequence of down-hole depths into a sequence of
         three-dimensional points in some coordinate reference system.
+
+        The path is defined by the azimuth and dip at a set of survey
+        stations. Between stations the path is either a circular arc
+        (minimum curvature) or a straight line in the direction measured at
+        the upper station (tangential). Above the first station and below
+        the last one the path is straight. The station positions are worked
+        out once for each method and cached, and then any number of depths
+        can be desurveyed with a single vectorized call.
+
+        :param depths: Survey station down-hole depths in metres from collar
+        :type depths: iterable of numeric values
+        :param azimuths: Azimuth at each station in degrees clockwise from
+            north
+        :type azimuths: iterable of numeric values
+        :param dips: Dip at each station in degrees below horizontal, so a
+            vertical hole has a dip of 90.
+        :type dips: iterable of numeric values
     """
 
-    def __init__(self):
-        raise NotImplementedError
+    methods = ('minimum_curvature', 'tangential')
+
+    def __init__(self, depths, azimuths, dips):
+        super(Survey, self).__init__()
+        depths = numpy.asarray(depths, dtype=numpy.float_)
+        azimuths = numpy.asarray(azimuths, dtype=numpy.float_)
+        dips = numpy.asarray(dips, dtype=numpy.float_)
+        if not (len(depths) == len(azimuths) == len(dips) > 0):
+            raise ValueError('Surveys need the same number of depths, '
+                             'azimuths and dips, and at least one station')
+        order = numpy.argsort(depths, kind='mergesort')
+        self.depths, self.azimuths, self.dips = \
+            depths[order], azimuths[order], dips[order]
+
+        # Segment lengths, with the segment below the last station going on
+        # forever
+        self._lengths = numpy.append(
+            numpy.diff(numpy.append(0, self.depths)), numpy.inf)
+        self._solutions = {}
+
+    def __len__(self):
+        return len(self.depths)
+
+    def __repr__(self):
+        info = 'Survey with {0} stations from {1} to {2} m'
+        return info.format(len(self), self.depths[0], self.depths[-1])
+
+    @property
+    def directions(self):
+        """ The unit vector along the borehole at each station, as (east,
+            north, down) components
+        """
+        azimuth = numpy.radians(self.azimuths)
+        inclination = numpy.radians(90 - self.dips)
+        return numpy.column_stack([
+            numpy.sin(inclination) * numpy.sin(azimuth),
+            numpy.sin(inclination) * numpy.cos(azimuth),
+            numpy.cos(inclination)])
+
+    def stations(self, method='minimum_curvature'):
+        """ Return the positions of the survey stations
+
+            :param method: Either 'minimum_curvature' or 'tangential'
+            :type method: string
+            :returns: an array with shape `(len(survey), 3)` of (east, north,
+                down) offsets from the collar in metres.
+        """
+        # The first position is the collar
+        return self._solve(method)[0][1:]
+
+    def desurvey(self, depths, method='minimum_curvature', collar=None):
+        """ Return the positions of a set of down-hole depths
+
+            :param depths: Down-hole depths in metres from collar
+            :type depths: iterable of numeric values
+            :param method: Either 'minimum_curvature' or 'tangential'
+            :type method: string
+            :param collar: The (easting, northing, elevation) of the collar.
+                Optional, if not given the points are offsets from the
+                collar.
+            :type collar: iterable of numeric values
+            :returns: an array with shape `(len(depths), 3)` of (easting,
+                northing, elevation) coordinates in metres. Elevations
+                decrease down the hole.
+        """
+        positions, tangent, normal, beta = self._solve(method)
+        depths = numpy.asarray(depths, dtype=numpy.float_).ravel()
+
+        # Find the segment for each depth: segment i starts at station i,
+        # and there is an extra segment from the collar to the first station
+        segment = numpy.searchsorted(self.depths, depths, side='right')
+        length = depths - numpy.append(0, self.depths)[segment]
+
+        # Walk along each segment's arc, or in a straight line
+        beta = beta[segment]
+        curved = beta > 1e-12
+        along = length.copy()
+        across = numpy.zeros_like(length)
+        angle = (length[curved] / self._lengths[segment[curved]]) \
+            * beta[curved]
+        radius = self._lengths[segment[curved]] / beta[curved]
+        along[curved] = radius * numpy.sin(angle)
+        across[curved] = radius * (1 - numpy.cos(angle))
+        points = positions[segment] \
+            + along[:, numpy.newaxis] * tangent[segment] \
+            + across[:, numpy.newaxis] * normal[segment]
+
+        # Convert from (east, north, down) offsets
+        points[:, 2] *= -1
+        if collar is not None:
+            points += numpy.asarray(collar, dtype=numpy.float_)
+        return points
+
+    def _solve(self, method):
+        """ Work out the station positions and the shape of each segment
+
+            Returns arrays with one entry per segment: the position at the
+            start of the segment, the unit tangent at the start, the unit
+            normal pointing towards the end direction within the plane of
+            the arc, and the angle turned through along the segment.
+            Segment 0 runs from the collar to the first station, and the
+            last segment extends from the last station to infinity.
+        """
+        try:
+            return self._solutions[method]
+        except KeyError:
+            if method not in self.methods:
+                raise ValueError(
+                    'Unknown desurvey method {0}. Allowed values are '
+                    '{1}'.format(method, self.methods))
+
+        directions = self.directions
+        tangent = numpy.vstack([directions[:1], directions])
+        normal = numpy.zeros_like(tangent)
+        beta = numpy.zeros(len(tangent))
+        if method == 'minimum_curvature':
+            # The dogleg angle between each pair of stations
+            cos_beta = numpy.clip(
+                (directions[:-1] * directions[1:]).sum(axis=1), -1, 1)
+            beta[1:-1] = numpy.arccos(cos_beta)
+            curved = numpy.flatnonzero(beta > 1e-12)
+            end = tangent[curved + 1]
+            normal[curved] = (end - cos_beta[curved - 1, numpy.newaxis]
+                              * tangent[curved]) \
+                / numpy.sin(beta[curved])[:, numpy.newaxis]
+
+        # Integrate along each segment to get the station positions
+        offsets = self._lengths[:-1, numpy.newaxis] * tangent[:-1]
+        curved = beta[:-1] > 1e-12
+        if curved.any():
+            radius = self._lengths[:-1][curved] / beta[:-1][curved]
+            offsets[curved] = \
+                (radius * numpy.sin(beta[:-1][curved]))[:, numpy.newaxis] \
+                * tangent[:-1][curved] \
+                + (radius * (1 - numpy.cos(beta[:-1][curved])))[
+                    :, numpy.newaxis] * normal[:-1][curved]
+        positions = numpy.vstack([numpy.zeros((1, 3)),
+                                  numpy.cumsum(offsets, axis=0)])
+        self._solutions[method] = positions, tangent, normal, beta
+        return self._solutions[method]
 
 
 class OriginPosition(id_object):
@@ -274,3 +517,99 @@ class BoreholeDetails(Details):
     """
 
     detail_type = detail_type('BoreholeDetail', 'name values property_type')
+
+
+def desurvey_boreholes(boreholes, dataset=None, crs=None,
+                       method='minimum_curvature', collar_crs='EPSG:4326'):
+    """ Desurvey the datasets of a collection of boreholes
+
+        The collars of all the boreholes are projected into `crs` with a
+        single coordinate transform, and each borehole's survey solution is
+        cached on the survey so that repeated calls are cheap.
+
+        :param boreholes: The boreholes to desurvey
+        :type boreholes: iterable of `pysiss.borehole.Borehole`s
+        :param dataset: The name of the dataset to desurvey in each
+            borehole. Boreholes without this dataset are skipped. Optional,
+            if None the survey stations are desurveyed.
+        :type dataset: string
+        :param crs: The coordinate reference system for the points, as an
+            EPSG code or srsName. Optional, if None the points are given as
+            offsets in metres from each collar.
+        :type crs: string or int
+        :param method: Either 'minimum_curvature' or 'tangential'
+        :type method: string
+        :param collar_crs: The reference system of the collar latitudes
+            and longitudes. Optional, defaults to 'EPSG:4326'.
+        :type collar_crs: string or int
+        :returns: a dict mapping borehole names to the output of
+            `Borehole.desurvey`
+    """
+    boreholes = list(boreholes)
+    collars = [None] * len(boreholes)
+    if crs is not None:
+        collars = transform_coordinates(
+            [collar_position(bh) for bh in boreholes], collar_crs, crs)
+
+    results = {}
+    for borehole, collar in zip(boreholes, collars):
+        if dataset is None:
+            depths = (borehole.survey or Survey([0], [0], [90])).depths
+        else:
+            depths = borehole.point_datasets.get(dataset)
+            if depths is None:
+                depths = borehole.interval_datasets.get(dataset)
+            if depths is None:
+                continue
+        results[borehole.name] = borehole._desurvey(depths, method, collar)
+    return results
+
+
+def composite_boreholes(boreholes, dataset, processes=None, **kwargs):
+    """ Composite an interval dataset in each of a collection of boreholes
+
+        The boreholes are split between a pool of worker processes. Each
+        dataset is composited with `IntervalDataSet.composite`.
+
+        Example usage:
+
+            composites = composite_boreholes(boreholes, 'assays', length=2.)
+
+        :param boreholes: The boreholes to composite
+        :type boreholes: iterable of `pysiss.borehole.Borehole`s
+        :param dataset: The name of the interval dataset to composite in each
+            borehole. Boreholes without this dataset are skipped.
+        :type dataset: string
+        :param processes: The number of processes to use. Optional, defaults
+            to the number of CPUs. If this is 1 then everything is done in
+            this process.
+        :type processes: int
+        :param kwargs: Arguments for `IntervalDataSet.composite`, such as
+            `length`, `domain` and `min_coverage`
+        :returns: a dict mapping borehole names to the composited
+            IntervalDataSets
+    """
+    tasks = [(borehole.name, borehole.interval_datasets[dataset], kwargs)
+             for borehole in boreholes
+             if dataset in borehole.interval_datasets]
+    processes = processes or multiprocessing.cpu_count()
+    if processes == 1 or len(tasks) < 2:
+        return dict(map(_composite_dataset, tasks))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = dict(pool.imap_unordered(
+            _composite_dataset, tasks,
+            chunksize=max(len(tasks) // (4 * processes), 1)))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def _composite_dataset(task):
+    """ Composite a dataset, for composite_boreholes
+    """
+    name, dataset, kwargs = task
+    return name, dataset.composite(**kwargs)
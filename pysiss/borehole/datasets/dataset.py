@@ -9,10 +9,14 @@
     or all the dataset data types; it should not be instantiated by users.
 """
 
-from ..properties import Property
+from ..properties import Property, PropertyBlock
 from ..details import Details, detail_type
+from ..analysis.segments import segment_reduce, label_reduce
 from ...utilities import id_object
 
+import numpy
+import pandas
+
 
 class DataSet(id_object):
 
@@ -27,6 +31,14 @@ class DataSet(id_object):
             subdatasets - a list of subdataset locations
             gaps - a list of gap locations
             details - the metadata associated with this dataset
+            block - the columnar PropertyBlock storing numeric property
+                values, or None if the dataset isn't using one.
+
+        By default each property stores its own values. Numeric properties
+        can optionally be stored in a single `PropertyBlock` instead (using
+        `add_properties` or `consolidate`), in which case the Property
+        values are views into one contiguous two-dimensional array, and
+        slicing, resampling and exporting work on all of them at once.
 
         :param name: an identifier for the dataset
         :type name: string
@@ -44,20 +56,189 @@ class DataSet(id_object):
         self.subdatasets = None
         self.gaps = None
         self.details = details
+        self.block = None
 
     def add_property(self, property_type, values):
         """ Add and return a new property
         """
         assert self.size == len(values), ("values must have the same number "
                                           "of elements as the dataset")
-        self.properties[property_type.name] = Property(property_type, values)
-        return self.properties[property_type.name]
+        name = property_type.name
+        if self.block is not None and name in self.block:
+            if property_type.isnumeric:
+                # Keep the values in the block
+                row = self.block.index[name]
+                self.block.property_types[row] = property_type
+                self.block.values[row] = values
+                self.properties[name] = self.block.get_property(name)
+                return self.properties[name]
+            else:
+                self._set_block(self.block.drop(name))
+        self.properties[name] = Property(property_type, values)
+        return self.properties[name]
+
+    def add_properties(self, property_types, values):
+        """ Add a set of numeric properties stored in a single PropertyBlock
+
+            The values are stored as one contiguous two-dimensional array,
+            and the Property instances for each property wrap views of the
+            rows of this array. If the dataset already has a block, the new
+            properties are added to it.
+
+            :param property_types: The property types for each property
+            :type property_types: list of pysiss.borehole.PropertyType
+            :param values: The values for each property, with shape
+                `(len(property_types), size)`.
+            :type values: `numpy.ndarray`
+            :returns: the `PropertyBlock` containing the values
+        """
+        values = numpy.asarray(values, dtype=numpy.float_)
+        assert values.ndim == 2 and values.shape[-1] == self.size, \
+            "values must have the same number of elements as the dataset"
+        if self.block is None:
+            block = PropertyBlock(property_types, values)
+        else:
+            block = self.block.extend(property_types, values)
+        self._set_block(block)
+        return self.block
+
+    def consolidate(self):
+        """ Move all numeric properties into a single PropertyBlock
+
+            This copies the values of each numeric property that isn't already
+            in the block into it. Afterwards the Property values are views
+            into the block.
+
+            :returns: the `PropertyBlock` containing the values
+        """
+        property_types, values = self.get_numeric_values()
+        self._set_block(PropertyBlock(property_types, values))
+        return self.block
+
+    def _set_block(self, block):
+        """ Store the given PropertyBlock and point the properties at it
+        """
+        self.block = block
+        for ptype, row in zip(block.property_types, block.values):
+            prop = self.properties.get(ptype.name)
+            if prop is not None and prop.property_type is ptype:
+                # Repoint existing Property instances so that references
+                # held elsewhere see the values in the block
+                prop.values = row
+            else:
+                self.properties[ptype.name] = Property(ptype, row)
 
     def get_property_names(self):
         """ Return the properties defined over this dataset
         """
         return self.properties.keys()
 
+    def get_numeric_values(self):
+        """ Return the values of all the numeric properties as a single
+            two-dimensional array.
+
+            Each row of the array contains the values for one property, so
+            the array has shape `(nproperties, size)`. This lets us operate
+            on all the properties in a dataset at once.
+
+            If all the numeric properties are stored in the dataset's
+            PropertyBlock, then the block's values are returned directly
+            without copying. Otherwise the values are stacked into a new
+            array.
+
+            :returns: a list of the `PropertyType`s of the numeric properties,
+                and a float `numpy.ndarray` of their values, in the same
+                order.
+        """
+        props = [p for p in self.properties.values()
+                 if p.property_type.isnumeric]
+        if self.block is not None and len(props) == len(self.block):
+            return list(self.block.property_types), self.block.values
+
+        # Block properties first, then everything else
+        if self.block is not None:
+            props = self.block.properties() + \
+                [p for p in props if p.name not in self.block]
+        values = numpy.empty((len(props), self.size), dtype=numpy.float_)
+        for row, prop in zip(values, props):
+            row[:] = prop.values
+        return [p.property_type for p in props], values
+
+    def summarize(self, method='mean', labels=None, ddof=0):
+        """ Reduce every numeric property over each subdataset, or over
+            each group of samples with the same label
+
+            All the properties and segments are reduced at once using
+            `pysiss.borehole.analysis.segment_reduce`, so this is fast even
+            for large datasets. NaNs are ignored.
+
+            :param method: One of 'count', 'sum', 'mean', 'median', 'min',
+                'max' or 'std'. Optional, defaults to 'mean'.
+            :type method: string
+            :param labels: The label for each sample (e.g. a lithology or
+                domain code), or the name of a property holding the labels.
+                Optional, defaults to None, in which case the dataset is
+                split into subdatasets with `split_at_gaps` (if it hasn't been
+                already) and each subdataset is reduced.
+            :type labels: string or `numpy.ndarray`
+            :param ddof: The delta degrees of freedom for standard
+                deviations. Optional, defaults to 0.
+            :type ddof: int
+            :returns: a `pandas.DataFrame` with a column for each numeric
+                property, indexed by the (from, to) depths of each
+                subdataset or by label.
+        """
+        property_types, values = self.get_numeric_values()
+        if labels is None:
+            if self.subdatasets is None:
+                self.split_at_gaps()
+            index = [tuple(s) for s in self.subdatasets]
+            reduced = segment_reduce(values, self._subdataset_starts(),
+                                     method, ddof=ddof)
+        else:
+            if isinstance(labels, basestring):
+                labels = self.properties[labels].values
+            assert len(labels) == self.size, \
+                "labels must have the same number of elements as the dataset"
+            index, reduced = label_reduce(values, labels, method, ddof=ddof)
+        return pandas.DataFrame(reduced.T, index=index,
+                                columns=[p.name for p in property_types])
+
+    def _subdataset_starts(self):
+        """ Return the index of the first sample in each subdataset
+        """
+        raise NotImplementedError
+
+    def _take_properties(self, dataset, indices):
+        """ Add the values of every property at the given indices to another
+            dataset.
+
+            Values in the PropertyBlock are taken in a single operation. If
+            `indices` is a slice then no values are copied.
+        """
+        if self.block is not None:
+            dataset._set_block(self.block.take(indices))
+        for prop in self.properties.values():
+            if self.block is None or prop.name not in self.block:
+                dataset.add_property(prop.property_type, prop.values[indices])
+
+    def _make_dataframe(self, index):
+        """ Make a Pandas dataframe with a column for each property
+        """
+        if self.block is None:
+            return pandas.DataFrame(
+                data=dict(((k, self.properties[k].values)
+                           for k in self.properties.keys())),
+                index=index)
+
+        # Transposing the block gives us a view with one column per property
+        dataframe = pandas.DataFrame(self.block.values.T, index=index,
+                                     columns=self.block.names)
+        for name, prop in self.properties.items():
+            if name not in self.block:
+                dataframe[name] = prop.values
+        return dataframe
+
     def to_dataframe(self):
         """ Tranform the data in the dataset into a Pandas dataframe.
         """
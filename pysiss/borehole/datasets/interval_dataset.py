@@ -19,6 +19,9 @@
 
 from .dataset import DataSet
 from .point_dataset import PointDataSet
+from ..analysis.segments import interval_index
+from ..analysis.composite import composite, composite_boundaries
+from ..properties import PropertyType, LazyProperty
 
 import numpy
 import pandas
@@ -71,6 +74,80 @@ class IntervalDataSet(DataSet):
         self.from_depths = from_depths
         self.to_depths = to_depths
 
+    @classmethod
+    def _from_sorted(cls, name, from_depths, to_depths, details=None):
+        """ Make a new IntervalDataSet from intervals which are already known
+            to be sorted and non-overlapping, without checking them again.
+        """
+        dataset = cls.__new__(cls)
+        DataSet.__init__(dataset, name, len(from_depths), details=details)
+        dataset.from_depths = from_depths
+        dataset.to_depths = to_depths
+        return dataset
+
+    @classmethod
+    def merge(cls, name, datasets):
+        """ Merge some IntervalDataSets into a new IntervalDataSet whose
+            intervals have the union of the boundaries of the sources
+
+            Each merged interval lies inside at most one interval of each
+            source, so the union of the boundaries is found with one sort,
+            and the source interval covering each merged interval with one
+            binary search per source. Parts of the borehole which aren't
+            covered by any source are left as gaps. Where only some of the
+            sources cover a merged interval, the properties from the other
+            sources are missing (NaN for numeric properties and None
+            otherwise).
+
+            The merged properties aren't copied: each one gathers the values
+            from its source property through an index map the first time
+            its values are used. The index maps are stored in the
+            `index_maps` attribute of the merged dataset, which maps each
+            source dataset name to an array giving the index of the source
+            interval for each merged interval (or -1 where the source has a
+            gap).
+
+            If more than one source has a property with the same name, the
+            later ones are renamed to '<dataset name>.<property name>'.
+
+            :param name: The identifier for the merged dataset
+            :type name: string
+            :param datasets: The datasets to merge
+            :type datasets: list of `IntervalDataSet`s
+            :returns: the new IntervalDataSet
+        """
+        assert len(datasets) > 0, "need at least one dataset to merge"
+        boundaries = numpy.unique(numpy.concatenate(
+            [numpy.concatenate([d.from_depths, d.to_depths])
+             for d in datasets]))
+
+        # Find the source interval covering the middle of each piece
+        # between boundaries, and drop the pieces no source covers
+        midpoints = (boundaries[:-1] + boundaries[1:]) / 2.
+        indices = numpy.array([
+            interval_index(d.from_depths, d.to_depths, midpoints)
+            for d in datasets]).reshape(len(datasets), len(midpoints))
+        covered = numpy.flatnonzero((indices >= 0).any(axis=0))
+        merged = cls._from_sorted(name, boundaries[covered],
+                                  boundaries[covered + 1])
+        merged.index_maps = {}
+
+        # Add properties which gather their values from the sources
+        for dataset, index in zip(datasets, indices[:, covered]):
+            merged.index_maps[dataset.name] = index
+            for prop in dataset.properties.values():
+                ptype = prop.property_type
+                if ptype.name in merged.properties:
+                    ptype = PropertyType(
+                        '{0}.{1}'.format(dataset.name, ptype.name),
+                        long_name=ptype._long_name,
+                        description=ptype.description, units=ptype.units,
+                        isnumeric=ptype.isnumeric,
+                        detection_limit=ptype.detection_limit)
+                merged.properties[ptype.name] = LazyProperty(
+                    ptype, _gatherer(prop, index))
+        return merged
+
     def __repr__(self):
         info = 'IntervalDataSet {0}: with {1} depth intervals and {2} '\
                'properties'
@@ -88,21 +165,52 @@ class IntervalDataSet(DataSet):
             dataset_name = '{0}: subdataset {1} to {2}'.format(
                 self.name, from_depth, to_depth)
 
-        # Select a data mask
-        indices = numpy.where(
-            numpy.logical_and(self.from_depths >= from_depth,
-                              self.to_depths <= to_depth))
+        # Select the intervals
+        window = self.get_interval_slice(from_depth, to_depth)
+        indices = numpy.arange(window.start, window.stop)
 
         # Generate a new IntervalDataSet
         newdom = IntervalDataSet(dataset_name,
                                  self.from_depths[indices],
                                  self.to_depths[indices])
-        for prop in self.properties.values():
-            newdom.add_property(
-                property_type=prop.property_type,
-                values=prop.values[indices])
+        self._take_properties(newdom, indices)
         return newdom
 
+    def window(self, from_depth, to_depth, dataset_name=None):
+        """ Return a view of the data between the given depths as a new
+            IntervalDataSet
+
+            Only intervals completely contained by the from_depth/to_depth
+            interval are returned. Unlike `get_interval`, the depths and
+            property values of the new dataset are views into this dataset's
+            arrays, so nothing is copied and the intervals are not
+            revalidated. Changes to the values in the window will show up in
+            this dataset too.
+        """
+        # Specify a name if not already passed
+        if dataset_name is None:
+            dataset_name = '{0}: subdataset {1} to {2}'.format(
+                self.name, from_depth, to_depth)
+
+        # Generate a new IntervalDataSet
+        window = self.get_interval_slice(from_depth, to_depth)
+        newdom = self._from_sorted(dataset_name,
+                                   self.from_depths[window],
+                                   self.to_depths[window])
+        self._take_properties(newdom, window)
+        return newdom
+
+    def get_interval_slice(self, from_depth, to_depth):
+        """ Returns a slice covering the intervals which are completely
+            contained by the given interval
+
+            The intervals are sorted and don't overlap, so we can find the
+            ends of the slice with a binary search.
+        """
+        start = numpy.searchsorted(self.from_depths, from_depth, side='left')
+        stop = numpy.searchsorted(self.to_depths, to_depth, side='right')
+        return slice(start, max(start, stop))
+
     def split_at_gaps(self):
         """ Split a dataset by finding significant gaps in the dataset.
 
@@ -119,23 +227,111 @@ class IntervalDataSet(DataSet):
         gap_indices = numpy.flatnonzero(
             self.from_depths[1:] - self.to_depths[:-1])
 
-        # Aggregate gap intervals
-        self.gaps = []
-        for idx in gap_indices:
-            self.gaps.append((self.to_depths[idx], self.from_depths[idx + 1]))
-
-        # We need to include the start and end of the dataset!
-        gap_indices = [0] + list(gap_indices) + [-1]
-
-        # Form a list of data subdatasets
-        self.subdatasets = []
-        for idx in range(len(gap_indices) - 1):
-            # DataSets start _after_ the gap & end with next gap
-            self.subdatasets.append((
-                self.from_depths[gap_indices[idx] + 1],
-                self.to_depths[gap_indices[idx + 1]]))
+        # Gaps run from the end of one interval to the start of the next
+        self.gaps = numpy.column_stack([self.to_depths[gap_indices],
+                                        self.from_depths[gap_indices + 1]])
+
+        # DataSets start _after_ each gap & end with the next gap, and we
+        # need to include the start and end of the dataset
+        starts = numpy.concatenate([[0], gap_indices + 1])
+        ends = numpy.concatenate([gap_indices, [len(self.from_depths) - 1]])
+        self.subdatasets = numpy.column_stack([self.from_depths[starts],
+                                               self.to_depths[ends]])
         return self.subdatasets, self.gaps
 
+    def composite(self, length=None, domain=None, boundaries=None,
+                  min_coverage=0.5, origin=0., name=None):
+        """ Composite the numeric properties to fixed-length intervals or
+            to domain boundaries, weighting each sample by its overlap with
+            each composite
+
+            All the numeric properties are composited at once (see
+            `pysiss.borehole.analysis.composite`), and are stored in a single
+            PropertyBlock in the new dataset. Non-numeric properties are
+            skipped, apart from the domain property.
+
+            Composites which don't overlap any samples (i.e. which lie in
+            gaps) are dropped. Composite values are NaN where less than
+            `min_coverage` of the composite has been sampled for that
+            property. The fraction of each composite covered by samples is
+            stored in the `coverage` attribute of the new dataset.
+
+            :param length: The length of each composite, in metres. Optional,
+                if None then each domain forms a single composite.
+            :type length: float
+            :param domain: The name of a property holding a domain code (e.g.
+                a lithology). Composites end wherever the code changes, and
+                the new dataset gets the domain code of each composite.
+                Optional, defaults to None.
+            :type domain: string
+            :param boundaries: Extra depths where composites must end.
+                Optional, defaults to None.
+            :type boundaries: iterable of numeric values
+            :param min_coverage: The minimum fraction of each composite which
+                must be sampled. Optional, defaults to 0.5.
+            :type min_coverage: float
+            :param origin: The depth which fixed-length composites are
+                aligned to. Optional, defaults to 0.
+            :type origin: float
+            :param name: The identifier for the new dataset. Optional,
+                defaults to "<current_name> composited".
+            :type name: string
+            :returns: the new IntervalDataSet
+        """
+        if length is None and domain is None and boundaries is None:
+            raise ValueError("One of length, domain or boundaries must be "
+                             "given to composite a dataset")
+        if name is None:
+            name = '{0} composited'.format(self.name)
+
+        # Work out where the composites have to end
+        breaks = []
+        if boundaries is not None:
+            breaks.append(numpy.asarray(boundaries, dtype=numpy.float_))
+        if domain is not None:
+            codes = self.properties[domain].values
+            if isinstance(codes, pandas.Categorical):
+                codes = codes.codes
+            codes = numpy.asarray(codes)
+            changes = numpy.flatnonzero(codes[1:] != codes[:-1]) + 1
+            breaks.append(self.from_depths[changes])
+        comp_from, comp_to = composite_boundaries(
+            self.from_depths[0], self.to_depths[-1], length,
+            numpy.concatenate(breaks) if breaks else None, origin)
+
+        property_types, values = self.get_numeric_values()
+        composited, coverage = composite(
+            self.from_depths, self.to_depths, values, comp_from, comp_to,
+            min_coverage)
+
+        # Drop composites in gaps
+        keep = numpy.flatnonzero(coverage > 0)
+        newdom = IntervalDataSet._from_sorted(name, comp_from[keep],
+                                              comp_to[keep])
+        newdom.coverage = coverage[keep]
+        if property_types:
+            newdom.add_properties(property_types, composited[:, keep])
+        if domain is not None:
+            # Composites don't cross domain boundaries, so the domain is the
+            # one at the start of each composite
+            prop = self.properties[domain]
+            index = interval_index(self.from_depths, self.to_depths,
+                                   newdom.from_depths, closed='left')
+            if (index < 0).any():
+                # Composites starting in a gap take the next domain
+                following = numpy.searchsorted(
+                    self.from_depths, newdom.from_depths, side='left')
+                index = numpy.where(index < 0, following, index)
+            newdom.add_property(prop.property_type,
+                                _take(prop.values, index))
+        return newdom
+
+    def _subdataset_starts(self):
+        """ Return the index of the first interval in each subdataset
+        """
+        return numpy.searchsorted(self.from_depths, self.subdatasets[:, 0],
+                                  side='left')
+
     def to_point_dataset(self, name=None, depths='midpoint'):
         """ Convert an IntervalDataSet to a PointDataSet
 
@@ -169,15 +365,104 @@ class IntervalDataSet(DataSet):
             raise ValueError(
                 'Unknown depth conversion method {0}'.format(depths))
 
-        # Generate new dataset
+        # Generate new dataset, with copies of the property values so that
+        # changing one dataset doesn't change the other
         sdom = PointDataSet(name=name, depths=depths)
-        sdom.properties = self.properties.copy()
+        self._gather_properties(sdom, numpy.arange(self.size))
         return sdom
 
+    def get_interval_index(self, depths):
+        """ Find the interval containing each of a set of depths
+
+            The intervals are sorted, so this is a single binary search.
+            Depths on the boundary between two intervals are taken to be in
+            the deeper interval.
+
+            :param depths: The depths to look up
+            :type depths: iterable of numeric values
+            :returns: an integer array giving the index of the interval
+                containing each depth, or -1 for depths in gaps or outside
+                the dataset.
+        """
+        return interval_index(self.from_depths, self.to_depths, depths)
+
+    def back_flag(self, dataset, properties=None):
+        """ Add the values of this dataset's properties at each depth of a
+            PointDataSet to that dataset
+
+            For example, to tag every spectral sample with the lithology of
+            the logged interval containing it:
+
+                logs.back_flag(spectra, properties=['lithology'])
+
+            The containing interval for every depth is found with one binary
+            search, and the numeric properties in the PropertyBlock are all
+            gathered in one operation. Depths which aren't in any interval
+            get missing values (NaN for numeric properties and None
+            otherwise).
+
+            :param dataset: The dataset to add the properties to
+            :type dataset: `pysiss.borehole.PointDataSet`
+            :param properties: The names of the properties to add. Optional,
+                defaults to all the properties of this dataset.
+            :type properties: list of strings
+            :returns: the index of the interval containing each depth of the
+                point dataset, or -1 for depths in gaps
+        """
+        index = self.get_interval_index(dataset.depths)
+        self._gather_properties(dataset, index, properties)
+        return index
+
+    def _gather_properties(self, dataset, index, names=None):
+        """ Add the values of the properties at the given interval indices to
+            another dataset, with missing values where the index is -1
+        """
+        if names is None:
+            names = self.properties.keys()
+        in_block = [n for n in names
+                    if self.block is not None and n in self.block]
+        if in_block:
+            rows = [self.block.index[n] for n in in_block]
+            values = self.block.values[numpy.ix_(rows, index)]
+            values[:, index < 0] = numpy.nan
+            dataset.add_properties(
+                [self.block.property_types[row] for row in rows], values)
+        for name in names:
+            if name not in in_block:
+                prop = self.properties[name]
+                dataset.add_property(prop.property_type,
+                                     _take(prop.values, index))
+
     def to_dataframe(self):
         """ Tranform the data in the dataset into a Pandas dataframe.
         """
-        return pandas.DataFrame(
-            data=dict(((k, self.properties[k].values)
-                       for k in self.properties.keys())),
+        return self._make_dataframe(
             index=zip(self.from_depths, self.to_depths))
+
+
+def _gatherer(prop, index):
+    """ Return a function which gathers the values of a property at the
+        given indices, with missing values where the index is -1
+    """
+    def _gather():
+        return _take(prop.values, index)
+    return _gather
+
+
+def _take(values, index):
+    """ Take values at the given indices, with missing values where the
+        index is -1
+    """
+    missing = index < 0
+    if isinstance(values, pandas.Categorical):
+        return values.take(index, allow_fill=True)
+    values = numpy.asarray(values)
+    if not missing.any():
+        return values[index]
+    if values.dtype.kind in 'biuf':
+        result = values.astype(numpy.float_)[index]
+        result[missing] = numpy.nan
+    else:
+        result = values.astype(object)[index]
+        result[missing] = None
+    return result
@@ -8,10 +8,10 @@
 """
 
 from .dataset import DataSet
+from ..analysis.interpolate import interpolate
+from ..analysis.segments import interval_index, range_reduce
 
 import numpy
-from scipy.interpolate import InterpolatedUnivariateSpline as Spline
-import pandas
 
 
 class PointDataSet(DataSet):
@@ -41,6 +41,16 @@ class PointDataSet(DataSet):
             "depths must be monotonically increasing"
         self.depths = depths
 
+    @classmethod
+    def _from_sorted(cls, name, depths, details=None):
+        """ Make a new PointDataSet from depths which are already known to
+            be monotonically increasing, without checking them again.
+        """
+        dataset = cls.__new__(cls)
+        DataSet.__init__(dataset, name, len(depths), details=details)
+        dataset.depths = depths
+        return dataset
+
     def __repr__(self):
         info = 'PointDataSet {0}: with {1} depths and {2} '\
                'properties'
@@ -58,16 +68,45 @@ class PointDataSet(DataSet):
         # Generate a new PointDataSet
         indices = self.get_interval_indices(from_depth, to_depth)
         newdom = PointDataSet(dataset_name, self.depths[indices])
-        for prop in self.properties.values():
-            newdom.add_property(prop.property_type, prop.values[indices])
+        self._take_properties(newdom, indices)
+        return newdom
+
+    def window(self, from_depth, to_depth, dataset_name=None):
+        """ Return a view of the data between the given depths as a new
+            PointDataSet
+
+            Unlike `get_interval`, the depths and property values of the new
+            dataset are views into this dataset's arrays, so nothing is
+            copied and the depths are not revalidated. This makes windowing
+            very cheap, but changes to the values in the window will show up
+            in this dataset too.
+        """
+        # Specify a name if not already passed
+        if dataset_name is None:
+            dataset_name = '{0}: subdataset {1} to {2}'.format(
+                self.name, from_depth, to_depth)
+
+        # Generate a new PointDataSet
+        window = self.get_interval_slice(from_depth, to_depth)
+        newdom = self._from_sorted(dataset_name, self.depths[window])
+        self._take_properties(newdom, window)
         return newdom
 
+    def get_interval_slice(self, from_depth, to_depth):
+        """ Returns a slice covering the depths in the given interval
+
+            The depths are sorted so we can find the ends of the slice with
+            a binary search.
+        """
+        return slice(
+            numpy.searchsorted(self.depths, from_depth, side='left'),
+            numpy.searchsorted(self.depths, to_depth, side='right'))
+
     def get_interval_indices(self, from_depth, to_depth):
         """ Returns the indices for the depths in the given interval
         """
-        return numpy.where(
-            numpy.logical_and(self.depths >= from_depth,
-                              self.depths <= to_depth))[0]
+        window = self.get_interval_slice(from_depth, to_depth)
+        return numpy.arange(window.start, window.stop)
 
     def split_at_gaps(self, gap_metric='spacing_median', threshold=10):
         """ Split a dataset by finding significant gaps in the dataset.
@@ -82,42 +121,40 @@ class PointDataSet(DataSet):
                     samples which is an order of magnitude above the median
                     sample spacing in a dataset.
         """
-        # We need to add a small amount to the dataset so that the interval
-        # picker works well in the case of subdatasets with only one value
-        epsilon = 1e-10
-        jitter = lambda a, b: (a - epsilon, b + epsilon)
-
         # Select gap metric to use, generate gap locations
         depths = self.depths
         spacing = numpy.diff(depths)
-        if gap_metric is 'spacing_median':
+        if gap_metric == 'spacing_median':
             med_spacing = numpy.median(spacing)
             gap_indices = numpy.flatnonzero(spacing > threshold * med_spacing)
         else:
             raise NotImplementedError(
                 "Unknown gap metric {0}".format(gap_metric))
 
-        # Aggregate gap intervals
-        self.gaps = []
-        for idx in gap_indices:
-            self.gaps.append((depths[idx], depths[idx + 1]))
-
-        # We need to include the start and end of the dataset!
-        gap_indices = [0] + list(gap_indices) + [-1]
-
-        # Form a list of data subdatasets
-        self.subdatasets = []
-        for idx in range(len(gap_indices) - 1):
-            # DataSets start _after_ the gap & end with next gap
-            from_depth = depths[gap_indices[idx] + 1]
-            to_depth = depths[gap_indices[idx + 1]]
-
-            # Check whether we need to jitter
-            if gap_indices[idx] + 1 == gap_indices[idx + 1]:
-                from_depth, to_depth = jitter(from_depth, to_depth)
-            self.subdatasets.append((from_depth, to_depth))
+        # Gaps run between the samples either side of each big spacing
+        self.gaps = numpy.column_stack([depths[gap_indices],
+                                        depths[gap_indices + 1]])
+
+        # DataSets start _after_ each gap & end with the next gap, and we
+        # need to include the start and end of the dataset
+        starts = numpy.concatenate([[0], gap_indices + 1])
+        ends = numpy.concatenate([gap_indices, [len(depths) - 1]])
+        self.subdatasets = numpy.column_stack([depths[starts], depths[ends]])
+
+        # We need to add a small amount to subdatasets with only one value
+        # so that the interval picker works well
+        epsilon = 1e-10
+        single = starts == ends
+        self.subdatasets[single, 0] -= epsilon
+        self.subdatasets[single, 1] += epsilon
         return self.subdatasets, self.gaps
 
+    def _subdataset_starts(self):
+        """ Return the index of the first sample in each subdataset
+        """
+        return numpy.searchsorted(self.depths, self.subdatasets[:, 0],
+                                  side='left')
+
     def regularize(self, npoints=None, dataset_name=None, fill_method='median',
                    degree=0):
         """ Resample dataset onto regular grid.
@@ -133,112 +170,26 @@ class PointDataSet(DataSet):
                 dataset_name - the name for the returned PointDataSet.
                     Optional, defaults to "<current_name> resampled".
                 fill_method - the method for filling the gaps. 'interpolate'
-                    uses the interpolated spline, 'mean' fills gaps with the
-                    mean value for the borehole.
+                    uses the interpolated spline, 'mean' and 'median' fill
+                    gaps with the mean or median value for the borehole,
+                    and 'local mean' and 'local median' use the values in
+                    the subdatasets either side of each gap.
                 degree - the degree of the interpolation. Optional, defaults
                     to 1 (i.e. linear interpolation). Values > 0 denote
                     polynomial interpolation, a value of 0 uses nearest-
                     neighbour interpolation.
         """
-        # We need to identify gaps first
-        if self.gaps is None:
-            print ("Warning - your dataset hasn't been analysed for gaps yet. "
-                   "I'm going to assume you just want to use the default "
-                   "values")
-            self.split_at_gaps()
-
-       # Specify name & number of points if not already passed
+        # Specify name & number of points if not already passed
         if dataset_name is None:
             dataset_name = '{0} resampled'.format(self.name)
         if npoints is None:
             spacing = float(numpy.median(numpy.diff(self.depths)))
-            npoints = abs(self.depths[-1] - self.depths[0]) / spacing
+            npoints = int(abs(self.depths[-1] - self.depths[0]) / spacing)
 
-        # Generate a new DataSet with the resampled data
+        # Generate the new depths and resample onto them
         new_depths = numpy.linspace(self.depths[0], self.depths[-1], npoints)
-        newdom = PointDataSet(dataset_name, new_depths)
-
-        # If we're doing nearest neighbours then we only need to work out the
-        # interpolation once
-        if degree == 0:
-            # This line generates a set of indices which will reconstruct a
-            # new signal using nearest neighbours, just do:
-            # property.values[interp_indices]
-            interp_indices = numpy.argmin(
-                numpy.asarray([
-                    (self.depths - new_depths[:, numpy.newaxis]) ** 2]),
-                axis=-1)[0]
-
-        # Get gap indices etc and store for faster lookup
-        if fill_method in ['mean', 'median', 'local mean', 'local median']:
-            # These methods need gap indices
-            gap_idxs = [newdom.get_interval_indices(*gap) for gap in self.gaps]
-        if fill_method in ['local mean', 'local median']:
-            # These methods need subdataset indices from the old dataset
-            sdom_idxs = [self.get_interval_indices(*sdom)
-                         for sdom in self.subdatasets]
-
-        # Resample properties
-        for prop in self.properties.values():
-            if prop.property_type.isnumeric is False:
-                # We can't interpolate non-numeric data
-                print ("Property {0} in dataset {1} is not numeric so I'm "
-                       "skipping it. If this is a suprise to you, maybe you "
-                       "should check whether you've correctly set the "
-                       "is_numeric flag in the PropertyType class for this "
-                       "property."
-                       ).format(prop.property_type.name, self.name)
-                continue
-
-            # Generate spline fit if required, else use nearest-neighbours
-            if degree == 0:
-                new_values = prop.values[interp_indices]
-            else:
-                spl = Spline(self.depths, prop.values, k=degree)
-                new_values = spl(new_depths)
-
-            # Deal with gaps
-            if fill_method == 'interpolate':
-                # We've already generated an interpolated value, so move on
-                # This option is here for error checking purposes
-                pass
-
-            elif fill_method == 'mean':
-                # Mean value in gaps, poly interp otherwise
-                meanval = prop.values.mean()
-                for gidx in gap_idxs:
-                    new_values[gidx] = meanval
-
-            elif fill_method == 'median':
-                # Median value in gaps
-                medval = numpy.median(prop.values)
-                for gidx in gap_idxs:
-                    new_values[gidx] = medval
-
-            elif fill_method == 'local mean':
-                # local mean value in gaps
-                smeans = [prop.values[s].mean() for s in sdom_idxs]
-                for sma, gidx, smb in zip(smeans[:-1], gap_idxs, smeans[1:]):
-                    new_values[gidx] = (sma + smb) / 2.
-
-            elif fill_method == 'local median':
-                # local median value in gaps
-                gap_neighbours = zip(sdom_idxs[:-1], gap_idxs, sdom_idxs[1:])
-                for sidxa, gidx, sidxb in gap_neighbours:
-                    new_values[gidx] = numpy.median(numpy.concatenate(
-                        prop.values[sidxa],
-                        prop.values[sidxb]))
-
-            else:
-                raise NotImplementedError
-
-            # Push back to new dataset
-            newdom.add_property(prop.property_type, new_values)
-
-        # Copy over gaps and subdatasets
-        newdom.gaps = self.gaps
-        newdom.subdatasets = self.subdatasets
-        return newdom
+        return self.resample(new_depths, dataset_name=dataset_name,
+                             fill_method=fill_method, degree=degree)
 
     def resample(self, new_depths, dataset_name=None, fill_method='median',
                  degree=0):
@@ -251,8 +202,10 @@ class PointDataSet(DataSet):
                 dataset_name - the name for the returned PointDataSet.
                     Optional, defaults to "<current_name> resampled".
                 fill_method - the method for filling the gaps. 'interpolate'
-                    uses the interpolated spline, 'mean' fills gaps with the
-                    mean value for the borehole.
+                    uses the interpolated spline, 'mean' and 'median' fill
+                    gaps with the mean or median value for the borehole,
+                    and 'local mean' and 'local median' use the values in
+                    the subdatasets either side of each gap.
                 degree - the degree of the interpolation. Optional, defaults
                     to 1 (i.e. linear interpolation). Values > 0 denote
                     polynomial interpolation, a value of 0 uses nearest-
@@ -270,94 +223,95 @@ class PointDataSet(DataSet):
             dataset_name = '{0} resampled'.format(self.name)
 
         # Generate a new DataSet with the resampled data
+        new_depths = numpy.asarray(new_depths)
         newdom = PointDataSet(dataset_name, new_depths)
 
-        # If we're doing nearest neighbours then we only need to work out the
-        # interpolation once
-        if degree == 0:
-            # This line generates a set of indices which will reconstruct a
-            # new signal using nearest neighbours, just do:
-            # property.values[interp_indices]
-            interp_indices = numpy.argmin(
-                numpy.asarray([
-                    (self.depths - new_depths[:, numpy.newaxis]) ** 2]),
-                axis=-1)[0]
-
-        # Get gap indices etc and store for faster lookup
-        if fill_method in ['mean', 'median', 'local mean', 'local median']:
-            # These methods need gap indices
-            gap_idxs = [newdom.get_interval_indices(*gap) for gap in self.gaps]
-        if fill_method in ['local mean', 'local median']:
-            # These methods need subdataset indices from the old dataset
-            sdom_idxs = [self.get_interval_indices(*sdom)
-                         for sdom in self.subdatasets]
-
-        # Resample properties
+        # We can't interpolate non-numeric data
         for prop in self.properties.values():
             if prop.property_type.isnumeric is False:
-                # We can't interpolate non-numeric data
                 print ("Property {0} in dataset {1} is not numeric so I'm "
                        "skipping it. If this is a suprise to you, maybe you "
                        "should check whether you've correctly set the "
                        "is_numeric flag in the PropertyType class for this "
                        "property."
                        ).format(prop.property_type.name, self.name)
-                continue
 
-            # Generate spline fit if required, else use nearest-neighbours
-            if degree == 0:
-                new_values = prop.values[interp_indices]
-            else:
-                spl = Spline(self.depths, prop.values, k=degree)
-                new_values = spl(new_depths)
-
-            # Deal with gaps
-            if fill_method == 'interpolate':
-                # We've already generated an interpolated value, so move on
-                # This option is here for error checking purposes
-                pass
-
-            elif fill_method == 'mean':
-                # Mean value in gaps, poly interp otherwise
-                meanval = prop.values.mean()
-                for gidx in gap_idxs:
-                    new_values[gidx] = meanval
-
-            elif fill_method == 'median':
-                # Median value in gaps
-                medval = numpy.median(prop.values)
-                for gidx in gap_idxs:
-                    new_values[gidx] = medval
-
-            elif fill_method == 'local mean':
-                # local mean value in gaps
-                smeans = [prop.values[s].mean() for s in sdom_idxs]
-                for sma, gidx, smb in zip(smeans[:-1], gap_idxs, smeans[1:]):
-                    new_values[gidx] = (sma + smb) / 2.
-
-            elif fill_method == 'local median':
-                # local median value in gaps
-                gap_neighbours = zip(sdom_idxs[:-1], gap_idxs, sdom_idxs[1:])
-                for sidxa, gidx, sidxb in gap_neighbours:
-                    new_values[gidx] = numpy.median(numpy.concatenate(
-                        prop.values[sidxa],
-                        prop.values[sidxb]))
-
-            else:
-                raise NotImplementedError
+        # Resample all the numeric properties at once - each row in the
+        # block of values is a property
+        property_types, values = self.get_numeric_values()
+        new_block = interpolate(self.depths, values, new_depths,
+                                degree=degree)
+        if fill_method not in ('interpolate', 'mean', 'median',
+                               'local mean', 'local median'):
+            raise NotImplementedError(
+                "Unknown fill method {0}".format(fill_method))
+        if fill_method != 'interpolate' and len(self.gaps) > 0:
+            self._fill_gaps(values, new_depths, new_block, fill_method)
 
-            # Push back to new dataset
-            newdom.add_property(prop.property_type, new_values)
+        # Push back to new dataset - the resampled values are already in a
+        # single block
+        if property_types:
+            newdom.add_properties(property_types, new_block)
 
         # Copy over gaps and subdatasets
         newdom.gaps = self.gaps
         newdom.subdatasets = self.subdatasets
         return newdom
 
+    def _fill_gaps(self, values, new_depths, new_values, fill_method):
+        """ Replace the resampled values which fall in gaps
+
+            Each new depth is labelled with the gap containing it in one
+            binary search, and the fill values for every gap and property
+            are worked out at once.
+
+            :param values: The original property values, one row per property
+            :type values: `numpy.ndarray`
+            :param new_depths: The resampled depths
+            :type new_depths: `numpy.ndarray`
+            :param new_values: The resampled property values, which are
+                updated in place
+            :type new_values: `numpy.ndarray`
+            :param fill_method: 'mean', 'median', 'local mean' or
+                'local median'
+            :type fill_method: string
+        """
+        gaps = numpy.asarray(self.gaps, dtype=numpy.float_).reshape(-1, 2)
+        gap = interval_index(gaps[:, 0], gaps[:, 1], new_depths)
+        in_gap = gap >= 0
+        if not in_gap.any() or len(values) == 0:
+            return
+
+        if fill_method == 'mean':
+            # Mean value in gaps, poly interp otherwise
+            new_values[:, in_gap] = values.mean(axis=1)[:, numpy.newaxis]
+
+        elif fill_method == 'median':
+            # Median value in gaps
+            new_values[:, in_gap] = \
+                numpy.median(values, axis=1)[:, numpy.newaxis]
+
+        else:
+            # The samples after gap i start at the first depth past the end
+            # of the gap, so the samples on either side of gap i run from
+            # the start of segment i to the end of segment i + 1
+            boundaries = numpy.searchsorted(self.depths, gaps[:, 1],
+                                            side='left')
+            starts = numpy.concatenate([[0], boundaries[:-1]])
+            stops = numpy.concatenate([boundaries[1:], [len(self.depths)]])
+
+            if fill_method == 'local mean':
+                # Average of the means of the segments either side
+                means = range_reduce(
+                    values, numpy.append(starts, boundaries[-1]),
+                    numpy.append(boundaries, len(self.depths)), 'mean')
+                fill = (means[:, :-1] + means[:, 1:]) / 2.
+            else:
+                # Median of the samples either side
+                fill = range_reduce(values, starts, stops, 'median')
+            new_values[:, in_gap] = fill[:, gap[in_gap]]
+
     def to_dataframe(self):
         """ Tranform the data in the dataset into a Pandas dataframe.
         """
-        return pandas.DataFrame(
-            data=dict(((k, self.properties[k].values)
-                       for k in self.properties.keys())),
-            index=self.depths)
+        return self._make_dataframe(index=self.depths)
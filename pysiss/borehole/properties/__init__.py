@@ -6,5 +6,6 @@
     description: Imports for pysiss.borehole.properties
 """
 
-from .property import Property
-from .property_type import PropertyType
\ No newline at end of file
+from .property import Property, LazyProperty
+from .property_type import PropertyType
+from .property_block import PropertyBlock
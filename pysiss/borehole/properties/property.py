@@ -39,3 +39,44 @@ class Property(object):
         """ Return a copy of the Property instance
         """
         return Property(self.property_type, self.values[:])
+
+
+class LazyProperty(Property):
+
+    """ A Property whose values are loaded the first time they are used
+
+        :param property_type: The property metadata for the property
+        :type property_type: pysiss.borehole.properties.property_type
+        :param loader: A function which returns the values
+        :type loader: callable
+    """
+
+    def __init__(self, property_type, loader):
+        self.property_type = property_type
+        self._loader = loader
+        self._values = None
+
+    def __reduce__(self):
+        # Pickle as a plain Property, so that the loader doesn't need to be
+        # pickled
+        return (Property, (self.property_type, self.values))
+
+    @property
+    def loaded(self):
+        """ Whether the values have been loaded yet
+        """
+        return self._loader is None
+
+    @property
+    def values(self):
+        """ The property values, loaded when first needed
+        """
+        if self._loader is not None:
+            self._values = self._loader()
+            self._loader = None
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        self._values = values
+        self._loader = None
@@ -0,0 +1,102 @@
+""" file: property_block.py (pysiss.borehole.properties)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Friday 16 January, 2015
+
+    description: Columnar storage for numeric properties
+"""
+
+from .property import Property
+
+import numpy
+
+
+class PropertyBlock(object):
+
+    """ Contiguous storage for the values of a set of numeric properties.
+
+        All the values live in a single two-dimensional float array with one
+        row per property, plus an index mapping each property name to its
+        row. The `Property` instances handed out by the block wrap views
+        into the rows of this array, so no values are copied, and operations
+        on every property (slicing, resampling etc) can be done on the whole
+        array at once.
+
+        :param property_types: The property metadata for each row
+        :type property_types: list of pysiss.borehole.PropertyType
+        :param values: The values for each property, with shape
+            `(len(property_types), size)`. This is not copied if it is
+            already a float array.
+        :type values: `numpy.ndarray`
+    """
+
+    def __init__(self, property_types, values):
+        values = numpy.asarray(values, dtype=numpy.float_)
+        if values.ndim != 2 or values.shape[0] != len(property_types):
+            raise ValueError("Values must have one row per property type "
+                             "(got shape {0} for {1} property types)".format(
+                                 values.shape, len(property_types)))
+        self.property_types = list(property_types)
+        self.values = values
+        self.index = dict((ptype.name, row)
+                          for row, ptype in enumerate(self.property_types))
+
+    def __repr__(self):
+        info = 'PropertyBlock: {0} properties with {1} values'
+        return info.format(*self.values.shape)
+
+    def __len__(self):
+        return len(self.property_types)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    @property
+    def names(self):
+        """ Returns the names of the properties in the block, in row order
+        """
+        return [ptype.name for ptype in self.property_types]
+
+    def get_property(self, name):
+        """ Return a Property wrapping a view of the values of the named
+            property
+        """
+        row = self.index[name]
+        return Property(self.property_types[row], self.values[row])
+
+    def properties(self):
+        """ Return a list of Property instances wrapping views of each row
+        """
+        return [Property(ptype, row)
+                for ptype, row in zip(self.property_types, self.values)]
+
+    def take(self, indices):
+        """ Return a new PropertyBlock containing the values at the given
+            indices.
+
+            If `indices` is a slice then the new block is a view into this
+            one, otherwise the values are copied.
+        """
+        return PropertyBlock(self.property_types, self.values[:, indices])
+
+    def extend(self, property_types, values):
+        """ Return a new PropertyBlock with the given properties added on
+            to the end of this one.
+
+            Any existing rows with the same names are replaced.
+        """
+        values = numpy.atleast_2d(numpy.asarray(values, dtype=numpy.float_))
+        replaced = set(ptype.name for ptype in property_types)
+        keep = [row for row, ptype in enumerate(self.property_types)
+                if ptype.name not in replaced]
+        return PropertyBlock(
+            [self.property_types[row] for row in keep] + list(property_types),
+            numpy.vstack([self.values[keep], values]))
+
+    def drop(self, name):
+        """ Return a new PropertyBlock without the named property
+        """
+        keep = [row for row, ptype in enumerate(self.property_types)
+                if ptype.name != name]
+        return PropertyBlock([self.property_types[row] for row in keep],
+                             self.values[keep])
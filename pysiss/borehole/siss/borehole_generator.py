@@ -5,21 +5,21 @@
 
     description: Borehole object creation from SISS GeoSciML metadata.
 
-Notes: 
-o If the expectation is that only one borehole element should be 
-  found, should we raise an exception if there is more than one?
-  Or, should we check that the name is the same as the borehole's 
-  identifier? Since the caller can currently pass whatever name 
-  he/she desires, that test may fail.
+Notes:
+o Documents are parsed incrementally, so a single WFS response containing
+  many Borehole elements can be turned into Borehole objects with
+  `iter_boreholes` without holding the whole document in memory.
+o When only one borehole is expected (`geosciml_to_borehole`), the first
+  Borehole element is used and given the name passed by the caller.
 """
 
 import re
-import xml.etree.ElementTree
+from lxml import etree
 from datetime import datetime
-from pint import UnitRegistry
 
 from ..properties import PropertyType
 from ..borehole import Borehole, OriginPosition
+from ...utilities import get_unit_registry, parse_units
 
 # General namespace URIs for GeoSciML
 NS = {'gsml': 'urn:cgi:xmlns:CGI:GeoSciML:2.0',
@@ -33,7 +33,63 @@ GML_NS = {'gsml': 'http://www.opengis.net/gml',
 # GeoSciML version dependent shape namespace URIs
 SHAPE_NS = {'gsml': 'http://www.opengis.net/sampling/1.0',
             'gsmlbh': 'http://www.opengis.net/samplingSpatial/2.0'}
-              
+
+# XPath expressions for the borehole details in each GeoSciML version. The
+# prefixes bh, gml and sa map to the version dependent namespaces above.
+XPATHS = {
+    'gsml': {
+        'latlon': './/bh:location/gml:Point/gml:pos/text()',
+        'elevation': './/bh:elevation[@uomLabels]',
+        'elevation_axis': './/bh:elevation/@axisLabels',
+        'details': './/bh:BoreholeDetails',
+        'driller': './/bh:driller/@xlink:title',
+        'drilling_method': './/bh:drillingMethod/text()',
+        'date_of_drilling': './/bh:dateOfDrilling/text()',
+        'start_point': './/bh:startPoint/text()',
+        'inclination_type': './/bh:inclinationType/text()',
+        'shape': './/sa:shape/gml:LineString/gml:posList/text()',
+        'cored_interval': './/bh:coredInterval/gml:Envelope[@uomLabels]',
+        'lower_corner': './/gml:lowerCorner/text()',
+        'upper_corner': './/gml:upperCorner/text()'
+    },
+    'gsmlbh': {
+        'latlon': './/bh:location/gml:Point/gml:pos/text()',
+        'location_description':
+            './/bh:location/gml:Point/gml:description/text()',
+        'elevation': './/bh:elevation[@uomLabels]',
+        'details': './/bh:BoreholeDetails',
+        'driller': './/bh:driller/@xlink:title',
+        'drilling_method': ('.//bh:downholeDrillingDetails'
+                            '/bh:DrillingDetails/bh:drillingMethod'
+                            '/@xlink:title'),
+        'date_of_drilling': ('.//bh:dateOfDrilling/gml:TimePeriod'
+                             '/gml:begin/gml:TimeInstant'
+                             '/gml:timePosition/text()'),
+        'start_point': './/bh:startPoint/@xlink:title',
+        'inclination_type': './/bh:inclinationType/@xlink:title',
+        'shape': ('.//sa:shape/gml:CompositeCurve/gml:curveMember'
+                  '/gml:LineString/gml:posList/text()'),
+        'cored_interval': ('.//bh:downholeDrillingDetails'
+                           '/bh:DrillingDetails/bh:interval'
+                           '/gml:LineString/gml:posList/text()')
+    }
+}
+
+
+def _compile_xpaths(ns_key):
+    """Compile the XPath expressions for a GeoSciML version
+
+    :param ns_key: The GeoSciML version, either 'gsml' or 'gsmlbh'
+    :type ns_key: string
+    :returns: a dictionary of `lxml.etree.XPath` instances keyed by detail
+    """
+    namespaces = {'bh': NS[ns_key], 'gml': GML_NS[ns_key],
+                  'sa': SHAPE_NS[ns_key], 'xlink': NS['xlink']}
+    return dict((detail, etree.XPath(path, namespaces=namespaces,
+                                     smart_strings=False))
+                for detail, path in XPATHS[ns_key].items())
+
+
 class SISSBoreholeGenerator:
 
     """ Spatial Information Services Stack borehole generator class.
@@ -43,26 +99,30 @@ class SISSBoreholeGenerator:
 
             xmlns:gsml => urn:cgi:xmlns:CGI:GeoSciML:2.0
             xmlns:gsmlbh => http://xmlns.geosciml.org/Borehole/3.0
-            
+
         Borehole details that are in common across GeoSciML 2.0 and 3.0
         are extracted.
+
+        The generator doesn't keep any state between documents, so one
+        instance can be used to generate any number of boreholes.
     """
 
+    # XPath expressions are compiled once for each GeoSciML version
+    xpaths = dict((ns_key, _compile_xpaths(ns_key))
+                  for ns_key in ('gsml', 'gsmlbh'))
+
     def __init__(self):
         """ Construct a SISS borehole generator instance.
         """
-        self.unit_reg = UnitRegistry() 
-
-        self.ns_key = None
+        # All generators share one unit registry
+        self.unit_reg = get_unit_registry()
 
         self.geosciml_handlers = {}
         self.geosciml_handlers['gsml'] = self._add_gsml_borehole_details
         self.geosciml_handlers['gsmlbh'] = self._add_gsmlbh_borehole_details
 
         self.whitespace_pattern = re.compile(r'\s+')
-                
-        self.borehole = None
-    
+
     def geosciml_to_borehole(self, name, geo_source):
         """ Given a GeoSciML scanned borehole URL, return a Borehole object
             initialised with origin position and borehole details. In the case
@@ -75,72 +135,104 @@ class SISSBoreholeGenerator:
                 scanned borehole URL
             :type geo_source: file-like object
             :returns: a Borehole object initialised with origin position and
-                borehole details
+                borehole details, or None if there are no Borehole elements
         """
         if geo_source is not None:
-            geo_tree = xml.etree.ElementTree.parse(geo_source)
-            borehole_elts = self._get_borehole_elts(geo_tree)
+            for borehole_elt, ns_key in _iter_borehole_elts(geo_source):
+                return self._make_borehole(name, borehole_elt, ns_key)
+        return None
+
+    def iter_boreholes(self, geo_source):
+        """ Generate a Borehole object for every Borehole element in a
+            GeoSciML document, e.g. a multi-feature WFS GetFeature response.
 
-            if len(borehole_elts) != 0:
-                self.borehole = Borehole(name=name,
-                            origin_position=self._location(borehole_elts[0]))
-    
-                self._add_borehole_details(borehole_elts[0])
+            The document is parsed incrementally and each Borehole element
+            is discarded once its Borehole object has been generated, so
+            large collections can be loaded with bounded memory. Each
+            borehole is named with its gml:id.
 
-        return self.borehole
+            Example usage:
 
-    def _get_borehole_elts(self, geo_tree):
-        """ Return a list of GeoSciML Borehole elements taking into account
-            tag namespace variations.
+                response = requests.get(wfsurl, params=params, stream=True)
+                for bhl in generator.iter_boreholes(response.raw):
+                    ...
 
-            :param geo_tree: a GeoSciML element tree
-            :type geo_tree: xml.etree.ElementTree
-            :returns: a list of Borehole elements
+            :param geo_source: A filename or file-like object containing
+                GeoSciML 2.0 or 3.0 Borehole elements
+            :type geo_source: string or file-like object
+            :returns: an iterator over Borehole objects
         """
-        boreholes = []
-        for ns_prefix in ['gsml', 'gsmlbh']:
-            boreholes = geo_tree.findall('.//{' + NS[ns_prefix] + '}Borehole')
-            if len(boreholes) != 0:
-                self.ns_key = ns_prefix
-                break
+        for borehole_elt, ns_key in _iter_borehole_elts(geo_source):
+            name = borehole_elt.get('{{{0}}}id'.format(GML_NS[ns_key]))
+            yield self._make_borehole(name, borehole_elt, ns_key)
 
-        return boreholes
+    def _make_borehole(self, name, borehole_elt, ns_key):
+        """ Return a Borehole object initialised from a Borehole element
+
+            :param name: The name to assign to the Borehole object
+            :type name: string
+            :param borehole_elt: A GeoSciML Borehole element
+            :type borehole_elt: Element
+            :param ns_key: The GeoSciML version of the element, either
+                'gsml' (2.0) or 'gsmlbh' (3.0)
+            :type ns_key: string
+            :returns: a Borehole object
+        """
+        borehole = Borehole(name=name,
+                            origin_position=self._location(borehole_elt,
+                                                           ns_key))
+        self._add_borehole_details(borehole, borehole_elt, ns_key)
+        return borehole
+
+    def _find(self, element, ns_key, detail):
+        """Return the first result of the compiled XPath expression for a
+           detail, or None if there aren't any results.
+
+        :param element: The element to search from
+        :type element: Element
+        :param ns_key: The GeoSciML version, either 'gsml' or 'gsmlbh'
+        :type ns_key: string
+        :param detail: The key of the expression in XPATHS
+        :type detail: string
+        :returns: an element, attribute value or text (or None)
+        """
+        results = self.xpaths[ns_key][detail](element)
+        if results:
+            return results[0]
+        return None
 
-    def _location(self, borehole_elt):
-        """Find the GeoSciML 2.0 or 3.0 borehole position (lat/lon) and 
+    def _location(self, borehole_elt, ns_key):
+        """Find the GeoSciML 2.0 or 3.0 borehole position (lat/lon) and
            elevation and return an OriginPosition instance.
-           
+
         :param borehole_elt: A GeoSciML 2.0 or 3.0 Borehole element
         :type borehole_elt: Element
+        :param ns_key: The GeoSciML version, either 'gsml' or 'gsmlbh'
+        :type ns_key: string
         :returns: an OriginPosition instance (or None, if not found)
         """
         origin_position = None
-        
-        latlon_xpath = './/{{{0}}}location/{{{1}}}Point/{{{2}}}pos'
-        latlon = _element_text(borehole_elt,
-                               latlon_xpath.format(NS[self.ns_key],
-                                                   GML_NS[self.ns_key],
-                                                   GML_NS[self.ns_key]))
+
+        latlon = self._find(borehole_elt, ns_key, 'latlon')
         if latlon is not None:
             (lat, lon) = latlon.split(' ')
-         
-            elevation_xpath = './/{{{0}}}elevation[@uomLabels]'
-            elevation_elt = \
-                borehole_elt.find(elevation_xpath.format(NS[self.ns_key]))
-            
+
+            elevation_elt = self._find(borehole_elt, ns_key, 'elevation')
+
             if elevation_elt is not None:
                 elevation_units = \
-                    self.unit_reg[elevation_elt.attrib['uomLabels']]
+                    parse_units(elevation_elt.attrib['uomLabels'])
             else:
                 elevation_units = None
-                
-            if self.ns_key == 'gsml':
+
+            if ns_key == 'gsml':
                 property_type = \
-                    self._gsml_location_property(borehole_elt,
+                    self._gsml_location_property(borehole_elt, ns_key,
                                                  elevation_units)
             else:
-                property_type = self._gsmlbh_location_property(borehole_elt)
-                
+                property_type = \
+                    self._gsmlbh_location_property(borehole_elt, ns_key)
+
             origin_position = \
                 OriginPosition(latitude=float(lat) * self.unit_reg.degree,
                     longitude=float(lon) * self.unit_reg.degree,
@@ -149,295 +241,235 @@ class SISSBoreholeGenerator:
 
         return origin_position
 
-    def _gsml_location_property(self, borehole_elt, units):
+    def _gsml_location_property(self, borehole_elt, ns_key, units):
         """Return a GeoSciML 2.0 location (elevation) property object.
-        
+
         :param borehole_elt: A GeoSciML 2.0 Borehole element
         :type borehole_elt: Element
+        :param ns_key: The GeoSciML version, i.e. 'gsml'
+        :type ns_key: string
         :param units: elevation units
         :type units: A Pint elevation unit (e.g. meters)
         :returns: a location (elevation) property (or None, if not found)
         """
         property_type = None
-        
-        elevation_desc_xpath = './/{{{0}}}elevation[@axisLabels]'
-        elevation_elt = \
-            borehole_elt.find(elevation_desc_xpath.format(NS[self.ns_key]))
-        if elevation_elt is not None:
-            elevation_axis_desc = \
-                'elevation: {0}'.format(elevation_elt.attrib['axisLabels'])
+
+        axis_labels = self._find(borehole_elt, ns_key, 'elevation_axis')
+        if axis_labels is not None:
+            elevation_axis_desc = 'elevation: {0}'.format(axis_labels)
             property_type = PropertyType(name='origin position elevation',
                                          long_name='origin position elevation',
                                          description=elevation_axis_desc,
                                          units=units)
-            
+
         return property_type
-    
-    def _gsmlbh_location_property(self, borehole_elt):
+
+    def _gsmlbh_location_property(self, borehole_elt, ns_key):
         """Return a GeoSciML 3.0 location (description) property object.
-        
-        :param borehole_elt: A GeoSciML 2.0 Borehole element
+
+        :param borehole_elt: A GeoSciML 3.0 Borehole element
         :type borehole_elt: Element
+        :param ns_key: The GeoSciML version, i.e. 'gsmlbh'
+        :type ns_key: string
         :returns: a location (description) property (or None, if not found)
         """
-        description_xpath = \
-            './/{{{0}}}location/{{{1}}}Point/{{{2}}}description'
-            
-        description_text = _element_text(borehole_elt,
-                         description_xpath.format(NS[self.ns_key],
-                                                  GML_NS[self.ns_key],
-                                                  GML_NS[self.ns_key]))
-        
+        description_text = \
+            self._find(borehole_elt, ns_key, 'location_description')
+
         description_text = 'description: {0}'.format(description_text)
-        
+
         return PropertyType(name='origin position',
                             long_name='origin position',
                             description=description_text)
-    
-    def _add_borehole_details(self, borehole_elt):
+
+    def _add_borehole_details(self, borehole, borehole_elt, ns_key):
         """ Add borehole details.
 
             This top-level method calls more specific methods to add
             borehole details.
 
+            :param borehole: The Borehole object to add details to
+            :type borehole: Borehole
             :param borehole_elt: A GeoSciML Borehole element
             :type borehole_elt: Element
+            :param ns_key: The GeoSciML version, either 'gsml' or 'gsmlbh'
+            :type ns_key: string
         """
-        details_elt = \
-        borehole_elt.find('.//{{{0}}}BoreholeDetails'.format(NS[self.ns_key]))
+        details_elt = self._find(borehole_elt, ns_key, 'details')
         if details_elt is not None:
-            return self.geosciml_handlers[self.ns_key](borehole_elt,
-                                                       details_elt)
+            return self.geosciml_handlers[ns_key](borehole, borehole_elt,
+                                                  details_elt, ns_key)
 
-    def _add_gsml_borehole_details(self, borehole_elt, details_elt):
+    def _add_gsml_borehole_details(self, borehole, borehole_elt, details_elt,
+                                   ns_key):
         """Add borehole details from a GeoSciML 2.0 Borehole or
             BoreholeDetails element.
-        
+
+        :param borehole: The Borehole object to add details to
+        :type borehole: Borehole
         :param borehole_elt: A GeoSciML 2.0 Borehole element
         :type borehole_elt: Element
         :param details_elt: A GeoSciML 2.0 BoreholeDetails element
         :type details_elt: Element
+        :param ns_key: The GeoSciML version, i.e. 'gsml'
+        :type ns_key: string
         """
         # Driller
-        self._add_driller(details_elt)
+        self._add_driller(borehole, details_elt, ns_key)
 
         # Drilling method
-        drilling_method = \
-            _element_text(details_elt,
-                          './/{{{0}}}drillingMethod'.format(NS[self.ns_key]))
-        self.borehole.add_detail('drilling method', drilling_method)
-        
+        drilling_method = self._find(details_elt, ns_key, 'drilling_method')
+        borehole.add_detail('drilling method', drilling_method)
+
         # Date of drilling
         date_of_drilling = \
-            _element_text(details_elt,
-                          './/{{{0}}}dateOfDrilling'.format(NS[self.ns_key]))
+            self._find(details_elt, ns_key, 'date_of_drilling')
         year, month, day = date_of_drilling.split('-')
         date = datetime(year=int(year), month=int(month), day=int(day))
-        self.borehole.add_detail('date of drilling', date)
+        borehole.add_detail('date of drilling', date)
 
         # Borehole start point
-        start_point = \
-            _element_text(details_elt,
-                          './/{{{0}}}startPoint'.format(NS[self.ns_key]))
-        self.borehole.add_detail('start point', start_point)
-        
+        start_point = self._find(details_elt, ns_key, 'start_point')
+        borehole.add_detail('start point', start_point)
+
         # Borehole inclination type
         inclination_type = \
-            _element_text(details_elt,
-                          './/{{{0}}}inclinationType'.format(NS[self.ns_key]))
-        self.borehole.add_detail('inclination type', inclination_type)
-        
+            self._find(details_elt, ns_key, 'inclination_type')
+        borehole.add_detail('inclination type', inclination_type)
+
         # Borehole shape
         # Note: This is a child of the Borehole element rather than
-        #       BoreholeDetails. 
-        shape_xpath = './/{{{0}}}shape/{{{1}}}LineString/{{{2}}}posList'
-        shape = \
-            _element_text(borehole_elt,
-                          shape_xpath.format(SHAPE_NS[self.ns_key],
-                                             GML_NS[self.ns_key],
-                                             GML_NS[self.ns_key]))
-        shape_list = [float(x) for x in self.whitespace_pattern.split(shape)]
-        self.borehole.add_detail('shape', shape_list)
-        
+        #       BoreholeDetails.
+        shape = self._find(borehole_elt, ns_key, 'shape')
+        shape_list = [float(x) for x in
+                      self.whitespace_pattern.split(shape.strip())]
+        borehole.add_detail('shape', shape_list)
+
         # Borehole cored interval
-        cored_interval_xpath = \
-            './/{{{0}}}coredInterval/{{{1}}}Envelope[@uomLabels]'
         cored_interval_elt = \
-            details_elt.find(cored_interval_xpath.format(NS[self.ns_key],
-                                                         GML_NS[self.ns_key]))
+            self._find(details_elt, ns_key, 'cored_interval')
         cored_interval_units = \
-            self.unit_reg[cored_interval_elt.attrib['uomLabels']]
-            
+            parse_units(cored_interval_elt.attrib['uomLabels'])
+
         cored_interval_lower_corner = \
-            _element_text(cored_interval_elt,
-                          './/{{{0}}}lowerCorner'.format(GML_NS[self.ns_key]))
+            self._find(cored_interval_elt, ns_key, 'lower_corner')
         cored_interval_upper_corner = \
-            _element_text(cored_interval_elt,
-                          './/{{{0}}}upperCorner'.format(GML_NS[self.ns_key]))
-            
+            self._find(cored_interval_elt, ns_key, 'upper_corner')
+
         lower_corner = float(cored_interval_lower_corner) * cored_interval_units
         upper_corner = float(cored_interval_upper_corner) * cored_interval_units
         envelope_dict = {'lower corner': lower_corner,
                          'upper corner': upper_corner}
-        
+
         # Question: How useful is the property here in fact if we have units
         #           for each value?
-        self.borehole.add_detail('cored interval', envelope_dict,
+        borehole.add_detail('cored interval', envelope_dict,
                             PropertyType(name='envelope',
                                          long_name='cored interval envelope',
                                          description='cored interval envelope '
                                                      'lower and upper corner',
                                          units=cored_interval_units))
-                       
-    def _add_gsmlbh_borehole_details(self, borehole_elt, details_elt):
+
+    def _add_gsmlbh_borehole_details(self, borehole, borehole_elt,
+                                     details_elt, ns_key):
         """Add borehole details from a GeoSciML 3.0 Borehole or
            BoreholeDetails element.
-        
+
+        :param borehole: The Borehole object to add details to
+        :type borehole: Borehole
         :param borehole_elt: A GeoSciML 3.0 Borehole element
         :type borehole_elt: Element
         :param details_elt: A GeoSciML 3.0 BoreholeDetails element
         :type details_elt: Element
+        :param ns_key: The GeoSciML version, i.e. 'gsmlbh'
+        :type ns_key: string
         """
 
         # Driller
-        self._add_driller(details_elt)
-        
+        self._add_driller(borehole, details_elt, ns_key)
+
         # Drilling method
         # Note:  This is a child of the Borehole element rather than
-        #        BoreholeDetails. 
-        drilling_method_xpath = ('.//{{{0}}}downholeDrillingDetails'
-                                 '/{{{1}}}DrillingDetails'
-                                 '/{{{2}}}drillingMethod'). \
-                                 format(NS[self.ns_key],
-                                        NS[self.ns_key],
-                                        NS[self.ns_key])
-                                                        
-        drilling_method_attrib_xpath = '{{{0}}}title'.format(NS['xlink'])
-        drilling_method = _element_attrib(borehole_elt,
-                                          drilling_method_xpath,
-                                          drilling_method_attrib_xpath)
-        self.borehole.add_detail('drilling method', drilling_method)
+        #        BoreholeDetails.
+        drilling_method = \
+            self._find(borehole_elt, ns_key, 'drilling_method')
+        borehole.add_detail('drilling method', drilling_method)
 
         # Date of drilling
         # Note: Both start and end time are available; currently extracting
         #       only start time.
-        date_of_drilling_xpath = ('.//{{{0}}}dateOfDrilling/{{{1}}}TimePeriod'
-                            '/{{{2}}}begin/{{{3}}}TimeInstant'
-                            '/{{{4}}}timePosition').format(NS[self.ns_key],
-                                                           GML_NS[self.ns_key],
-                                                           GML_NS[self.ns_key],
-                                                           GML_NS[self.ns_key],
-                                                           GML_NS[self.ns_key])
-        date_of_drilling = _element_text(details_elt,
-                                         date_of_drilling_xpath)
+        date_of_drilling = \
+            self._find(details_elt, ns_key, 'date_of_drilling')
         year, month, day = date_of_drilling.split('-')
         date = datetime(year=int(year), month=int(month), day=int(day))
-        self.borehole.add_detail('date of drilling', date)
+        borehole.add_detail('date of drilling', date)
 
         # Borehole start point
-        start_point_xpath = './/{{{0}}}startPoint'.format(NS[self.ns_key])
-        start_point_attrib_xpath = '{{{0}}}title'.format(NS['xlink'])
-        start_point = _element_attrib(details_elt, start_point_xpath,
-                                      start_point_attrib_xpath)
-        self.borehole.add_detail('start point', start_point)
+        start_point = self._find(details_elt, ns_key, 'start_point')
+        borehole.add_detail('start point', start_point)
 
         # Borehole inclination type
-        inclination_type_xpath = \
-            './/{{{0}}}inclinationType'.format(NS[self.ns_key])
-        inclination_type_attrib_xpath = '{{{0}}}title'.format(NS['xlink'])
-        inclination_type = _element_attrib(details_elt,
-                                            inclination_type_xpath,
-                                            inclination_type_attrib_xpath)
-        self.borehole.add_detail('inclination type', inclination_type)
-        
+        inclination_type = \
+            self._find(details_elt, ns_key, 'inclination_type')
+        borehole.add_detail('inclination type', inclination_type)
+
         # Borehole shape
-        # Notes: 
+        # Notes:
         # o This is a child of the Borehole element rather than BoreholeDetails.
         # o Currently chooses the first one (if more than one exists).
-        shape_xpath = './/{{{0}}}shape/{{{1}}}CompositeCurve' \
-                      '/{{{2}}}curveMember/{{{3}}}LineString/{{{4}}}posList'
-        shape = \
-            _element_text(borehole_elt,
-                          shape_xpath.format(SHAPE_NS[self.ns_key],
-                                             GML_NS[self.ns_key],
-                                             GML_NS[self.ns_key],
-                                             GML_NS[self.ns_key],
-                                             GML_NS[self.ns_key]))
-        shape_list = [float(x) for x in self.whitespace_pattern.split(shape)]
-        self.borehole.add_detail('shape', shape_list)
-        
+        shape = self._find(borehole_elt, ns_key, 'shape')
+        shape_list = [float(x) for x in
+                      self.whitespace_pattern.split(shape.strip())]
+        borehole.add_detail('shape', shape_list)
+
         # Borehole cored interval
         # Note: No units; haven't used a PropertyType here.
-        cored_interval_xpath = ('.//{{{0}}}downholeDrillingDetails'
-                                 '/{{{1}}}DrillingDetails'
-                                 '/{{{2}}}interval/{{{3}}}LineString'
-                                 '/{{{4}}}posList'). \
-                                 format(NS[self.ns_key],
-                                        NS[self.ns_key],
-                                        NS[self.ns_key],
-                                        GML_NS[self.ns_key],
-                                        GML_NS[self.ns_key])
-        
-        cored_interval = _element_text(borehole_elt,
-                                       cored_interval_xpath)
-        cored_interval_list = self.whitespace_pattern.split(cored_interval)
+        cored_interval = self._find(borehole_elt, ns_key, 'cored_interval')
+        cored_interval_list = \
+            self.whitespace_pattern.split(cored_interval.strip())
         lower_corner = float(cored_interval_list[0])
         upper_corner = float(cored_interval_list[1])
         envelope_dict = {'lower corner': lower_corner,
                          'upper corner': upper_corner}
-        self.borehole.add_detail('cored interval', envelope_dict)
-    
-    def _add_driller(self, details_elt):
-        """Add borehole driller detail from a GeoSciML 3.0
+        borehole.add_detail('cored interval', envelope_dict)
+
+    def _add_driller(self, borehole, details_elt, ns_key):
+        """Add borehole driller detail from a GeoSciML 2.0 or 3.0
            BoreholeDetails element.
-        
-        :param details_elt: A GeoSciML 3.0 BoreholeDetails element
+
+        :param borehole: The Borehole object to add details to
+        :type borehole: Borehole
+        :param details_elt: A GeoSciML BoreholeDetails element
         :type details_elt: Element
+        :param ns_key: The GeoSciML version, either 'gsml' or 'gsmlbh'
+        :type ns_key: string
         """
-        driller_xpath = './/{{{0}}}driller'.format(NS[self.ns_key])
-        driller_attrib_xpath = '{{{0}}}title'.format(NS['xlink'])
-        driller = _element_attrib(details_elt, driller_xpath,
-                                  driller_attrib_xpath)
-        self.borehole.add_detail('driller', driller)
-
-def _element_text(element, xpath_str):
-    """Look for and return the detail corresponding to the text 
-       of the child element found by the specified XPath search
-       on the supplied element.
-       
-    :param element: An XML element
-    :type element: Element
-    :param xpath_str: An XPath string.
-    :type xpath_str: string
-    :returns: child text
-    """
-    result = element.find(xpath_str)
-   
-    if result is not None:
-        text = result.text
-    else:
-        text = None
-    
-    return text
-
-def _element_attrib(element, elt_xpath_str, attr_xpath_str):
-    """Look for and return the detail corresponding to the attribute 
-       text of the child element found by the specified XPath search
-       on the supplied element.
-       
-    :param element: An XML element
-    :type element: Element
-    :param elt_xpath_str: An XPath string to find an element.
-    :type elt_xpath_str: string
-    :param attr_xpath_str: An XPath string to find an attribute.
-    :type attr_xpath_str: string
-    :returns: attribute text
+        driller = self._find(details_elt, ns_key, 'driller')
+        borehole.add_detail('driller', driller)
+
+
+def _iter_borehole_elts(geo_source):
+    """Generate the GeoSciML 2.0 or 3.0 Borehole elements in a document,
+       along with their namespace keys, parsing the document incrementally.
+
+       Each Borehole element is cleared once the caller has finished with
+       it, along with any earlier siblings of it and its ancestors, so only
+       one borehole is held in memory at a time.
+
+    :param geo_source: A filename or file-like object
+    :type geo_source: string or file-like object
+    :returns: an iterator over `(borehole_elt, ns_key)` tuples
     """
-    result = element.find(elt_xpath_str)
-   
-    if result is not None:
-        text = result.attrib[attr_xpath_str]
-    else:
-        text = None
-    
-    return text
+    tags = dict(('{{{0}}}Borehole'.format(NS[ns_key]), ns_key)
+                for ns_key in ('gsml', 'gsmlbh'))
+    for _, elem in etree.iterparse(geo_source, events=('end',),
+                                   tag=tags.keys()):
+        yield elem, tags[elem.tag]
+
+        # Discard the borehole so that the tree doesn't keep growing
+        elem.clear()
+        for ancestor in elem.iterancestors():
+            while ancestor.getprevious() is not None:
+                del ancestor.getparent()[0]
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
@@ -0,0 +1,487 @@
+""" file:   store.py (pysiss.borehole)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Wednesday 21 January, 2015
+
+    description: A columnar on-disk store for boreholes
+
+    Each borehole is stored as a small JSON metadata record (origin position,
+    survey, details and the layout of each dataset) plus one column for each
+    array of depths or property values. Columns are split into fixed-size
+    chunks, and each chunk is compressed separately, so reading part of a
+    column only decompresses the chunks that are needed. Everything lives in
+    a single SQLite database.
+
+    Loading a borehole reads its metadata and dataset depths; the property
+    values are only read from disk the first time each property's `values`
+    are used. So listing the boreholes in a large archive doesn't read any
+    data, and reading one analyte doesn't touch the others.
+"""
+
+from .borehole import Borehole, OriginPosition
+from .datasets import PointDataSet, IntervalDataSet
+from .datasets.dataset import DatasetDetails
+from .properties import PropertyType, LazyProperty
+from ..utilities import get_unit_registry
+
+import datetime
+import numpy
+import pandas
+import simplejson
+import sqlite3
+import zlib
+
+
+class BoreholeStore(object):
+
+    """ A persistent archive of boreholes
+
+        Example usage:
+
+            with BoreholeStore('boreholes.db') as store:
+                store.save_all(boreholes)
+
+            store = BoreholeStore('boreholes.db', mode='r')
+            borehole = store['WTB5']
+            gold = borehole.point_datasets['assays'].properties['Au_ppm']
+            gold.values     # only this column is read from disk
+
+        :param path: The path to the archive file
+        :type path: string
+        :param mode: 'r' to open an existing archive read-only, or 'a' to
+            open or create an archive for reading and writing. Optional,
+            defaults to 'a'.
+        :type mode: string
+        :param chunk_size: The number of values in each compressed chunk of
+            a column. Optional, defaults to 65536.
+        :type chunk_size: int
+        :param compression_level: The zlib compression level, from 0 (no
+            compression) to 9. Optional, defaults to 6.
+        :type compression_level: int
+    """
+
+    def __init__(self, path, mode='a', chunk_size=2 ** 16,
+                 compression_level=6):
+        super(BoreholeStore, self).__init__()
+        if mode not in ('r', 'a'):
+            raise ValueError("mode must be 'r' or 'a', not {0}".format(mode))
+        self.path = path
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+
+        if mode == 'r':
+            # Fail if the file doesn't exist, rather than creating it
+            open(path, 'rb').close()
+        self._db = sqlite3.connect(path)
+        if mode == 'a':
+            with self._db:
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS boreholes ('
+                    'name TEXT PRIMARY KEY, metadata TEXT)')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS columns ('
+                    'id INTEGER PRIMARY KEY, borehole TEXT, dtype TEXT, '
+                    'length INTEGER, chunk_size INTEGER)')
+                self._db.execute(
+                    'CREATE INDEX IF NOT EXISTS columns_borehole '
+                    'ON columns (borehole)')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS chunks ('
+                    'col INTEGER, idx INTEGER, data BLOB, '
+                    'PRIMARY KEY (col, idx))')
+
+    def __repr__(self):
+        info = 'BoreholeStore at {0}: {1} boreholes'
+        return info.format(self.path, len(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM boreholes').fetchone()[0]
+
+    def __contains__(self, name):
+        return self._db.execute(
+            'SELECT 1 FROM boreholes WHERE name = ?', (name,)).fetchone() \
+            is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, name):
+        return self.load(name)
+
+    def __delitem__(self, name):
+        self.delete(name)
+
+    def keys(self):
+        """ Return the names of the boreholes in the archive
+        """
+        return [name for (name,) in self._db.execute(
+            'SELECT name FROM boreholes ORDER BY name')]
+
+    def close(self):
+        """ Close the archive
+        """
+        self._db.close()
+
+    def save(self, borehole):
+        """ Save a borehole to the archive, replacing any borehole with the
+            same name
+
+            :param borehole: The borehole to save
+            :type borehole: `pysiss.borehole.Borehole`
+        """
+        self.save_all([borehole])
+
+    def save_all(self, boreholes):
+        """ Save some boreholes to the archive in a single transaction
+
+            :param boreholes: The boreholes to save
+            :type boreholes: iterable of `pysiss.borehole.Borehole`s
+        """
+        self._check_writable()
+        with self._db:
+            for borehole in boreholes:
+                self._delete(borehole.name)
+                metadata = {
+                    'origin_position': _encode_origin(
+                        borehole.origin_position),
+                    'survey': _encode_survey(borehole.survey),
+                    'details': _encode_details(borehole.details),
+                    'point_datasets': [
+                        self._save_point_dataset(borehole.name, dataset)
+                        for dataset in borehole.point_datasets.values()],
+                    'interval_datasets': [
+                        self._save_interval_dataset(borehole.name, dataset)
+                        for dataset in borehole.interval_datasets.values()]}
+                self._db.execute(
+                    'INSERT INTO boreholes VALUES (?, ?)',
+                    (borehole.name, _dumps(metadata)))
+
+    def load(self, name):
+        """ Load a borehole from the archive
+
+            Property values are read lazily, the first time they are used.
+
+            :param name: The name of the borehole
+            :type name: string
+            :returns: a `pysiss.borehole.Borehole`
+            :raises: `KeyError` if there is no borehole with that name
+        """
+        row = self._db.execute('SELECT metadata FROM boreholes WHERE name = ?',
+                               (name,)).fetchone()
+        if row is None:
+            raise KeyError('No borehole {0} in {1}'.format(name, self.path))
+        metadata = _loads(row[0])
+
+        borehole = Borehole(name, _decode_origin(metadata['origin_position']))
+        survey = metadata['survey']
+        if survey is not None:
+            borehole.add_survey(*survey)
+        _decode_details(metadata['details'], borehole.details)
+        for info in metadata['point_datasets']:
+            dataset = PointDataSet._from_sorted(
+                info['name'], self.read_column(info['depths']),
+                details=_decode_details(info['details'], DatasetDetails()))
+            self._load_properties(dataset, info['properties'])
+            borehole.add_dataset(dataset)
+        for info in metadata['interval_datasets']:
+            dataset = IntervalDataSet._from_sorted(
+                info['name'], self.read_column(info['from_depths']),
+                self.read_column(info['to_depths']),
+                details=_decode_details(info['details'], DatasetDetails()))
+            self._load_properties(dataset, info['properties'])
+            borehole.add_dataset(dataset)
+        return borehole
+
+    def delete(self, name):
+        """ Remove a borehole from the archive
+
+            :param name: The name of the borehole
+            :type name: string
+        """
+        self._check_writable()
+        if name not in self:
+            raise KeyError('No borehole {0} in {1}'.format(name, self.path))
+        with self._db:
+            self._delete(name)
+
+    def read_column(self, column, start=None, stop=None):
+        """ Read some or all of the values in a column
+
+            Only the chunks which overlap the requested values are read and
+            decompressed.
+
+            :param column: The column identifier
+            :type column: int
+            :param start, stop: The range of values to read. Optional,
+                defaults to the whole column.
+            :type start, stop: int
+            :returns: a `numpy.ndarray`
+        """
+        dtype, length, chunk_size = self._db.execute(
+            'SELECT dtype, length, chunk_size FROM columns WHERE id = ?',
+            (column,)).fetchone()
+        start, stop, _ = slice(start, stop).indices(length)
+        values = numpy.empty(max(stop - start, 0), dtype=numpy.dtype(dtype))
+        if len(values) == 0:
+            return values
+
+        # Copy the overlapping part of each chunk into the result
+        first, last = start // chunk_size, (stop - 1) // chunk_size
+        chunks = self._db.execute(
+            'SELECT idx, data FROM chunks WHERE col = ? '
+            'AND idx BETWEEN ? AND ?', (column, first, last))
+        for idx, data in chunks:
+            chunk = numpy.frombuffer(zlib.decompress(data), dtype=dtype)
+            offset = idx * chunk_size
+            lower, upper = max(start, offset), min(stop, offset + len(chunk))
+            values[lower - start:upper - start] = \
+                chunk[lower - offset:upper - offset]
+        return values
+
+    def _check_writable(self):
+        """ Raise an IOError if the archive is read-only
+        """
+        if self.mode == 'r':
+            raise IOError('{0} was opened read-only'.format(self.path))
+
+    def _delete(self, name):
+        """ Remove a borehole and its columns. Must be called in a
+            transaction.
+        """
+        self._db.execute(
+            'DELETE FROM chunks WHERE col IN '
+            '(SELECT id FROM columns WHERE borehole = ?)', (name,))
+        self._db.execute('DELETE FROM columns WHERE borehole = ?', (name,))
+        self._db.execute('DELETE FROM boreholes WHERE name = ?', (name,))
+
+    def _write_column(self, borehole_name, values):
+        """ Store an array as a new column and return its identifier
+        """
+        values = numpy.ascontiguousarray(values)
+        cursor = self._db.execute(
+            'INSERT INTO columns (borehole, dtype, length, chunk_size) '
+            'VALUES (?, ?, ?, ?)',
+            (borehole_name, values.dtype.str, len(values), self.chunk_size))
+        column = cursor.lastrowid
+        self._db.executemany(
+            'INSERT INTO chunks VALUES (?, ?, ?)',
+            ((column, idx, sqlite3.Binary(zlib.compress(
+                values[start:start + self.chunk_size].tostring(),
+                self.compression_level)))
+             for idx, start in enumerate(
+                 range(0, len(values), self.chunk_size))))
+        return column
+
+    def _save_point_dataset(self, borehole_name, dataset):
+        """ Store the columns for a PointDataSet and return its metadata
+        """
+        return {
+            'name': dataset.name,
+            'depths': self._write_column(borehole_name, dataset.depths),
+            'details': _encode_details(dataset.details),
+            'properties': self._save_properties(borehole_name, dataset)}
+
+    def _save_interval_dataset(self, borehole_name, dataset):
+        """ Store the columns for an IntervalDataSet and return its metadata
+        """
+        return {
+            'name': dataset.name,
+            'from_depths': self._write_column(borehole_name,
+                                              dataset.from_depths),
+            'to_depths': self._write_column(borehole_name,
+                                            dataset.to_depths),
+            'details': _encode_details(dataset.details),
+            'properties': self._save_properties(borehole_name, dataset)}
+
+    def _save_properties(self, borehole_name, dataset):
+        """ Store a column for each property in a dataset and return their
+            metadata
+        """
+        properties = []
+        for prop in dataset.properties.values():
+            info = {'property_type': _encode_property_type(
+                prop.property_type)}
+            values = prop.values
+            if isinstance(values, pandas.Categorical):
+                info['encoding'] = 'categorical'
+                info['categories'] = list(values.categories)
+                values = values.codes
+            else:
+                values = numpy.asarray(values)
+                if values.dtype.kind in 'OSU':
+                    # Store strings as codes into a list of categories
+                    values = pandas.Categorical(values)
+                    info['encoding'] = 'strings'
+                    info['categories'] = list(values.categories)
+                    values = values.codes
+                else:
+                    info['encoding'] = 'array'
+            info['column'] = self._write_column(borehole_name, values)
+            properties.append(info)
+        return properties
+
+    def _load_properties(self, dataset, properties):
+        """ Add properties to a dataset which read their values from the
+            archive when they are first used
+        """
+        for info in properties:
+            ptype = _decode_property_type(info['property_type'])
+            dataset.properties[ptype.name] = LazyProperty(
+                ptype, self._column_loader(info))
+
+    def _column_loader(self, info):
+        """ Return a function which reads and decodes a property column
+        """
+        def _load():
+            values = self.read_column(info['column'])
+            if info['encoding'] == 'array':
+                return values
+            categorical = pandas.Categorical.from_codes(
+                values, categories=info['categories'])
+            if info['encoding'] == 'categorical':
+                return categorical
+            # Missing strings are stored with code -1, and come back as None
+            # to match the gaps in the datasets' own object columns
+            strings = numpy.asarray(categorical, dtype=object)
+            strings[values == -1] = None
+            return strings
+        return _load
+
+
+def _dumps(obj):
+    """ Serialize metadata as JSON, with values that JSON can't represent
+        (pint quantities and units, dates, tuples and arrays) tagged so that
+        they can be restored
+    """
+    return simplejson.dumps(obj, default=_encode_value, tuple_as_array=False)
+
+
+def _loads(text):
+    """ Deserialize metadata written by `_dumps`
+    """
+    return simplejson.loads(text, object_hook=_decode_value)
+
+
+def _encode_value(value):
+    """ Convert values which JSON can't handle
+
+        :raises: TypeError for values which can't be stored
+    """
+    if isinstance(value, numpy.ndarray):
+        if value.dtype.kind not in 'biufcSU':
+            raise TypeError("Can't store arrays of type {0} in borehole "
+                            "metadata".format(value.dtype))
+        return {'__array__': [value.tolist(), value.dtype.str]}
+    elif isinstance(value, numpy.generic):
+        return value.item()
+    elif isinstance(value, tuple):
+        return {'__tuple__': list(value)}
+    elif isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            raise TypeError("Can't store timezone-aware datetimes in "
+                            "borehole metadata")
+        return {'__datetime__': [value.year, value.month, value.day,
+                                 value.hour, value.minute, value.second,
+                                 value.microsecond]}
+    elif isinstance(value, datetime.date):
+        return {'__date__': [value.year, value.month, value.day]}
+    elif hasattr(value, 'magnitude') and hasattr(value, 'units'):
+        return {'__quantity__': [value.magnitude, str(value.units)]}
+    elif hasattr(value, 'dimensionality'):
+        return {'__units__': str(value)}
+    raise TypeError("Can't store {0!r} (of type {1}) in borehole "
+                    "metadata".format(value, type(value).__name__))
+
+
+def _decode_value(obj):
+    """ Restore values tagged by `_encode_value`
+    """
+    if '__quantity__' in obj:
+        magnitude, units = obj['__quantity__']
+        return get_unit_registry().Quantity(magnitude, units)
+    elif '__units__' in obj:
+        return get_unit_registry().Unit(obj['__units__'])
+    elif '__array__' in obj:
+        values, dtype = obj['__array__']
+        return numpy.array(values, dtype=dtype)
+    elif '__tuple__' in obj:
+        return tuple(obj['__tuple__'])
+    elif '__datetime__' in obj:
+        return datetime.datetime(*obj['__datetime__'])
+    elif '__date__' in obj:
+        return datetime.date(*obj['__date__'])
+    return obj
+
+
+def _encode_property_type(ptype):
+    """ Return the attributes of a PropertyType as a dict
+    """
+    if ptype is None:
+        return None
+    return {'name': ptype.name, 'long_name': ptype._long_name,
+            'description': ptype.description, 'units': ptype.units,
+            'isnumeric': ptype.isnumeric,
+            'detection_limit': ptype.detection_limit}
+
+
+def _decode_property_type(info):
+    """ Make a PropertyType from the output of `_encode_property_type`
+    """
+    if info is None:
+        return None
+    return PropertyType(**info)
+
+
+def _encode_details(details):
+    """ Return a list of the (name, values, property type) of some details
+    """
+    if details is None:
+        return None
+    return [[detail.name, detail.values,
+             _encode_property_type(detail.property_type)]
+            for detail in details.values()]
+
+
+def _decode_details(encoded, details):
+    """ Add details from the output of `_encode_details` to a Details
+        instance, or return None if there aren't any details
+    """
+    if encoded is None:
+        return None
+    for name, values, ptype in encoded:
+        details.add_detail(name, values, _decode_property_type(ptype))
+    return details
+
+
+def _encode_origin(position):
+    """ Return the attributes of an OriginPosition as a dict
+    """
+    if position is None:
+        return None
+    return {'latitude': position.latitude, 'longitude': position.longitude,
+            'elevation': position.elevation,
+            'property_type': _encode_property_type(position.property_type)}
+
+
+def _decode_origin(info):
+    """ Make an OriginPosition from the output of `_encode_origin`
+    """
+    if info is None:
+        return None
+    info['property_type'] = _decode_property_type(info['property_type'])
+    return OriginPosition(**info)
+
+
+def _encode_survey(survey):
+    """ Return the stations of a survey as lists
+    """
+    if survey is None:
+        return None
+    return [survey.depths, survey.azimuths, survey.dips]
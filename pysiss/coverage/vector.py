@@ -6,9 +6,16 @@
     desription: Implementation of classes for vector coverage data
 """
 
-from ..utilities import id_object
+from ..utilities import id_object, Collection, STRTree, project_many, \
+    normalize_srs, is_latitude_first, collar_position
 from ..metadata import MetadataRegistry
 
+from shapely.geometry import Point, box
+from shapely.prepared import prep
+import shapely.vectorized
+import numpy
+import pandas
+
 
 class MappedFeature(id_object):
 
@@ -32,7 +39,6 @@ class MappedFeature(id_object):
         for attrib, value in kwargs.items():
             setattr(self, attrib, value)
         self.specification = specification
-        self.type = self.md_registry[self.specification].type
 
     def __repr__(self):
         """ String representation
@@ -41,17 +47,319 @@ class MappedFeature(id_object):
         info_str = info.format(self.ident, self.centroid)
         return info_str
 
-    def reproject(self, new_projection):
+    def reproject(self, new_projection, swap_axes=None):
         """ Reproject the shape to a new projection.
 
-            :param new_projection: The identifier for the new projection
-            :type new_projection: int
+            To reproject lots of features, use
+            `MappedFeatureCollection.reproject`, which transforms them all at
+            once. The reprojected shape is always in x/y order.
+
+            :param new_projection: The identifier for the new projection,
+                either an EPSG code or an srsName
+            :type new_projection: int or string
+            :param swap_axes: Whether the shape's coordinates are in y/x
+                (e.g. latitude/longitude) order. Optional, if None then
+                the axes are swapped if the feature's projection is an OGC
+                URN with latitude or northing first (see
+                `pysiss.utilities.is_latitude_first`).
+            :type swap_axes: bool
         """
-        raise NotImplementedError
-        # self.shape = type(self.shape)(project(self.shape.positions))
+        self._set_shape(project_many([self.shape], new_projection,
+                                     self.projection, swap_axes)[0],
+                        normalize_srs(new_projection))
+
+    def _set_shape(self, shape, projection):
+        """ Replace the shape and projection of the feature
+        """
+        self.shape = shape
+        self.projection = projection
+        self.centroid = self.shape.representative_point()
+
+    @property
+    def type(self):
+        """ Return the type of the MappedFeature's specification
+
+            This is looked up in the metadata registry when it's needed, so
+            the specification doesn't need to be registered when the
+            MappedFeature is created.
+        """
+        return self.metadata.type
 
     @property
     def metadata(self):
         """ Return the metadata associated with the MappedFeature
         """
         return self.md_registry[self.specification]
+
+
+class MappedFeatureCollection(Collection):
+
+    """ A collection of MappedFeatures with a spatial index
+
+        The index is an STR-packed R-tree over the bounding boxes of the
+        features' shapes. It is built the first time the collection is
+        queried, and rebuilt if features are added afterwards. Candidate
+        features from the index are then checked against the shapes
+        themselves, so the results are exact.
+
+        Example usage:
+
+            features = MappedFeatureCollection(iter_unmarshal('geology.xml'))
+            units = features.containing(121.5, -30.2)
+            feature_idx = features.locate(collar_lons, collar_lats)
+
+        :param features: The features to add on initialization
+        :type features: list of MappedFeature instances
+        :param node_capacity: The maximum number of children for each node
+            in the index. Optional, defaults to 16.
+        :type node_capacity: int
+    """
+
+    def __init__(self, features=None, node_capacity=16):
+        self.node_capacity = node_capacity
+        self._tree = None
+        self._prepared = {}
+        super(MappedFeatureCollection, self).__init__(features)
+
+    def append(self, feature):
+        """ Add a feature to the collection
+        """
+        super(MappedFeatureCollection, self).append(feature)
+        self._tree = None
+
+    def extend(self, features):
+        """ Add some features to the collection
+        """
+        super(MappedFeatureCollection, self).extend(features)
+        self._tree = None
+
+    @property
+    def tree(self):
+        """ The spatial index over the features' bounding boxes
+        """
+        if self._tree is None or len(self._tree) != len(self):
+            self._tree = STRTree([f.shape.bounds for f in self],
+                                 node_capacity=self.node_capacity)
+            self._prepared = {}
+        return self._tree
+
+    def prepared(self, idx):
+        """ Return the prepared shape for the feature at the given index
+
+            Prepared shapes make repeated predicate tests against the same
+            shape much faster.
+        """
+        try:
+            return self._prepared[idx]
+        except KeyError:
+            self._prepared[idx] = prep(self[idx].shape)
+            return self._prepared[idx]
+
+    def reproject(self, new_projection, swap_axes=None):
+        """ Reproject all the features to a new projection.
+
+            The features are grouped by their current projection, and the
+            coordinates of each group are transformed as one array.
+
+            :param new_projection: The identifier for the new projection,
+                either an EPSG code or an srsName
+            :type new_projection: int or string
+            :param swap_axes: Whether the features' coordinates are in y/x
+                (e.g. latitude/longitude) order. Optional, if None this is
+                worked out from each feature's projection, as for
+                `MappedFeature.reproject`.
+            :type swap_axes: bool
+        """
+        groups = {}
+        for feature in self:
+            swap = is_latitude_first(feature.projection) \
+                if swap_axes is None else swap_axes
+            groups.setdefault((normalize_srs(feature.projection), swap),
+                              []).append(feature)
+        new_projection = normalize_srs(new_projection)
+        for (projection, swap), features in groups.items():
+            shapes = project_many([f.shape for f in features],
+                                  new_projection, projection, swap)
+            for feature, shape in zip(features, shapes):
+                feature._set_shape(shape, new_projection)
+        self._tree = None
+
+    def intersecting(self, bbox):
+        """ Return the features which intersect a bounding box
+
+            :param bbox: The `(minx, miny, maxx, maxy)` box to query
+            :type bbox: tuple
+            :returns: a list of MappedFeatures
+        """
+        query = box(*bbox)
+        return [self[idx] for idx in self.tree.query(bbox)
+                if self.prepared(idx).intersects(query)]
+
+    def containing(self, x, y):
+        """ Return the features which contain a point
+
+            :param x, y: The point coordinates
+            :type x, y: float
+            :returns: a list of MappedFeatures
+        """
+        point = Point(x, y)
+        return [self[idx] for idx in self.tree.query((x, y, x, y))
+                if self.prepared(idx).contains(point)]
+
+    def nearest(self, x, y, k=1):
+        """ Return the k features nearest to a point
+
+            :param x, y: The point coordinates
+            :type x, y: float
+            :param k: The number of features to return. Optional, defaults
+                to 1.
+            :type k: int
+            :returns: a list of `(feature, distance)` tuples, sorted by
+                distance. Features containing the point have distance 0.
+        """
+        point = Point(x, y)
+        nearest = self.tree.nearest(
+            x, y, k, distance=lambda idx: self[idx].shape.distance(point))
+        return [(self[idx], dist) for idx, dist in nearest]
+
+    def query_points(self, x, y):
+        """ Find the features which contain each of a set of points
+
+            The points which fall in each feature's bounding box are tested
+            against the feature's shape in a single vectorized call.
+
+            :param x, y: The point coordinates
+            :type x, y: `numpy.ndarray`
+            :returns: two integer arrays `(point_idx, feature_idx)` with one
+                entry for each point and feature containing it, sorted by
+                point and then by feature.
+        """
+        x = numpy.asarray(x, dtype=numpy.float_).ravel()
+        y = numpy.asarray(y, dtype=numpy.float_).ravel()
+        point_idx, feature_idx = self.tree.query_points(x, y)
+
+        # Group the candidates by feature and test each group at once
+        order = numpy.argsort(feature_idx, kind='mergesort')
+        point_idx, feature_idx = point_idx[order], feature_idx[order]
+        keep = numpy.zeros(len(point_idx), dtype=bool)
+        features, starts = numpy.unique(feature_idx, return_index=True)
+        ends = numpy.append(starts[1:], len(feature_idx))
+        for idx, start, end in zip(features, starts, ends):
+            points = point_idx[start:end]
+            keep[start:end] = shapely.vectorized.contains(
+                self.prepared(idx), x[points], y[points])
+
+        point_idx, feature_idx = point_idx[keep], feature_idx[keep]
+        order = numpy.lexsort((feature_idx, point_idx))
+        return point_idx[order], feature_idx[order]
+
+    def locate(self, x, y):
+        """ Return the index of the first feature containing each point
+
+            :param x, y: The point coordinates
+            :type x, y: `numpy.ndarray`
+            :returns: an integer array with the index of the first feature
+                (in collection order) containing each point, or -1 where
+                no feature contains the point.
+        """
+        x = numpy.asarray(x, dtype=numpy.float_).ravel()
+        point_idx, feature_idx = self.query_points(x, y)
+        located = numpy.empty(len(x), dtype=numpy.int_)
+        located.fill(-1)
+
+        # Results are sorted by feature within each point, so we want the
+        # first entry for each point
+        points, first = numpy.unique(point_idx, return_index=True)
+        located[points] = feature_idx[first]
+        return located
+
+
+def spatial_join(boreholes, features, all_matches=False, swap_axes=False,
+                 detail_name=None):
+    """ Find the features containing the collar of each borehole
+
+        The collar longitudes and latitudes are pulled out of the boreholes'
+        OriginPositions into arrays once, and then located in the features
+        using the spatial index of a MappedFeatureCollection.
+
+        Example usage:
+
+            geology = MappedFeatureCollection(iter_unmarshal('geology.xml'))
+            units = spatial_join(boreholes, geology)
+            units.specification['WTB5']
+
+        :param boreholes: The boreholes to locate
+        :type boreholes: iterable of `pysiss.borehole.Borehole`s
+        :param features: The features to search. If this isn't a
+            MappedFeatureCollection, one is made from the features.
+        :type features: MappedFeatureCollection or iterable of MappedFeatures
+        :param all_matches: If True, return a row for every feature
+            containing each collar, otherwise just the first feature (in
+            collection order). Optional, defaults to False.
+        :type all_matches: bool
+        :param swap_axes: The features' shapes are assumed to have longitude
+            as x and latitude as y. If the shapes use latitude/longitude axis
+            order (as GML in EPSG:4326 often does), set this to True.
+        :type swap_axes: bool
+        :param detail_name: If given, the specification of the first feature
+            containing each collar is also added to each borehole as a detail
+            with this name.
+        :type detail_name: string
+        :returns: a `pandas.DataFrame` indexed by borehole name with
+            'feature' and 'specification' columns giving the ident and
+            specification of the containing feature, or None if there isn't
+            one.
+    """
+    if not isinstance(features, MappedFeatureCollection):
+        features = MappedFeatureCollection(features)
+    boreholes = list(boreholes)
+    longitude, latitude = collar_coordinates(boreholes)
+    if swap_axes:
+        longitude, latitude = latitude, longitude
+
+    # Find the matching features
+    if all_matches:
+        point_idx, feature_idx = features.query_points(longitude, latitude)
+        unmatched = numpy.setdiff1d(numpy.arange(len(boreholes)), point_idx)
+        point_idx = numpy.concatenate([point_idx, unmatched])
+        feature_idx = numpy.concatenate(
+            [feature_idx, -numpy.ones(len(unmatched), dtype=numpy.int_)])
+        order = numpy.argsort(point_idx, kind='mergesort')
+        point_idx, feature_idx = point_idx[order], feature_idx[order]
+    else:
+        point_idx = numpy.arange(len(boreholes))
+        feature_idx = features.locate(longitude, latitude)
+
+    # Collect idents and specifications for each match
+    idents = [f.ident for f in features] + [None]
+    specifications = [f.specification for f in features] + [None]
+    joined = pandas.DataFrame(
+        {'feature': [idents[idx] for idx in feature_idx],
+         'specification': [specifications[idx] for idx in feature_idx]},
+        index=[boreholes[idx].name for idx in point_idx],
+        columns=['feature', 'specification'])
+
+    if detail_name is not None:
+        first = {}
+        for idx, spec in zip(point_idx, joined.specification):
+            first.setdefault(idx, spec)
+        for idx, spec in first.items():
+            boreholes[idx].add_detail(detail_name, spec)
+    return joined
+
+
+def collar_coordinates(boreholes):
+    """ Return the collar longitudes and latitudes of some boreholes as
+        arrays
+
+        Latitudes and longitudes with units are converted to degrees.
+        Boreholes without an origin position get NaN coordinates.
+
+        :param boreholes: The boreholes
+        :type boreholes: iterable of `pysiss.borehole.Borehole`s
+        :returns: two float `numpy.ndarray`s, `(longitude, latitude)`
+    """
+    coords = numpy.array([collar_position(borehole)[:2]
+                          for borehole in boreholes], dtype=numpy.float_)
+    coords = coords.reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
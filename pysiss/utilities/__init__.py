@@ -10,5 +10,8 @@
 from maths import *
 from collection import Collection
 from id_object import id_object
-# from projection import project
+from projection import project, project_many, get_transformer, \
+    transform_coordinates, normalize_srs, is_latitude_first, collar_position
 from singleton import Singleton
+from spatial_index import STRTree
+from units import get_unit_registry, parse_units
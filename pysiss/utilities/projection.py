@@ -1,34 +1,280 @@
 """ file: projection.py (pysiss.utilities)
 
     description: Projection utilities
+
+    Coordinates are transformed with pyproj, which bundles the PROJ library
+    and its database so that no network access is required. Building a
+    transformer means searching the PROJ database for the best operation
+    between the two coordinate reference systems, so we cache a transformer
+    for each (source, target) pair. Geometries are transformed by gathering
+    all their coordinates into one array and transforming it in a single
+    call.
+
+    All transformers use x = easting/longitude, y = northing/latitude order,
+    regardless of the axis order defined by the reference system. GML
+    coordinates are often given in the axis order of the reference system
+    instead (e.g. latitude first for EPSG:4326), so the transform functions
+    take a `swap_axes` argument to swap the input coordinates first. By
+    default the axes are swapped for OGC URN srsNames (e.g.
+    'urn:ogc:def:crs:EPSG::4326') whose reference system has northing or
+    latitude first, since these explicitly use the reference system's axis
+    order. Short names like 'EPSG:4326' are ambiguous, so we assume x/y
+    order for them unless told otherwise.
 """
 
-# from osgeo import ogr
-# from shapely.wkb import loads
+from shapely.geometry import Point, LineString, LinearRing, Polygon, \
+    MultiPoint, MultiLineString, MultiPolygon, GeometryCollection
+import numpy
+import pyproj
+import re
+import threading
+
+from units import get_unit_registry
+
+_TRANSFORMERS = {}
+_TRANSFORMERS_LOCK = threading.Lock()
+_LATITUDE_FIRST = {}
+_CONVERSIONS = {}
+
+
+def normalize_srs(srs):
+    """ Convert a spatial reference system identifier to an 'EPSG:xxxx'
+        string where possible
+
+        This handles EPSG codes given as integers, and srsName values such as
+        'EPSG:4326', 'urn:ogc:def:crs:EPSG::4326',
+        'urn:ogc:def:crs:EPSG:6.6:4326' and
+        'http://www.opengis.net/gml/srs/epsg.xml#4326'. Anything else is
+        returned unchanged for pyproj to interpret.
+    """
+    if isinstance(srs, (int, long)):
+        return 'EPSG:{0}'.format(srs)
+    match = re.search(r'epsg.*?(\d+)\s*$', srs, re.IGNORECASE)
+    if match:
+        return 'EPSG:{0}'.format(match.group(1))
+    return srs.strip()
+
+
+def is_latitude_first(srs):
+    """ Return whether coordinates in a reference system identifier are
+        given with northing or latitude first
+
+        Only OGC URN srsNames (e.g. 'urn:ogc:def:crs:EPSG::4326') are
+        taken to use the reference system's own axis order; coordinates for
+        any other kind of identifier are taken to be in x/y order.
+
+        :param srs: The identifier for the reference system
+        :type srs: string or int
+        :returns: True if the first coordinate is a northing or latitude
+    """
+    if isinstance(srs, (int, long)) \
+            or not re.match(r'\s*urn:ogc:def:crs:', srs, re.IGNORECASE):
+        return False
+    srs = normalize_srs(srs)
+    if srs not in _LATITUDE_FIRST:
+        axes = pyproj.CRS(srs).axis_info
+        _LATITUDE_FIRST[srs] = bool(axes) \
+            and axes[0].direction.lower() in ('north', 'south')
+    return _LATITUDE_FIRST[srs]
+
+
+def get_transformer(source, target):
+    """ Return a cached transformer between two spatial reference systems
+
+        :param source: The identifier for the source reference system
+        :type source: string or int
+        :param target: The identifier for the target reference system
+        :type target: string or int
+        :returns: a `pyproj.Transformer`
+    """
+    key = (normalize_srs(source), normalize_srs(target))
+    transformer = _TRANSFORMERS.get(key)
+    if transformer is None:
+        with _TRANSFORMERS_LOCK:
+            transformer = _TRANSFORMERS.get(key)
+            if transformer is None:
+                transformer = _TRANSFORMERS[key] = \
+                    pyproj.Transformer.from_crs(key[0], key[1],
+                                                always_xy=True)
+    return transformer
+
+
+def transform_coordinates(coords, source, target, swap_axes=None):
+    """ Transform an array of coordinates between reference systems
+
+        Only the first two columns are transformed; any other columns (e.g.
+        heights) are copied unchanged. The transformed coordinates are always
+        in x/y (easting/northing or longitude/latitude) order.
+
+        :param coords: The coordinates, one row per point
+        :type coords: `numpy.ndarray` with shape `(n, dim)`
+        :param source: The identifier for the source reference system
+        :type source: string or int
+        :param target: The identifier for the target reference system
+        :type target: string or int
+        :param swap_axes: Whether the first two columns of coords are in
+            y/x (e.g. latitude/longitude) order. Optional, if None this is
+            worked out from the source identifier with `is_latitude_first`.
+        :type swap_axes: bool
+        :returns: a new float array with the same shape as coords
+        :raises: ValueError if any finite coordinates can't be transformed,
+            which usually means the axes are in the wrong order.
+    """
+    coords = numpy.array(coords, dtype=numpy.float_, ndmin=2)
+    if swap_axes is None:
+        swap_axes = is_latitude_first(source)
+    if swap_axes:
+        coords[:, [0, 1]] = coords[:, [1, 0]]
+    if len(coords) and normalize_srs(source) != normalize_srs(target):
+        finite = numpy.isfinite(coords[:, :2]).all(axis=1)
+        x, y = get_transformer(source, target).transform(
+            coords[:, 0], coords[:, 1])
+        coords[:, 0], coords[:, 1] = x, y
+        failed = finite & ~numpy.isfinite(coords[:, :2]).all(axis=1)
+        if failed.any():
+            raise ValueError(
+                "Can't transform {0} coordinates from {1} to {2} (the first "
+                "is row {3}) - check that the coordinates are in the right "
+                "reference system and axis order".format(
+                    failed.sum(), source, target,
+                    numpy.flatnonzero(failed)[0]))
+    return coords
+
+
+def project(geom, to_srs, from_srs='EPSG:4326', swap_axes=None):
+    """ Transform a shapely geometry to a new reference system
+
+        Example usage:
+
+            >>> from shapely.geometry import LineString
+            >>> l = LineString([[-121, 43], [-122, 42]])
+            >>> lp = project(l, to_srs=26910, from_srs=4326)
+
+        :param geom: The geometry to transform
+        :type geom: shapely geometry
+        :param to_srs: The identifier for the target reference system
+        :type to_srs: string or int
+        :param from_srs: The identifier for the source reference system.
+            Optional, defaults to 'EPSG:4326'.
+        :type from_srs: string or int
+        :param swap_axes: Whether the geometry coordinates are in y/x order.
+            Optional, see `transform_coordinates`.
+        :type swap_axes: bool
+        :returns: a new shapely geometry
+    """
+    return project_many([geom], to_srs, from_srs, swap_axes)[0]
+
+
+def project_many(geoms, to_srs, from_srs='EPSG:4326', swap_axes=None):
+    """ Transform a list of shapely geometries to a new reference system
+
+        The coordinates of all the geometries are transformed as one
+        contiguous array, so this is much faster than projecting each
+        geometry separately.
+
+        :param geoms: The geometries to transform, which should all be in
+            the same reference system
+        :type geoms: list of shapely geometries
+        :param to_srs: The identifier for the target reference system
+        :type to_srs: string or int
+        :param from_srs: The identifier for the source reference system.
+            Optional, defaults to 'EPSG:4326'.
+        :type from_srs: string or int
+        :param swap_axes: Whether the geometry coordinates are in y/x order.
+            Optional, see `transform_coordinates`.
+        :type swap_axes: bool
+        :returns: a list of new shapely geometries
+    """
+    arrays = []
+    for geom in geoms:
+        _coordinate_arrays(geom, arrays)
+    if not arrays:
+        return list(geoms)
+
+    # Transform everything at once, then split up again
+    xy = numpy.concatenate([array[:, :2] for array in arrays])
+    xy = transform_coordinates(xy, from_srs, to_srs, swap_axes)
+    splits = numpy.cumsum([len(array) for array in arrays])[:-1]
+    transformed = iter([
+        numpy.column_stack([new_xy, array[:, 2:]])
+        for new_xy, array in zip(numpy.split(xy, splits), arrays)])
+    return [_rebuild(geom, transformed) for geom in geoms]
+
+
+def collar_position(borehole):
+    """ Return the longitude and latitude in degrees and the elevation in
+        metres of a borehole's collar
+
+        Quantities with units are converted, and plain numbers are assumed
+        to be in the right units already. A missing latitude or longitude
+        is NaN, and a missing elevation is taken as zero.
 
+        :param borehole: The borehole
+        :type borehole: `pysiss.borehole.Borehole`
+        :returns: a `(longitude, latitude, elevation)` tuple, which is all
+            NaNs if the borehole has no origin position
+    """
+    position = borehole.origin_position
+    if position is None:
+        return numpy.nan, numpy.nan, numpy.nan
+    unit_reg = get_unit_registry()
+    return (_magnitude(position.longitude, unit_reg.degree, numpy.nan),
+            _magnitude(position.latitude, unit_reg.degree, numpy.nan),
+            _magnitude(position.elevation, unit_reg.meter, 0.))
 
-# def project(geom, to_epsg=900913, from_epsg=4326):
-#     """utility function to do quick projection with ogr,
-#     to and from shapely objects
 
-#         >>> from shapely.geometry import LineString
-#         >>> l = LineString([[-121, 43], [-122, 42]])
-#         >>> lp = project(l, from_epsg=4326, to_epsg=26910)
-#         >>> lp.wkt
-#         'LINESTRING (663019.0700828594854102 4762755.6415722491219640,
-#             582818.0692490270594135 4650259.8474613213911653)'
+def _magnitude(value, units, default):
+    """ Return the magnitude of a value in the given units
 
-#         Stolen from http://hackmap.blogspot.com.au/2008/03/ogr-python-projection.html
-#     """
+        Conversion factors are cached for each pair of units, so that we
+        only ask pint to convert each unit once.
+    """
+    if value is None:
+        return default
+    try:
+        value_units, magnitude = value.units, value.magnitude
+    except AttributeError:
+        return float(value)
+    try:
+        factor = _CONVERSIONS[value_units, units]
+    except KeyError:
+        factor = _CONVERSIONS[value_units, units] = \
+            (1 * value_units).to(units).magnitude
+    return float(magnitude * factor)
 
-#     to_srs = ogr.osr.SpatialReference()
-#     to_srs.ImportFromEPSG(to_epsg)
 
-#     from_srs = ogr.osr.SpatialReference()
-#     from_srs.ImportFromEPSG(from_epsg)
+def _coordinate_arrays(geom, arrays):
+    """ Append the coordinate arrays of each part of a geometry to a list
+    """
+    if isinstance(geom, Polygon):
+        if not geom.is_empty:
+            arrays.append(numpy.asarray(geom.exterior.coords))
+            arrays.extend(numpy.asarray(ring.coords)
+                          for ring in geom.interiors)
+    elif isinstance(geom, (Point, LineString, LinearRing)):
+        if not geom.is_empty:
+            arrays.append(numpy.asarray(geom.coords))
+    elif hasattr(geom, 'geoms'):
+        for part in geom.geoms:
+            _coordinate_arrays(part, arrays)
+    else:
+        raise TypeError('Unknown geometry type {0}'.format(geom.geom_type))
 
-#     ogr_geom = ogr.CreateGeometryFromWkb(geom.wkb)
-#     ogr_geom.AssignSpatialReference(from_srs)
 
-#     ogr_geom.TransformTo(to_srs)
-#     return loads(ogr_geom.ExportToWkb())
+def _rebuild(geom, transformed):
+    """ Rebuild a geometry from an iterator over the transformed coordinate
+        arrays of its parts, in the order of `_coordinate_arrays`
+    """
+    if geom.is_empty and not hasattr(geom, 'geoms'):
+        return geom
+    elif isinstance(geom, Polygon):
+        return Polygon(next(transformed),
+                       [next(transformed) for _ in geom.interiors])
+    elif isinstance(geom, Point):
+        return Point(next(transformed)[0])
+    elif isinstance(geom, (LineString, LinearRing)):
+        return type(geom)(next(transformed))
+    elif isinstance(geom, (MultiPoint, MultiLineString, MultiPolygon,
+                           GeometryCollection)):
+        return type(geom)([_rebuild(part, transformed)
+                           for part in geom.geoms])
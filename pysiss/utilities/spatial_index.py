@@ -0,0 +1,217 @@
+""" file:   spatial_index.py (pysiss.utilities)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Tuesday 20 January, 2015
+
+    description: A bulk-loaded R-tree for bounding box queries
+
+    The tree is packed using the Sort-Tile-Recursive (STR) algorithm
+    (Leutenegger et al., 1997): the boxes are sorted into vertical slices by
+    the x coordinate of their centres, then by y within each slice, and runs
+    of `node_capacity` boxes become the leaves of the tree. Each level above
+    that is formed from runs of `node_capacity` nodes of the level below, so
+    the children of every node are contiguous and each level is just an
+    array of bounding boxes. Queries walk down the levels using numpy
+    operations on all the (query, node) pairs at once, so a batch of queries
+    costs about as much Python overhead as a single one.
+"""
+
+import heapq
+import numpy
+
+
+class STRTree(object):
+
+    """ A static R-tree over a set of bounding boxes
+
+        Example usage:
+
+            tree = STRTree([shape.bounds for shape in shapes])
+            hits = tree.query((0, 0, 1, 1))
+            point_idx, shape_idx = tree.query_points(xs, ys)
+
+        :param bounds: The `(minx, miny, maxx, maxy)` bounding box of each
+            item
+        :type bounds: `numpy.ndarray` with shape `(n, 4)`
+        :param node_capacity: The maximum number of children for each node.
+            Optional, defaults to 16.
+        :type node_capacity: int
+    """
+
+    def __init__(self, bounds, node_capacity=16):
+        super(STRTree, self).__init__()
+        assert node_capacity > 1, "nodes must have at least two children"
+        bounds = numpy.asarray(bounds, dtype=numpy.float_).reshape(-1, 4)
+        self.node_capacity = int(node_capacity)
+        self.size = len(bounds)
+
+        # order maps each leaf slot back to the item index
+        self.order = _str_order(bounds, self.node_capacity)
+        self.levels = [bounds[self.order]]
+        while len(self.levels[-1]) > self.node_capacity:
+            self.levels.append(
+                _group_bounds(self.levels[-1], self.node_capacity))
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        info = 'STRTree with {0} items and {1} levels'
+        return info.format(self.size, len(self.levels))
+
+    def query(self, bbox):
+        """ Return the items whose bounding boxes intersect a box
+
+            :param bbox: The `(minx, miny, maxx, maxy)` box to query
+            :type bbox: tuple
+            :returns: a sorted array of item indices
+        """
+        _, items = self.query_bounds([bbox])
+        return items
+
+    def query_bounds(self, bounds):
+        """ Find the items whose bounding boxes intersect each of a set of
+            boxes
+
+            :param bounds: The `(minx, miny, maxx, maxy)` boxes to query
+            :type bounds: `numpy.ndarray` with shape `(m, 4)`
+            :returns: two integer arrays `(query_idx, item_idx)` with one
+                entry for each intersecting pair, sorted by query and then
+                by item.
+        """
+        bounds = numpy.asarray(bounds, dtype=numpy.float_).reshape(-1, 4)
+        empty = numpy.array([], dtype=numpy.int_)
+        if self.size == 0 or len(bounds) == 0:
+            return empty, empty
+
+        # Start with every query against every node at the top level
+        nnodes = len(self.levels[-1])
+        query = numpy.repeat(numpy.arange(len(bounds)), nnodes)
+        node = numpy.tile(numpy.arange(nnodes), len(bounds))
+        offsets = numpy.arange(self.node_capacity)
+        for depth in range(len(self.levels) - 1, -1, -1):
+            keep = _intersects(bounds[query], self.levels[depth][node])
+            query, node = query[keep], node[keep]
+            if depth == 0:
+                break
+
+            # Replace each node with its children
+            query = numpy.repeat(query, self.node_capacity)
+            node = (node[:, numpy.newaxis] * self.node_capacity
+                    + offsets).ravel()
+            valid = node < len(self.levels[depth - 1])
+            query, node = query[valid], node[valid]
+
+        items = self.order[node]
+        idx = numpy.lexsort((items, query))
+        return query[idx], items[idx]
+
+    def query_points(self, x, y):
+        """ Find the items whose bounding boxes contain each of a set of
+            points
+
+            :param x, y: The point coordinates
+            :type x, y: `numpy.ndarray`
+            :returns: two integer arrays `(point_idx, item_idx)` with one
+                entry for each (point, item) pair, sorted by point and then
+                by item.
+        """
+        x = numpy.asarray(x, dtype=numpy.float_).ravel()
+        y = numpy.asarray(y, dtype=numpy.float_).ravel()
+        return self.query_bounds(numpy.column_stack([x, y, x, y]))
+
+    def nearest(self, x, y, k=1, distance=None):
+        """ Find the k nearest items to a point
+
+            The tree is searched best-first, so only the nodes closer than
+            the kth nearest item are visited.
+
+            :param x, y: The point coordinates
+            :type x, y: float
+            :param k: The number of items to return. Optional, defaults to 1.
+            :type k: int
+            :param distance: A function returning the exact distance from
+                the point to an item, given the item index. The distance must
+                be at least the distance to the item's bounding box. Optional,
+                defaults to the distance to the bounding box.
+            :type distance: callable
+            :returns: a list of up to k `(item_idx, distance)` tuples, sorted
+                by distance.
+        """
+        results = []
+        if self.size == 0 or k < 1:
+            return results
+
+        # Heap entries are (distance, depth, index), where depth -1 marks an
+        # item whose exact distance is known
+        top = len(self.levels) - 1
+        heap = [(dist, top, idx) for idx, dist in
+                enumerate(_box_distance(self.levels[top], x, y))]
+        heapq.heapify(heap)
+        while heap and len(results) < k:
+            dist, depth, idx = heapq.heappop(heap)
+            if depth == -1:
+                results.append((idx, dist))
+            elif depth == 0:
+                item = self.order[idx]
+                if distance is None:
+                    results.append((item, dist))
+                else:
+                    heapq.heappush(heap, (distance(item), -1, item))
+            else:
+                start = idx * self.node_capacity
+                end = min(start + self.node_capacity,
+                          len(self.levels[depth - 1]))
+                children = self.levels[depth - 1][start:end]
+                for child, dist in enumerate(_box_distance(children, x, y)):
+                    heapq.heappush(heap, (dist, depth - 1, start + child))
+        return results
+
+
+def _str_order(bounds, node_capacity):
+    """ Return the order of the items in the leaves of an STR-packed tree
+    """
+    size = len(bounds)
+    centre_x = (bounds[:, 0] + bounds[:, 2]) / 2.
+    centre_y = (bounds[:, 1] + bounds[:, 3]) / 2.
+    nleaves = max(-(-size // node_capacity), 1)
+    slice_size = int(numpy.ceil(numpy.sqrt(nleaves))) * node_capacity
+
+    # Sort into vertical slices, then by y within each slice. Alternate
+    # slices run in opposite directions, so that consecutive leaves (which
+    # end up in the same parent node) are close together.
+    by_x = numpy.argsort(centre_x, kind='mergesort')
+    order = numpy.empty(size, dtype=numpy.int_)
+    for nslice, start in enumerate(range(0, size, slice_size)):
+        idx = by_x[start:start + slice_size]
+        idx = idx[numpy.argsort(centre_y[idx], kind='mergesort')]
+        if nslice % 2:
+            idx = idx[::-1]
+        order[start:start + len(idx)] = idx
+    return order
+
+
+def _group_bounds(bounds, node_capacity):
+    """ Return the bounding boxes of consecutive groups of boxes
+    """
+    starts = numpy.arange(0, len(bounds), node_capacity)
+    return numpy.column_stack([
+        numpy.minimum.reduceat(bounds[:, 0], starts),
+        numpy.minimum.reduceat(bounds[:, 1], starts),
+        numpy.maximum.reduceat(bounds[:, 2], starts),
+        numpy.maximum.reduceat(bounds[:, 3], starts)])
+
+
+def _intersects(first, second):
+    """ Return whether each pair of boxes intersects
+    """
+    return ((first[:, 0] <= second[:, 2]) & (first[:, 2] >= second[:, 0])
+            & (first[:, 1] <= second[:, 3]) & (first[:, 3] >= second[:, 1]))
+
+
+def _box_distance(bounds, x, y):
+    """ Return the distance from a point to each of a set of boxes
+    """
+    dx = numpy.maximum(numpy.maximum(bounds[:, 0] - x, x - bounds[:, 2]), 0)
+    dy = numpy.maximum(numpy.maximum(bounds[:, 1] - y, y - bounds[:, 3]), 0)
+    return numpy.hypot(dx, dy)
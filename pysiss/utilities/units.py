@@ -0,0 +1,58 @@
+""" file:   units.py (pysiss.utilities)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Monday 19 January, 2015
+
+    description: A shared pint unit registry
+
+    Building a `pint.UnitRegistry` means parsing pint's whole unit definition
+    file, which takes a substantial fraction of a second. Units from
+    different registries also can't be combined. So we create one registry
+    the first time it's needed and share it across the whole process, and
+    keep the units for each label that we've parsed so that repeated
+    lookups are just a dictionary hit.
+"""
+
+import threading
+from pint import UnitRegistry
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+_UNITS = {}
+
+
+def get_unit_registry():
+    """ Return the shared pint UnitRegistry, creating it if required
+
+        Example usage:
+
+            unit_reg = get_unit_registry()
+            depth = 10 * unit_reg.meter
+
+        :returns: a `pint.UnitRegistry`
+    """
+    global _REGISTRY
+    if _REGISTRY is None:
+        with _REGISTRY_LOCK:
+            if _REGISTRY is None:
+                _REGISTRY = UnitRegistry()
+    return _REGISTRY
+
+
+def parse_units(label):
+    """ Return the units for a label (e.g. a GeoSciML uomLabels attribute)
+        from the shared registry.
+
+        The result for each label is cached, so only the first lookup of a
+        given label has to be parsed by pint.
+
+        :param label: The unit label, e.g. 'm' or 'meter'
+        :type label: string
+        :returns: a `pint.Quantity` with a magnitude of one in the given
+            units
+    """
+    try:
+        return _UNITS[label]
+    except KeyError:
+        units = _UNITS[label] = get_unit_registry()[label]
+        return units
@@ -0,0 +1,20 @@
+""" file:   errors.py (pysiss.vocabulary)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Monday 19 January, 2015
+
+    description: Exceptions raised while unmarshalling XML
+"""
+
+
+class UnmarshalError(ValueError):
+
+    """ Raised when the XML being unmarshalled is malformed.
+
+        The position of the error in the XML is stored in `position` as a
+        `(line, column)` tuple.
+    """
+
+    def __init__(self, message, position=None):
+        super(UnmarshalError, self).__init__(message)
+        self.position = position
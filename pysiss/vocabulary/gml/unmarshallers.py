@@ -8,19 +8,80 @@
 
 from shapely.geometry import Polygon, LineString
 from ..namespaces import NamespaceRegistry
+from ..errors import UnmarshalError
+
+import numpy
 
 NAMESPACES = NamespaceRegistry()
 
 
+def parse_coordinates(text, dimension=2):
+    """ Parse a whitespace-delimited list of coordinates into an array
+
+        Line breaks are treated like any other whitespace, so this works
+        whether or not each vertex is on its own line.
+
+        :param text: The coordinate values
+        :type text: string
+        :param dimension: The number of values in each coordinate. Optional,
+            defaults to 2.
+        :type dimension: int
+        :returns: a float `numpy.ndarray` with shape `(n, dimension)`
+        :raises: `UnmarshalError` if any of the values aren't numbers, or
+            if the number of values isn't a multiple of the dimension
+    """
+    tokens = text.split()
+    try:
+        values = numpy.array(tokens, dtype=numpy.float_)
+    except ValueError:
+        # Find the value that failed, for the error message
+        for idx, token in enumerate(tokens):
+            try:
+                float(token)
+            except ValueError:
+                raise UnmarshalError(
+                    'Could not parse coordinate value {0!r} (value {1} of '
+                    '{2})'.format(token, idx + 1, len(tokens)))
+        raise
+    if values.size % dimension:
+        raise UnmarshalError(
+            'Got {0} coordinate values, which is not a multiple of the '
+            'dimension ({1})'.format(values.size, dimension))
+    return values.reshape(-1, dimension)
+
+
 def position(elem):
     """ Unmarshal a gml:posList, gml:pos or gml:coordinates element
+
+        The coordinates are returned as a float array with one row per
+        vertex. For posList and pos elements the number of values per vertex
+        is taken from the srsDimension attribute on the element or its
+        nearest ancestor (defaulting to 2). For coordinates elements the
+        tuple, coordinate and decimal separators are taken from the ts, cs
+        and decimal attributes.
     """
-    if elem.text:
-        token_pairs = elem.text.split('\n')[1:-1]
-        return [map(float, p.split()) for p in token_pairs]
-    else:
+    text = elem.text
+    if not text or not text.strip():
         return None
 
+    if elem.tag.endswith('}coordinates'):
+        decimal = elem.get('decimal', '.')
+        cs, ts = elem.get('cs', ','), elem.get('ts', ' ')
+        if ts.isspace():
+            first = text.split(None, 1)[0]
+        else:
+            first = text.strip().split(ts, 1)[0]
+            text = text.replace(ts, ' ')
+        dimension = first.count(cs) + 1
+        text = text.replace(cs, ' ')
+        if decimal != '.':
+            text = text.replace(decimal, '.')
+    else:
+        dimension = elem.xpath(
+            'ancestor-or-self::*[@srsDimension][1]/@srsDimension')
+        dimension = int(dimension[0]) if dimension else 2
+    return parse_coordinates(text, dimension)
+
 
 def polygon(elem):
     """ Unmarshal a gml:Polygon element
@@ -77,4 +138,4 @@ UNMARSHALLERS = {
     'gml:description': description,
 }
 
-__all__ = (position, polygon, linestring, UNMARSHALLERS)
+__all__ = (parse_coordinates, position, polygon, linestring, UNMARSHALLERS)
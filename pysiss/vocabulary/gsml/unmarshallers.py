@@ -72,7 +72,7 @@ def get_value(elem):
         Returns the text value for a given element, stripping out children of
         the given element
     """
-    return elem.find('.//gsml:value/text()', namespaces=NAMESPACES)
+    return elem.findtext('.//gsml:value', namespaces=NAMESPACES)
 
 
 def cgi_termrange(elem):
@@ -6,12 +6,21 @@
     description: Wrapper functionality for unmarshalling XML elements
 """
 
-from .namespaces import shorten_namespace, expand_namespace
+from .namespaces import shorten_namespace, expand_namespace, \
+    split_namespace
 from .gml import unmarshallers as gml
 from .gsml import unmarshallers as gsml
 from .erml import unmarshallers as erml
+from .errors import UnmarshalError
+from ..metadata import Metadata, MetadataRegistry
 
 from lxml import etree
+from StringIO import StringIO
+from xml.sax.saxutils import quoteattr
+import bisect
+import mmap
+import multiprocessing
+import re
 
 UNMARSHALLERS = {}
 UNMARSHALLERS.update(gml.UNMARSHALLERS)
@@ -36,14 +45,285 @@ def unmarshal(elem):
 def unmarshal_all(filename, tag='gsml:MappedFeature'):
     """ Unmarshall all instances of a tag from an xml file
         and return them as a list of objects
+
+        See `iter_unmarshal` for a version which doesn't keep all the
+        objects in memory at once.
     """
-    tag = expand_namespace(tag)
-    results = []
+    return list(iter_unmarshal(filename, tags=tag))
+
+
+def iter_unmarshal(source, tags='gsml:MappedFeature'):
+    """ Unmarshal all instances of the given tags from an XML document,
+        generating the objects one at a time.
+
+        The document is parsed incrementally, and each element is cleared
+        once it has been unmarshalled, along with all the earlier siblings
+        of the element and of its ancestors. This means that the memory used
+        doesn't grow with the size of the document (beyond whatever the
+        unmarshalled objects themselves hold on to), so this can be used on
+        multi-gigabyte WFS dumps.
+
+        Example usage:
+
+            for feature in iter_unmarshal('geology.xml'):
+                ...
+
+            response = requests.get(wfs_url, params=params, stream=True)
+            for feature in iter_unmarshal(response):
+                ...
+
+        :param source: The XML document. This can be a filename, an open
+            file-like object or a streamed `requests.Response`.
+        :type source: string, file-like object or `requests.Response`
+        :param tags: The tags to unmarshal, with shortened namespaces.
+            Optional, defaults to gsml:MappedFeature.
+        :type tags: string or list of strings
+        :returns: an iterator over the unmarshalled objects
+        :raises: `UnmarshalError` if the document is malformed, with the
+            position of the error.
+    """
+    if isinstance(tags, basestring):
+        tags = [tags]
+    tags = set(expand_namespace(tag) for tag in tags)
+
+    # Work out what we're reading from
+    opened = isinstance(source, basestring)
+    if opened:
+        fhandle = open(source, 'rb')
+    elif hasattr(source, 'raw') and hasattr(source, 'iter_content'):
+        # A requests response, make sure we get decompressed content
+        fhandle = source.raw
+        fhandle.decode_content = True
+    else:
+        fhandle = source
+
+    count = 0
+    try:
+        context = etree.iterparse(fhandle, events=('end',), tag=tags,
+                                  huge_tree=True)
+        for _, elem in context:
+            yield unmarshal(elem)
+            count += 1
+
+            # Elements nested inside other requested elements are cleared
+            # along with their ancestor
+            if any(ancestor.tag in tags for ancestor in elem.iterancestors()):
+                continue
+
+            # Drop the element and everything before it from the tree
+            elem.clear()
+            for ancestor in elem.iterancestors():
+                while ancestor.getprevious() is not None:
+                    del ancestor.getparent()[0]
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+    except etree.XMLSyntaxError, err:
+        name = getattr(fhandle, 'name', None) or 'XML document'
+        raise UnmarshalError(
+            'Error parsing {0} at line {1}, column {2} (after {3} '
+            'elements): {4}'.format(name, err.position[0], err.position[1],
+                                    count, err.msg),
+            position=err.position)
+
+    finally:
+        if opened:
+            fhandle.close()
+
+
+def unmarshal_parallel(filename, tag='gsml:MappedFeature', processes=None,
+                       chunks_per_process=4):
+    """ Unmarshal all instances of a tag from an XML file using a pool of
+        processes, generating the objects one at a time.
+
+        The file is split into chunks of whole elements by scanning for the
+        element's start and end tags, and each chunk is parsed and
+        unmarshalled in a separate process. The Metadata records created by
+        each process are sent back and registered in this process's
+        MetadataRegistry, and the objects are generated in the same order as
+        they appear in the file, so the results are the same as for
+        `iter_unmarshal`.
+
+        The unmarshalled objects must be picklable. Files which can't be
+        split safely by scanning for tags (for example because the elements
+        are nested or self-closing, or appear inside comments) are
+        unmarshalled serially with `iter_unmarshal` instead.
+
+        Example usage:
+
+            features = list(unmarshal_parallel('geology.xml', processes=32))
+
+        :param filename: The path to the XML document
+        :type filename: string
+        :param tag: The tag to unmarshal, with a shortened namespace.
+            Optional, defaults to gsml:MappedFeature.
+        :type tag: string
+        :param processes: The number of processes to use. Optional, defaults
+            to the number of CPUs.
+        :type processes: int
+        :param chunks_per_process: The number of chunks to split the file
+            into for each process. More chunks balance the load better but
+            add overhead.
+        :type chunks_per_process: int
+        :returns: an iterator over the unmarshalled objects
+    """
+    processes = processes or multiprocessing.cpu_count()
+    split = _element_ranges(filename, tag)
+    if split is None:
+        # Can't split the file safely, so just unmarshal it in this process
+        for result in iter_unmarshal(filename, tags=tag):
+            yield result
+        return
+    header, ranges, footer = split
+    if not ranges:
+        return
+
+    # Split the elements into chunks of roughly equal size
+    nchunks = min(len(ranges), processes * chunks_per_process)
+    target_size = sum(end - start for start, end in ranges) / nchunks
+    tasks, chunk, chunk_size = [], [], 0
+    for start, end in ranges:
+        chunk.append((start, end))
+        chunk_size += end - start
+        if chunk_size >= target_size:
+            tasks.append((filename, chunk, header, footer, tag))
+            chunk, chunk_size = [], 0
+    if chunk:
+        tasks.append((filename, chunk, header, footer, tag))
+
+    registry = MetadataRegistry()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for results, metadata in pool.imap(_unmarshal_ranges, tasks):
+            # Merge metadata first, so that the objects can refer to it
+            for ident, mdata_type, tree in metadata:
+                if ident not in registry:
+                    Metadata(ident=ident, type=mdata_type,
+                             tree=etree.fromstring(tree))
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _element_ranges(filename, tag):
+    """ Find the byte ranges of every instance of a tag in an XML file
+
+        Scanning for tags is only safe when the elements can be lifted out
+        of the document as they are, so this gives up (returning None) if
+        any of the elements are self-closing or nested, if the tag appears
+        in a comment, CDATA section or processing instruction, if the
+        document has a DOCTYPE (which might define entities), if the tag's
+        namespace is bound to more than one prefix, or if there are
+        namespace declarations between the elements.
+
+        :returns: a `(header, ranges, footer)` tuple, where `ranges` is a
+            list of `(start, end)` byte offsets, and `header` and `footer`
+            are the start and end tags of a root element declaring all the
+            namespaces in scope at the first element, so that
+            `header + elements + footer` is a well-formed document. Returns
+            None if the file can't be split safely.
+    """
+    expanded = expand_namespace(tag)
+    namespace, local_name = split_namespace(expanded)
     with open(filename, 'rb') as fhandle:
         try:
-            context = iter(etree.iterparse(fhandle, events=('end',), tag=tag))
-            for event, elem in context:
-                results.append(unmarshal(elem))
-        except etree.XMLSyntaxError:
-            pass
-    return results
+            mapped = mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return None, [], None
+        try:
+            # Let the parser work out the namespaces in scope at the first
+            # element, rather than guessing which declarations apply
+            try:
+                for _, elem in etree.iterparse(
+                        filename, events=('start',), tag=expanded,
+                        huge_tree=True):
+                    nsmap, prefix = dict(elem.nsmap), elem.prefix
+                    break
+                else:
+                    return None, [], None
+            except etree.XMLSyntaxError:
+                return None
+            qname = (prefix + ':' if prefix else '') + local_name
+
+            # Markup that might hide or fake a tag
+            for match in re.finditer(
+                    r'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<!DOCTYPE',
+                    mapped, re.DOTALL):
+                if match.group(0) == '<!DOCTYPE' or qname in match.group(0):
+                    return None
+
+            # Find the start and end of each element
+            ranges = []
+            start_tag = re.compile(
+                r'<{0}(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*\s*'
+                r'(/?)>'.format(re.escape(qname)))
+            end_tag = re.compile(r'</{0}\s*>'.format(re.escape(qname)))
+            for match in re.finditer(
+                    r'<{0}[\s>/]'.format(re.escape(qname)), mapped):
+                start = match.start()
+                match = start_tag.match(mapped, start)
+                if match is None or match.group(1) \
+                        or (ranges and start < ranges[-1][1]):
+                    # Malformed, self-closing or nested
+                    return None
+                end = end_tag.search(mapped, match.end())
+                if end is None:
+                    raise UnmarshalError('Unclosed <{0}> element at byte '
+                                         '{1}'.format(qname, start))
+                ranges.append((start, end.end()))
+            if not ranges:
+                return None, [], None
+
+            # Namespace declarations after the first element must be inside
+            # an element, and can't rebind the tag's prefix or namespace
+            starts = [start for start, _ in ranges]
+            for decl in re.finditer(
+                    r'xmlns(?::([\w.-]+))?\s*=\s*(?:"([^"]*)"|\'([^\']*)\')',
+                    mapped):
+                uri = decl.group(2) if decl.group(2) is not None \
+                    else decl.group(3)
+                if (uri == namespace) != (decl.group(1) == prefix):
+                    return None
+                if decl.start() > starts[0]:
+                    index = bisect.bisect_right(starts, decl.start()) - 1
+                    if decl.end() > ranges[index][1]:
+                        return None
+
+            header = '<chunk {0}>'.format(' '.join(
+                'xmlns{0}={1}'.format(':' + key if key else '',
+                                      quoteattr(value))
+                for key, value in sorted(nsmap.items())))
+            return header, ranges, '</chunk>'
+        finally:
+            mapped.close()
+
+
+def _unmarshal_ranges(args):
+    """ Unmarshal the elements in the given byte ranges of a file
+
+        This runs in a worker process for `unmarshal_parallel`, and returns
+        the unmarshalled objects along with the Metadata records created
+        while unmarshalling them, serialized as
+        `(ident, type, xml string)` tuples.
+    """
+    filename, ranges, header, footer, tag = args
+    registry = MetadataRegistry()
+    registry.clear()
+
+    parts = [header]
+    with open(filename, 'rb') as fhandle:
+        for start, end in ranges:
+            fhandle.seek(start)
+            parts.append(fhandle.read(end - start))
+    parts.append(footer)
+
+    results = list(iter_unmarshal(StringIO(''.join(parts)), tags=tag))
+    metadata = [(ident, registry[ident].type,
+                 etree.tostring(registry[ident].tree))
+                for ident in sorted(registry.keys())]
+    registry.clear()
+    return results, metadata
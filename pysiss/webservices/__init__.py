@@ -8,5 +8,6 @@
 """
 
 import nvcl
+import cache
 
-__all__ = [nvcl]
+__all__ = [nvcl, cache]
@@ -0,0 +1,430 @@
+""" file:   cache.py (pysiss.webservices)
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Sunday 18 January, 2015
+
+    description: A persistent on-disk cache for web service responses
+
+    Responses are stored by the SHA1 hash of their content as compressed
+    files, so identical responses from different URLs are only stored once.
+    An SQLite index maps each (normalized) request URL to a stored response,
+    and keeps track of when each response was stored and last used so that
+    we can expire stale responses and evict the least recently used ones when
+    the cache gets too big.
+"""
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+
+
+class CacheMiss(IOError):
+
+    """ Raised when a response isn't in the cache and we're working offline
+    """
+
+    pass
+
+
+def normalize_url(url, params=None):
+    """ Normalize a URL so that equivalent requests have the same key
+
+        The scheme and host are lowercased, empty query parameters are
+        dropped and the remaining query parameters are sorted.
+
+        :param url: The URL to normalize
+        :type url: string
+        :param params: Extra query parameters to add to the URL. Optional.
+        :type params: dict
+        :returns: the normalized URL as a string
+    """
+    parts = urlparse.urlsplit(url)
+    query = [(k, v) for k, v in urlparse.parse_qsl(parts.query)]
+    if params:
+        query.extend((k, str(v)) for k, v in params.items())
+    return urlparse.urlunsplit((
+        parts.scheme.lower(), parts.netloc.lower(), parts.path or '/',
+        urllib.urlencode(sorted(query)), ''))
+
+
+class ResponseCache(object):
+
+    """ A persistent, size-bounded cache of web service responses.
+
+        Each response is tagged with the service it came from, and can be
+        given a time-to-live depending on the service, after which it is
+        ignored and downloaded again. In offline mode the TTLs are ignored,
+        everything is served from the cache, and a `CacheMiss` is raised for
+        responses we don't have.
+
+        Example usage:
+
+            cache = ResponseCache('~/.pysiss/cache', ttls={'logs': 86400})
+            content = cache.fetch(requests.Session(), url, service='logs')
+
+        :param cache_dir: The directory to store responses in. It is created
+            if it doesn't exist.
+        :type cache_dir: string
+        :param max_size: The maximum size of the stored (compressed) responses
+            in bytes. Optional, defaults to 1 GB. When the cache grows larger
+            than this, the least recently used responses are evicted.
+        :type max_size: int
+        :param ttls: The time-to-live, in seconds, of responses from each
+            service. A TTL of None means that responses never expire.
+            Optional, defaults to `default_ttl` for every service.
+        :type ttls: dict
+        :param default_ttl: The TTL for services not listed in `ttls`.
+            Optional, defaults to None (never expire).
+        :type default_ttl: float
+        :param offline: If True, only serve responses from the cache.
+        :type offline: bool
+    """
+
+    def __init__(self, cache_dir, max_size=2 ** 30, ttls=None,
+                 default_ttl=None, offline=False):
+        super(ResponseCache, self).__init__()
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = max_size
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.offline = offline
+
+        # Set up storage
+        self._object_dir = os.path.join(self.cache_dir, 'objects')
+        if not os.path.exists(self._object_dir):
+            os.makedirs(self._object_dir)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(self.cache_dir, 'index.sqlite'),
+            check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, digest TEXT, service TEXT, '
+                'stored REAL, accessed REAL)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS objects ('
+                'digest TEXT PRIMARY KEY, size INTEGER)')
+
+    def __repr__(self):
+        info = 'ResponseCache at {0}: {1} responses, {2} bytes'
+        return info.format(self.cache_dir, len(self), self.size)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __contains__(self, url):
+        return self._lookup(url) is not None
+
+    @property
+    def size(self):
+        """ The total size of the stored responses in bytes
+        """
+        with self._lock:
+            return self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def ttl(self, service):
+        """ Return the time-to-live for responses from the given service
+        """
+        return self.ttls.get(service, self.default_ttl)
+
+    def get(self, url, service=None):
+        """ Return the cached response content for a URL
+
+            :param url: The request URL
+            :type url: string
+            :param service: The service the URL belongs to, used to look up
+                the TTL for the response.
+            :type service: string
+            :returns: the response content, or None if there is no fresh
+                response in the cache.
+        """
+        fhandle = self._open_fresh(url, service)
+        if fhandle is None:
+            return None
+        with fhandle:
+            return fhandle.read()
+
+    def get_path(self, url, service=None):
+        """ Return the path to the compressed file containing the cached
+            response for a URL, or None if there is no fresh response in the
+            cache.
+
+            The file is gzip compressed, and can be streamed with
+            `gzip.open`. Note that the file may be evicted by another
+            thread before it is opened; use `open` to avoid this.
+        """
+        with self._lock:
+            return self._fresh_path(url, service)
+
+    def put(self, url, content, service=None):
+        """ Store the response content for a URL
+
+            :param url: The request URL
+            :type url: string
+            :param content: The response content
+            :type content: string
+            :param service: The service the URL belongs to
+            :type service: string
+        """
+        self.put_stream(url, [content], service)
+
+    def put_stream(self, url, chunks, service=None):
+        """ Store the response content for a URL from an iterable of chunks
+
+            The chunks are compressed and written to disk as they arrive, so
+            the whole response never needs to be held in memory.
+
+            :param url: The request URL
+            :type url: string
+            :param chunks: The response content
+            :type chunks: iterable of strings
+            :param service: The service the URL belongs to
+            :type service: string
+            :returns: the path to the stored (gzip compressed) response
+        """
+        digest, path = self._write_object(chunks)
+        self._add_entry(url, digest, os.path.getsize(path), service)
+        return path
+
+    def _write_object(self, chunks):
+        """ Compress and store some content, returning its (digest, path)
+        """
+        # Write to a temporary file first so that other readers never
+        # see a partial response. We don't know the digest until we're done.
+        sha1 = hashlib.sha1()
+        fdesc, tmppath = tempfile.mkstemp(dir=self._object_dir)
+        try:
+            with os.fdopen(fdesc, 'wb') as fhandle:
+                with gzip.GzipFile(fileobj=fhandle, mode='wb') as gzhandle:
+                    for chunk in chunks:
+                        sha1.update(chunk)
+                        gzhandle.write(chunk)
+            path = self._object_path(sha1.hexdigest())
+            if os.path.exists(path):
+                os.remove(tmppath)
+            else:
+                os.rename(tmppath, path)
+        except Exception:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+        return sha1.hexdigest(), path
+
+    def fetch(self, session, url, service=None):
+        """ Return the response content for a URL, from the cache if
+            possible, otherwise by making a GET request and caching the
+            response.
+
+            :param session: The session to make requests with
+            :type session: `requests.Session`
+            :param url: The request URL
+            :type url: string
+            :param service: The service the URL belongs to
+            :type service: string
+            :returns: the response content
+            :raises: `CacheMiss` if we are offline and the response isn't
+                cached, or `requests.HTTPError` if the request fails.
+        """
+        content = self.get(url, service)
+        if content is not None:
+            return content
+        elif self.offline:
+            raise CacheMiss('{0} is not in the cache'.format(url))
+
+        response = session.get(url)
+        response.raise_for_status()
+        self.put(url, response.content, service)
+        return response.content
+
+    def open(self, session, url, service=None, chunk_size=2 ** 16):
+        """ Return an open file containing the response content for a URL.
+
+            This works like `fetch`, except that responses which aren't
+            cached are streamed to disk rather than read into memory, and
+            the cached copy is then opened for reading. Use this for large
+            responses.
+
+            :param session: The session to make requests with
+            :type session: `requests.Session`
+            :param url: The request URL
+            :type url: string
+            :param service: The service the URL belongs to
+            :type service: string
+            :param chunk_size: The number of bytes to download at once
+            :type chunk_size: int
+            :returns: a file object, which should be closed after use
+            :raises: `CacheMiss` if we are offline and the response isn't
+                cached, or `requests.HTTPError` if the request fails.
+        """
+        fhandle = self._open_fresh(url, service)
+        if fhandle is not None:
+            return fhandle
+        elif self.offline:
+            raise CacheMiss('{0} is not in the cache'.format(url))
+
+        # The stored response is opened before anything is evicted, so we
+        # can still read it if it is bigger than max_size
+        response = session.get(url, stream=True)
+        try:
+            response.raise_for_status()
+            digest, path = self._write_object(
+                response.iter_content(chunk_size))
+        finally:
+            response.close()
+        return self._add_entry(url, digest, os.path.getsize(path), service,
+                               open_object=True)
+
+    def clear(self):
+        """ Remove all responses from the cache
+        """
+        with self._lock, self._db:
+            for (digest,) in self._db.execute('SELECT digest FROM objects'):
+                self._remove_object(digest)
+            self._db.execute('DELETE FROM entries')
+            self._db.execute('DELETE FROM objects')
+
+    def _lookup(self, url):
+        """ Return the (key, digest, stored) entry for a URL or None
+        """
+        key = normalize_url(url)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest, stored FROM entries WHERE key = ?',
+                (key,)).fetchone()
+        if row is None:
+            return None
+        return (key,) + tuple(row)
+
+    def _fresh_path(self, url, service):
+        """ Return the path to the fresh cached response for a URL or None.
+            Must be called holding the lock.
+        """
+        key = normalize_url(url)
+        row = self._db.execute(
+            'SELECT digest, stored FROM entries WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return None
+        digest, stored = row
+        ttl = self.ttl(service)
+        if not self.offline and ttl is not None \
+                and time.time() - stored > ttl:
+            return None
+
+        # Check that the file hasn't been removed from under us
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            with self._db:
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._db.execute('DELETE FROM objects WHERE digest = ?',
+                                 (digest,))
+            return None
+
+        # Mark as recently used
+        with self._db:
+            self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?',
+                             (time.time(), key))
+        return path
+
+    def _open_fresh(self, url, service):
+        """ Return an open file containing the fresh cached response for a
+            URL, or None.
+
+            The file is opened holding the lock so that it can't be evicted
+            between the lookup and the open.
+        """
+        with self._lock:
+            path = self._fresh_path(url, service)
+            if path is not None:
+                return gzip.open(path, 'rb')
+
+    def _add_entry(self, url, digest, size, service, open_object=False):
+        """ Add an index entry for a stored object, and evict old entries if
+            the cache is too big
+
+            If open_object is True, the object is opened before any entries
+            are evicted and the open file is returned, so that it can be read
+            even if it is evicted straight away.
+        """
+        key, now = normalize_url(url), time.time()
+        fhandle = None
+        with self._lock, self._db:
+            old = self._db.execute('SELECT digest FROM entries WHERE key = ?',
+                                   (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                (key, digest, service, now, now))
+            self._db.execute('INSERT OR IGNORE INTO objects VALUES (?, ?)',
+                             (digest, size))
+
+            # Drop the response we've just replaced if nothing else uses it
+            if old is not None and old[0] != digest:
+                self._remove_unreferenced(old[0])
+            if open_object:
+                fhandle = gzip.open(self._object_path(digest), 'rb')
+            self._evict()
+        return fhandle
+
+    def _evict(self):
+        """ Remove the least recently used entries until the cache is
+            smaller than max_size. Must be called holding the lock.
+
+            Objects which no entry refers to (for example, left behind by
+            older versions of the cache) are removed first, so that only
+            referenced objects count towards the size.
+        """
+        orphans = self._db.execute(
+            'SELECT digest FROM objects WHERE digest NOT IN '
+            '(SELECT digest FROM entries)').fetchall()
+        for (digest,) in orphans:
+            self._remove_unreferenced(digest)
+        total = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        lru = self._db.execute(
+            'SELECT key, digest FROM entries ORDER BY accessed').fetchall()
+        for key, digest in lru:
+            if total <= self.max_size:
+                break
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= self._remove_unreferenced(digest)
+
+    def _remove_unreferenced(self, digest):
+        """ Remove an object if no entry refers to it, returning the number
+            of bytes freed. Must be called holding the lock.
+        """
+        refs = self._db.execute(
+            'SELECT COUNT(*) FROM entries WHERE digest = ?',
+            (digest,)).fetchone()[0]
+        if refs:
+            return 0
+        row = self._db.execute('SELECT size FROM objects WHERE digest = ?',
+                               (digest,)).fetchone()
+        self._db.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+        self._remove_object(digest)
+        return row[0] if row is not None else 0
+
+    def _object_path(self, digest):
+        """ Return the path to the file storing an object
+        """
+        return os.path.join(self._object_dir, digest + '.gz')
+
+    def _remove_object(self, digest):
+        """ Remove the file storing an object, if it exists
+        """
+        try:
+            os.remove(self._object_path(digest))
+        except OSError:
+            pass
@@ -10,10 +10,18 @@ from ..borehole import PropertyType, SISSBoreholeGenerator
 from ..borehole.datasets import PointDataSet  # , IntervalDataSet
 from ..utilities import Singleton
 
-from owslib.wfs import WebFeatureService
+from multiprocessing.pool import ThreadPool
+from collections import namedtuple, OrderedDict
+from contextlib import closing
+import csv
+import itertools
+import os
+import threading
+import time
 import numpy
 import pandas
 import requests
+import simplejson
 from lxml import etree
 from StringIO import StringIO
 
@@ -53,6 +61,22 @@ NVCL_DEFAULT_ENDPOINTS = {
 }
 
 
+# Suggested time-to-live (in seconds) for cached responses from each NVCL
+# service. Dataset and log listings change as new scans are added, but the
+# scalar data for a given log and the GeoSciML for a borehole rarely do.
+NVCL_CACHE_TTLS = {
+    'geosciml': 7 * 86400,
+    'datasets': 86400,
+    'logs': 86400,
+    'scalars': 30 * 86400
+}
+
+
+# Metadata about the datasets and logs available for a borehole
+NVCLLog = namedtuple('NVCLLog', 'ident name sample_count')
+NVCLDataset = namedtuple('NVCLDataset', 'ident name logs')
+
+
 class NVCLEndpointRegistry(dict):
 
     """ Registry to manage information about NVCL endpoints
@@ -115,11 +139,43 @@ class NVCLImporter(object):
             registered endpoints, call `NVCLEndpointRegistry().keys()`. A
             KeyError is raised if an unknown endpoint is used.
         :type endpoint: string
+        :param pool_size: The maximum number of connections to keep open to
+            each NVCL host. Optional, defaults to 10. This should be at least
+            the number of workers used in `get_boreholes`.
+        :type pool_size: int
+        :param cache_dir: A directory in which to store the index of
+            boreholes available at the endpoint between sessions. Optional,
+            if None then the index is only kept in memory.
+        :type cache_dir: string
+        :param index_ttl: The number of seconds for which a stored borehole
+            index is used without checking whether it has changed on the
+            server. Optional, defaults to one day.
+        :type index_ttl: float
+        :param cache: A cache for responses from the NVCL data services
+            (GeoSciML, dataset and log listings and scalar data). Optional,
+            if None then every request goes to the server. See
+            `NVCL_CACHE_TTLS` for suggested time-to-live values.
+        :type cache: `pysiss.webservices.cache.ResponseCache`
     """
 
-    def __init__(self, endpoint='CSIRO'):
+    def __init__(self, endpoint='CSIRO', pool_size=10, cache_dir=None,
+                 index_ttl=86400, cache=None):
         super(NVCLImporter, self).__init__()
         self.endpoint = endpoint
+        self.cache_dir = cache_dir
+        self.index_ttl = index_ttl
+        self.cache = cache
+
+        # The borehole index is downloaded on first use
+        self._borehole_index = None
+        self._index_lock = threading.Lock()
+
+        # All requests share a session so that connections are pooled
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
         # Get URL data associated with endpoint
         registry = NVCLEndpointRegistry()
@@ -129,9 +185,8 @@ class NVCLImporter(object):
             raise KeyError('Unknown NVCL Endpoint {0}.'.format(endpoint) +
                            'Registered endpoints: {0}'.format(registry.keys()))
 
-        # Set up SISSBoreholeGenerator instance
-        # TODO: use this in get_borehole() instead of creating another
-        # instance?
+        # Set up SISSBoreholeGenerator instance. The generator doesn't keep
+        # any state between boreholes so we can share it between threads.
         self.generator = SISSBoreholeGenerator()
 
     def __repr__(self):
@@ -144,23 +199,175 @@ class NVCLImporter(object):
         """ Generates a dictionary containing identifiers and urls for
             boreholes with NVCL scanned data at this endpoint
 
+            The full list of boreholes is only downloaded once and then
+            kept in an index (see `refresh_borehole_index`), so repeated
+            calls are cheap. Requests with `maxids` set always go to the
+            server.
+
             :param maxids: The maximum number of boreholes to request or
                 None for no limit
             :type maxids: integer
             :returns: an dictionary of urls keyed by borehole identifiers
         """
-        wfs = WebFeatureService(self.urls['wfsurl'], version="1.1.0")
-        wfsresponse = wfs.getfeature(
-            typename="nvcl:ScannedBoreholeCollection",
-            maxfeatures=maxids)
-        xmltree = etree.parse(wfsresponse)
-
-        idents = {}
-        bhstring = ".//{http://www.auscope.org/nvcl}scannedBorehole"
-        for match in xmltree.findall(bhstring):
-            idents[match.get('{http://www.w3.org/1999/xlink}title')] = \
-                match.get('{http://www.w3.org/1999/xlink}href')
-        return idents
+        if maxids is None:
+            return dict(self._get_borehole_index())
+        response = self._request_borehole_collection(maxids=maxids)
+        response.raise_for_status()
+        return _parse_borehole_collection(response.content)
+
+    def refresh_borehole_index(self):
+        """ Update the index of boreholes available at this endpoint
+
+            If we already have a copy of the index stored on disk, the server
+            is asked whether it has changed (using the ETag/Last-Modified
+            headers from the last download) and it is only downloaded again
+            if it has.
+
+            :returns: an dictionary of urls keyed by borehole identifiers
+        """
+        with self._index_lock:
+            self._borehole_index = \
+                self._fetch_borehole_index(self._read_index_cache())
+            return dict(self._borehole_index)
+
+    def _get_borehole_index(self):
+        """ Return the borehole index, loading it if required.
+
+            The index is loaded from the on-disk cache if it's younger than
+            the TTL, otherwise it's revalidated against or downloaded from
+            the server.
+        """
+        with self._index_lock:
+            if self._borehole_index is None:
+                cached = self._read_index_cache()
+                if cached is not None \
+                        and time.time() - cached['fetched'] < self.index_ttl:
+                    self._borehole_index = cached['urls']
+                else:
+                    self._borehole_index = \
+                        self._fetch_borehole_index(cached)
+            return self._borehole_index
+
+    def _fetch_borehole_index(self, cached=None):
+        """ Download the borehole index from the server
+
+            :param cached: The cached index. If this is given, then a
+                conditional request is made, and the cached index is reused
+                if the server says it hasn't changed.
+            :type cached: dict
+        """
+        headers = {}
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        response = self._request_borehole_collection(headers=headers)
+
+        if cached is not None and response.status_code == 304:
+            # Nothing has changed, just reset the clock on the cache
+            cached['fetched'] = time.time()
+        else:
+            response.raise_for_status()
+            cached = {
+                'fetched': time.time(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'urls': _parse_borehole_collection(response.content)
+            }
+        self._write_index_cache(cached)
+        return cached['urls']
+
+    def _request_borehole_collection(self, maxids=None, headers=None):
+        """ Make a WFS GetFeature request for the borehole collection
+        """
+        params = {
+            'service': 'WFS',
+            'version': '1.1.0',
+            'request': 'GetFeature',
+            'typeName': 'nvcl:ScannedBoreholeCollection'
+        }
+        if maxids is not None:
+            params['maxFeatures'] = maxids
+        return self.session.get(self.urls['wfsurl'], params=params,
+                                headers=headers)
+
+    def _get_content(self, url, service):
+        """ Return the content of the response for a GET request, from the
+            response cache if we have one.
+
+            :param url: The request URL
+            :type url: string
+            :param service: The NVCL service the URL belongs to, one of
+                'geosciml', 'datasets', 'logs' or 'scalars'.
+            :type service: string
+            :raises: `requests.HTTPError` if the request fails, or
+                `pysiss.webservices.cache.CacheMiss` if the cache is offline
+                and doesn't have the response.
+        """
+        if self.cache is not None:
+            return self.cache.fetch(self.session, url, service=service)
+        response = self.session.get(url)
+        response.raise_for_status()
+        return response.content
+
+    def _iter_lines(self, url, service):
+        """ Iterate over the lines of the response to a GET request without
+            reading the whole response into memory.
+
+            See `_get_content` for details of the arguments.
+        """
+        if self.cache is not None:
+            fhandle = self.cache.open(self.session, url, service=service)
+            with closing(fhandle):
+                for line in fhandle:
+                    yield line
+        else:
+            response = self.session.get(url, stream=True)
+            with closing(response):
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    yield line
+
+    @property
+    def _index_cache_file(self):
+        """ The location of the on-disk borehole index
+        """
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir,
+                            '{0}_boreholes.json'.format(self.endpoint))
+
+    def _read_index_cache(self):
+        """ Read the borehole index from disk, or return None if there isn't
+            a valid one for this endpoint.
+        """
+        if self._index_cache_file is None:
+            return None
+        try:
+            with open(self._index_cache_file, 'rb') as fhandle:
+                cached = simplejson.load(fhandle)
+        except (IOError, ValueError):
+            return None
+        if cached.get('wfsurl') != self.urls['wfsurl']:
+            # The endpoint has been moved since we cached this
+            return None
+        return cached
+
+    def _write_index_cache(self, cached):
+        """ Write the borehole index to disk, if we have a cache directory
+        """
+        if self._index_cache_file is None:
+            return
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        cached['wfsurl'] = self.urls['wfsurl']
+
+        # Write to a temporary file first so readers never see half an index
+        tmpfile = self._index_cache_file + '.tmp'
+        with open(tmpfile, 'wb') as fhandle:
+            simplejson.dump(cached, fhandle)
+        os.rename(tmpfile, self._index_cache_file)
 
     def get_borehole_idents(self, maxids=None):
         """ Returns the identifiers of boreholes with NVCL scanned data
@@ -181,25 +388,72 @@ class NVCLImporter(object):
             :returns: a dictionary keyed by dataset name, where each dictionary
                 value is the GUID of the dataset.
         """
-        xmltree = None
+        datasets = {}
+        for dset in self._get_dataset_collection(hole_ident):
+            datasets[dset.find('DatasetName').text] = \
+                dset.find('DatasetID').text
+        return datasets
+
+    def plan_borehole(self, hole_ident):
+        """ Get the metadata for all the NVCL datasets and logs associated
+            with a borehole, without downloading any data.
+
+            The dataset collection is only requested once. If it includes
+            the logs for each dataset then these are used directly, otherwise
+            the logs are requested once per dataset. The plan can be passed
+            to `get_borehole` (optionally after removing unwanted datasets
+            or logs) so that none of this metadata is requested again.
+
+            Example usage:
+
+                plan = importer.plan_borehole(hole_ident)
+                for name, dataset in plan.items():
+                    plan[name] = dataset._replace(logs=[
+                        log for log in dataset.logs
+                        if log.name.startswith('Grp')])
+                bhl = importer.get_borehole(hole_ident, plan=plan)
+
+            :param hole_ident: The GUID for a borehole available at dataurl
+            :type hole_ident: string
+            :returns: an ordered dictionary of `NVCLDataset`s keyed by
+                dataset name. The logs for each dataset are given as a list
+                of `NVCLLog`s.
+        """
+        plan = OrderedDict()
+        for dset in self._get_dataset_collection(hole_ident):
+            ident = dset.find('DatasetID').text
+            name = dset.find('DatasetName').text
+            if dset.find('.//Log') is not None:
+                logs = _parse_logs(dset)
+            else:
+                logs = self.get_logs(ident)
+            plan[name] = NVCLDataset(ident, name, logs)
+        return plan
+
+    def _get_dataset_collection(self, hole_ident):
+        """ Return the Dataset elements for a borehole
+        """
         holeurl = (self.urls['dataurl'] + 'getDatasetCollection.html?'
                    'holeidentifier={0}').format(hole_ident)
-        response = requests.get(holeurl)
-        if response:
-            xmltree = etree.fromstring(response.content)
+        xmltree = etree.fromstring(self._get_content(holeurl, 'datasets'))
+        return xmltree.findall('.//Dataset')
 
-            datasets = {}
-            for dset in xmltree.findall(".//Dataset"):
-                datasets[dset.find('DatasetName').text] = \
-                    dset.find('DatasetID').text
-            return datasets
+    def get_logs(self, dataset_ident):
+        """ Get the metadata for the NVCL logs in a dataset
+
+            :param dataset_ident: The GUID for a dataset available at dataurl
+            :type dataset_ident: string
+            :returns: a list of `NVCLLog`s
+        """
+        dseturl = 'getLogCollection.html?mosaicsvc=no&datasetid={0}'
+        content = self._get_content(
+            self.urls['dataurl'] + dseturl.format(dataset_ident), 'logs')
+        return _parse_logs(etree.fromstring(content))
 
     def get_analyte_idents(self, hole_ident, dataset_ident):
         """ Generates a dictionary mapping all NVCL analytes for a given
             borehole dataset to their GUIDs.
 
-            Returns None if the XML fails to parse.
-
             :param hole_ident: The GUID for a borehole available at dataurl
             :type hole_ident: string
             :param dataset_ident: The GUID for a dataset available at dataurl
@@ -207,28 +461,13 @@ class NVCLImporter(object):
             :returns: a dictionary keyed by analyte name, where each value is
                 the GUID for a given analyte.
         """
-        analyte_idents = None
-        dseturl = 'getLogCollection.html?mosaicsvc=no&datasetid={0}'
-        response = requests.get(self.urls['dataurl']
-                                + dseturl.format(dataset_ident))
-
-        # Parse XML tree to return analytes
-        if response:
-            xmltree = etree.fromstring(response.content)
-            analyte_idents = {}
-            for analyte in xmltree.findall(".//Log"):
-                log_ident = analyte.find("LogID").text
-                name = analyte.find("logName").text
-                # sample_count = analyte.find('SampleCount').text
-                analyte_idents[name] = log_ident
-            return analyte_idents
-        else:
-            raise Exception(
-                'Request for data returned {0}'.format(response.code))
+        return dict((log.name, log.ident)
+                    for log in self.get_logs(dataset_ident))
 
     def get_analytes(self, hole_ident, dataset_name, dataset_ident,
                      analyte_idents=None,
-                     from_depth=None, to_depth=None,):
+                     from_depth=None, to_depth=None, dtypes=None,
+                     logs=None):
         """ Get the analytes from the given borehole and dataset
 
             :param hole_ident: The identifier for a borehole
@@ -241,38 +480,48 @@ class NVCLImporter(object):
                 Optional, if None then all analytes in the given dataset are
                 downloaded.
             :type analyte_idents: list of str
+            :param logs: The logs in the dataset, e.g. from `plan_borehole`.
+                Optional, if None and `analyte_idents` isn't given then the
+                logs are requested from the server. The sample counts of the
+                logs are used to preallocate the arrays for the data.
+            :type logs: list of `NVCLLog`
             :param from_depth/to_depth: The depth range included in the
                 dataset. Optional, defaults to the entire depths defined in
                 the NVCL.
             :type from_depth/to_depth: float
+            :param dtypes: The type of each analyte, either 'float32' for
+                numeric analytes or 'category' for categorical ones (e.g.
+                mineral names). Optional, types not given here are inferred
+                from the data (see `read_scalars`).
+            :type dtypes: dict
         """
         # Get analyte data
-        analyte_ident_dict = self.get_analyte_idents(hole_ident, dataset_ident)
-        if len(analyte_ident_dict) == 0:
+        if analyte_idents is None:
+            if logs is None:
+                logs = self.get_logs(dataset_ident)
+            analyte_idents = [log.ident for log in logs]
+        if len(analyte_idents) == 0:
             # This dataset has no analytes
             print 'Warning, dataset {0} has no analytes'.format(dataset_ident)
             return None
 
         # Generate request URL
-        if analyte_idents is None:
-            analyte_idents = analyte_ident_dict.values()
         url = self.urls['dataurl'] + 'downloadscalars.html?'
         for ident in analyte_idents:
             url += '&logid={0}'.format(ident)
 
-        # We'll use pandas to slurp the csv direct from the web service
-        analytedata = pandas.read_csv(url)
-        startcol = 'StartDepth'
-        endcol = 'EndDepth'
-        analytecols = [k for k in analytedata.keys()
-                       if k not in (startcol, endcol)]
+        # Stream the csv from the web service straight into typed arrays
+        sample_counts = [log.sample_count for log in logs or []
+                         if log.ident in analyte_idents and log.sample_count]
+        depths, columns = read_scalars(
+            self._iter_lines(url, 'scalars'), dtypes=dtypes,
+            size_hint=max(sample_counts) if sample_counts else None)
 
         # NVCL data results in start depths == end depths.
         # Ranges aren't really appropriate. Better to use sampling
-        # dataset
-        analytedata = analytedata.drop_duplicates(startcol)
-        startdepths = numpy.asarray(analytedata[startcol])
-        dataset = PointDataSet(dataset_name, startdepths)
+        # dataset. read_scalars has already dropped duplicate depths and
+        # sorted the depths for us.
+        dataset = PointDataSet._from_sorted(dataset_name, depths)
 
         # Make a property for each analyte in the borehole
         #
@@ -281,16 +530,14 @@ class NVCLImporter(object):
         #       between analyte data and the borehole. Is what
         #       follows still valid?
         #
-        for analyte in analytecols:
+        for analyte, values in columns:
             property_type = PropertyType(
                 name=analyte,
                 long_name=analyte,
                 units=None,
                 description=None,
-                isnumeric=False)
-            dataset.add_property(
-                property_type=property_type,
-                values=numpy.asarray(analytedata[analyte]))
+                isnumeric=not isinstance(values, pandas.Categorical))
+            dataset.add_property(property_type=property_type, values=values)
 
         return dataset
 
@@ -312,7 +559,7 @@ class NVCLImporter(object):
         raise NotImplemented
 
     def get_borehole(self, hole_ident, name=None, get_analytes=True,
-                     raise_error=True):
+                     raise_error=True, plan=None):
         """ Generates a pysiss.borehole.Borehole instance containing the data
             from the given borehole.
 
@@ -328,37 +575,299 @@ class NVCLImporter(object):
             :type get_analytes: bool
             :param raise_error: Whether to raise an exception on an HTTP error
                 (e.g. 404'd). If false, get_borehole returns None.
+            :param plan: The datasets and logs to download, from
+                `plan_borehole`. Optional, if None then all the datasets and
+                logs for the borehole are downloaded.
+            :type plan: dict
             :returns: a `pysiss.borehole.Borehole` object
         """
         try:
-            # Generate pysiss.borehole.Borehole instance to hold the data
-            if name is None:
-                name = hole_ident
-            siss_bhl_generator = SISSBoreholeGenerator()
-            bh_url = self.get_borehole_idents_and_urls()[hole_ident]
-            response = requests.get(bh_url)
-
-            # Break out now if the request fails
-            if not response:
-                return None
-            bhl = siss_bhl_generator.geosciml_to_borehole(
-                name, StringIO(response.content))
-
-            # For each dataset in the NVCL we want to add a dataset and store
-            # the dataset information in the DatasetDetails
-            if get_analytes:
-                datasets = self.get_dataset_idents(hole_ident)
-                for dataset_name, dataset_guid in datasets.items():
-                    dataset = self.get_analytes(hole_ident=hole_ident,
-                                                dataset_name=dataset_name,
-                                                dataset_ident=dataset_guid)
-                    if dataset is not None:
-                        bhl.add_dataset(dataset)
-
-            return bhl
+            bh_url = self._get_borehole_index()[hole_ident]
+            return self._get_borehole(hole_ident, bh_url, name=name,
+                                      get_analytes=get_analytes, plan=plan)
 
         except Exception, err:
             if raise_error:
                 raise err
             else:
                 return None
+
+    def get_boreholes(self, hole_idents=None, max_workers=4,
+                      get_analytes=True):
+        """ Download many boreholes concurrently.
+
+            The boreholes are downloaded by a pool of worker threads which
+            share this importer's pooled HTTP session. This is a generator
+            which yields the results as each borehole is completed, so the
+            results won't necessarily be in the same order as
+            `hole_idents`. A failure to download one borehole doesn't stop
+            the others; instead the error is returned for that borehole.
+
+            Example usage:
+
+                importer = NVCLImporter('GSWA')
+                for ident, bhl, error in importer.get_boreholes():
+                    if error is not None:
+                        print 'Failed to get {0}: {1}'.format(ident, error)
+
+            :param hole_idents: The identifiers of the boreholes to download.
+                Optional, if None then all boreholes at the endpoint are
+                downloaded.
+            :type hole_idents: list of str
+            :param max_workers: The number of boreholes to download at once.
+                Optional, defaults to 4.
+            :type max_workers: int
+            :param get_analytes: If True, the analytes will also be downloaded
+            :type get_analytes: bool
+            :returns: an iterator of `(hole_ident, borehole, error)` tuples.
+                For each hole, one of `borehole` or `error` will be None.
+        """
+        bh_urls = self._get_borehole_index()
+        if hole_idents is None:
+            hole_idents = bh_urls.keys()
+
+        def _worker(hole_ident):
+            """ Get a borehole, returning any exception rather than raising
+            """
+            try:
+                bhl = self._get_borehole(hole_ident, bh_urls[hole_ident],
+                                         get_analytes=get_analytes)
+                return hole_ident, bhl, None
+            except Exception, err:
+                return hole_ident, None, err
+
+        pool = ThreadPool(max_workers)
+        try:
+            for result in pool.imap_unordered(_worker, hole_idents):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _get_borehole(self, hole_ident, bh_url, name=None, get_analytes=True,
+                      plan=None):
+        """ Generates a pysiss.borehole.Borehole instance from the GeoSciML
+            at the given URL, and optionally the analytes for the borehole.
+
+            See `get_borehole` for more details. HTTP errors are raised as
+            `requests.HTTPError`s.
+        """
+        # Generate pysiss.borehole.Borehole instance to hold the data
+        if name is None:
+            name = hole_ident
+        bhl = self.generator.geosciml_to_borehole(
+            name, StringIO(self._get_content(bh_url, 'geosciml')))
+
+        # For each dataset in the NVCL we want to add a dataset and store
+        # the dataset information in the DatasetDetails
+        if get_analytes:
+            if plan is None:
+                plan = self.plan_borehole(hole_ident)
+            for nvcl_dataset in plan.values():
+                dataset = self.get_analytes(hole_ident=hole_ident,
+                                            dataset_name=nvcl_dataset.name,
+                                            dataset_ident=nvcl_dataset.ident,
+                                            logs=nvcl_dataset.logs)
+                if dataset is not None:
+                    bhl.add_dataset(dataset)
+
+        return bhl
+
+
+def _parse_borehole_collection(content):
+    """ Parse an nvcl:ScannedBoreholeCollection WFS response
+
+        :param content: The XML response
+        :type content: string
+        :returns: an dictionary of urls keyed by borehole identifiers
+    """
+    xmltree = etree.fromstring(content)
+    idents = {}
+    bhstring = ".//{http://www.auscope.org/nvcl}scannedBorehole"
+    for match in xmltree.findall(bhstring):
+        idents[match.get('{http://www.w3.org/1999/xlink}title')] = \
+            match.get('{http://www.w3.org/1999/xlink}href')
+    return idents
+
+
+def _parse_logs(element):
+    """ Parse the Log elements in an NVCL response
+
+        :param element: An element containing Log elements
+        :type element: `lxml.etree.Element`
+        :returns: a list of `NVCLLog`s
+    """
+    logs = []
+    for log in element.iter('Log'):
+        sample_count = log.findtext('SampleCount')
+        logs.append(NVCLLog(
+            ident=log.findtext('LogID'),
+            name=log.findtext('logName'),
+            sample_count=int(sample_count) if sample_count else None))
+    return logs
+
+
+def read_scalars(lines, dtypes=None, size_hint=None, chunk_size=4096):
+    """ Read an NVCL scalar CSV into typed arrays, a chunk of rows at a time.
+
+        The values are written directly into preallocated arrays (which are
+        grown as required) rather than going through a DataFrame. Numeric
+        analytes are stored as float32 arrays, with missing values set to
+        NaN, and categorical analytes (e.g. mineral names) are stored as
+        integer codes in a `pandas.Categorical`.
+
+        Unless it is declared in `dtypes`, the type of each analyte is
+        inferred from the first chunk of rows in which it has any values: an
+        analyte is numeric if all its values in that chunk are numbers.
+        Analytes with no values at all are numeric. Values which turn out not
+        to be numbers later on are set to NaN with a warning.
+
+        Only the first row is kept for each depth. If the depths aren't
+        increasing then the rows are sorted by depth.
+
+        Example usage:
+
+            with open('scalars.csv') as fhandle:
+                depths, columns = read_scalars(fhandle)
+            for name, values in columns:
+                ...
+
+        :param lines: The lines of the CSV file. The header must contain
+            'StartDepth' and 'EndDepth' columns, and every other column is
+            treated as an analyte.
+        :type lines: iterable of strings
+        :param dtypes: The type of each analyte, either 'float32' or
+            'category'. Optional, types are inferred for analytes which
+            aren't given.
+        :type dtypes: dict
+        :param size_hint: The expected number of rows. Optional, if given
+            then the arrays are preallocated with this size.
+        :type size_hint: int
+        :param chunk_size: The number of rows to process at once.
+        :type chunk_size: int
+        :returns: the depths as a float `numpy.ndarray`, and a list of
+            `(name, values)` pairs for each analyte in column order.
+    """
+    rows = csv.reader(lines)
+    header = next(rows)
+    depth_col = header.index('StartDepth')
+    analyte_cols = [idx for idx, name in enumerate(header)
+                    if name not in ('StartDepth', 'EndDepth')]
+    names = [header[idx] for idx in analyte_cols]
+
+    # Check the declared types - the other analytes' types are worked out
+    # when we see their first values. Until then they are numeric, with
+    # every value missing.
+    dtypes = dict(dtypes or {})
+    for name, dtype in dtypes.items():
+        if dtype not in ('float32', 'category'):
+            raise ValueError("Unknown dtype {0} for {1}, should be 'float32' "
+                             "or 'category'".format(dtype, name))
+    undetermined = [name not in dtypes for name in names]
+    isnumeric = [dtypes.get(name, 'float32') == 'float32' for name in names]
+
+    # Preallocate arrays, categories map values to codes
+    chunk = _next_chunk(rows, chunk_size)
+    capacity = max(size_hint or 0, len(chunk), 1)
+    depths = numpy.empty(capacity, dtype=numpy.float_)
+    columns = [numpy.empty(capacity, dtype=numpy.float32 if numeric
+                           else numpy.int32)
+               for numeric in isnumeric]
+    categories = [{} for _ in names]
+
+    size, last_depth, is_sorted, nbad = 0, None, True, 0
+    while chunk:
+        # Drop rows which repeat the previous depth
+        kept = []
+        for row in chunk:
+            depth = float(row[depth_col])
+            if depth == last_depth:
+                continue
+            elif last_depth is not None and depth < last_depth:
+                is_sorted = False
+            last_depth = depth
+            kept.append((depth, row))
+
+        # Grow the arrays if we need to
+        end = size + len(kept)
+        if end > capacity:
+            capacity = max(2 * capacity, end)
+            for array in [depths] + columns:
+                array.resize(capacity, refcheck=False)
+
+        # Copy in the values
+        depths[size:end] = [depth for depth, _ in kept]
+        for col, (idx, codes) in enumerate(zip(analyte_cols, categories)):
+            values = [row[idx] if len(row) > idx else '' for _, row in kept]
+            if undetermined[col] and any(values):
+                # First values for this analyte, so now we can work out
+                # its type. Everything before this is missing.
+                undetermined[col] = False
+                if not all(_isfloat(v) for v in values if v):
+                    isnumeric[col] = False
+                    columns[col] = numpy.empty(capacity, dtype=numpy.int32)
+                    columns[col][:size] = -1
+            column = columns[col]
+            if isnumeric[col]:
+                floats = [_to_float(v) for v in values]
+                nbad += sum(1 for v, f in zip(values, floats)
+                            if v and numpy.isnan(f))
+                column[size:end] = floats
+            else:
+                column[size:end] = [codes.setdefault(v, len(codes)) if v
+                                    else -1 for v in values]
+        size = end
+        chunk = _next_chunk(rows, chunk_size)
+
+    if nbad:
+        print 'Warning, {0} non-numeric values set to NaN'.format(nbad)
+
+    # Trim the arrays to size
+    for array in [depths] + columns:
+        array.resize(size, refcheck=False)
+    if not is_sorted:
+        depths, first = numpy.unique(depths, return_index=True)
+        columns = [column[first] for column in columns]
+
+    # Wrap categorical codes
+    result = []
+    for name, numeric, column, codes in \
+            zip(names, isnumeric, columns, categories):
+        if not numeric:
+            column = pandas.Categorical.from_codes(
+                column, sorted(codes, key=codes.get))
+        result.append((name, column))
+    return depths, result
+
+
+def _next_chunk(rows, chunk_size):
+    """ Return the next chunk of non-empty rows from a CSV reader, or an
+        empty list when there are no more rows
+    """
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return []
+        chunk = [row for row in chunk if row]
+        if chunk:
+            return chunk
+
+
+def _isfloat(value):
+    """ Return True if the string can be converted to a float
+    """
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _to_float(value):
+    """ Convert a string to a float, returning NaN for non-numbers
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return numpy.nan
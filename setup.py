@@ -50,14 +50,15 @@ setup(
     install_requires=[
         'matplotlib>=1.0',
         'numpy>=1.6',
-        'scipy>=0.9',
+        'scipy>=0.19',
         'OWSLib>=0.8',
         'lxml',
         'simplejson>=3.0',
         'pandas>=0.10',
         'shapely',
         'requests',
-        'pint'
+        'pint',
+        'pyproj>=2.2'
     ],
 
     # Contents
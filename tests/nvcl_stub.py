@@ -0,0 +1,201 @@
+""" file:   nvcl_stub.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Saturday 17 January, 2015
+
+    description: A local stub NVCL endpoint so that we can test the NVCL
+        importer without hitting the network.
+
+    Example usage:
+
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            ...
+"""
+
+import pysiss.webservices.nvcl as nvcl
+
+import BaseHTTPServer
+import SocketServer
+import os
+import threading
+import urlparse
+
+# Canned data for each borehole
+GEOSCIML_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             'geosciml', 'geo2test.xml')
+
+BOREHOLES = ('HOLE1', 'HOLE2', 'HOLE3', 'BROKEN')
+
+WFS_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs"
+    xmlns:gml="http://www.opengis.net/gml"
+    xmlns:nvcl="http://www.auscope.org/nvcl"
+    xmlns:xlink="http://www.w3.org/1999/xlink">
+  <gml:featureMembers>
+    <nvcl:ScannedBoreholeCollection gml:id="collection">
+{0}
+    </nvcl:ScannedBoreholeCollection>
+  </gml:featureMembers>
+</wfs:FeatureCollection>
+"""
+
+WFS_ETAG = '"collection-1"'
+
+WFS_BOREHOLE_TEMPLATE = \
+    '      <nvcl:scannedBorehole xlink:href="{0}" xlink:title="{1}"/>'
+
+DATASET_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<DatasetCollection>
+  <Dataset>
+    <DatasetID>{0}-dataset</DatasetID>
+    <DatasetName>{0} scalars</DatasetName>
+    <boreholeURI>{1}</boreholeURI>{2}
+  </Dataset>
+</DatasetCollection>
+"""
+
+LOG_ELEMENTS = """
+  <Log>
+    <LogID>log-grp</LogID>
+    <logName>Grp1 uTSAS</logName>
+    <SampleCount>5</SampleCount>
+  </Log>
+  <Log>
+    <LogID>log-wt</LogID>
+    <logName>Wt1 uTSAS</logName>
+    <SampleCount>5</SampleCount>
+  </Log>"""
+
+LOGS = """<?xml version="1.0" encoding="UTF-8"?>
+<LogCollection>{0}
+</LogCollection>
+""".format(LOG_ELEMENTS)
+
+# Boreholes whose dataset collection includes the logs for each dataset
+EMBEDDED_LOGS = ('HOLE3',)
+
+SCALARS = """StartDepth,EndDepth,Grp1 uTSAS,Wt1 uTSAS
+1.0,1.0,KAOLIN,0.5
+1.5,1.5,KAOLIN,0.25
+1.5,1.5,KAOLIN,0.25
+2.0,2.0,WHITE-MICA,0.75
+2.5,2.5,,
+3.0,3.0,KAOLIN,1.0
+"""
+
+
+class _StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """ Serves canned NVCL responses
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        self.server.requests.append(self.path)
+        base = 'http://localhost:{0}'.format(self.server.server_port)
+
+        if url.path == '/wfs':
+            if self.headers.get('If-None-Match') == WFS_ETAG:
+                self._respond('', 'text/xml', status=304)
+                return
+            boreholes = '\n'.join(
+                WFS_BOREHOLE_TEMPLATE.format(
+                    '{0}/borehole/{1}'.format(base, ident), ident)
+                for ident in BOREHOLES)
+            self._respond(WFS_TEMPLATE.format(boreholes), 'text/xml',
+                          headers={'ETag': WFS_ETAG})
+
+        elif url.path.startswith('/borehole/'):
+            if url.path.endswith('BROKEN'):
+                self._respond('Not found', 'text/plain', status=404)
+            else:
+                with open(GEOSCIML_FILE, 'rb') as fhandle:
+                    self._respond(fhandle.read(), 'text/xml')
+
+        elif url.path == '/data/getDatasetCollection.html':
+            ident = query['holeidentifier'][0]
+            logs = ''
+            if ident in EMBEDDED_LOGS:
+                logs = '\n    <Logs>{0}\n    </Logs>'.format(LOG_ELEMENTS)
+            self._respond(
+                DATASET_TEMPLATE.format(
+                    ident, '{0}/borehole/{1}'.format(base, ident), logs),
+                'text/xml')
+
+        elif url.path == '/data/getLogCollection.html':
+            self._respond(LOGS, 'text/xml')
+
+        elif url.path == '/data/downloadscalars.html':
+            self._respond(SCALARS, 'text/csv')
+
+        else:
+            self._respond('Not found', 'text/plain', status=404)
+
+    def _respond(self, content, content_type, status=200, headers=None):
+        """ Send a response with the given content
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        """ Keep the test output quiet
+        """
+        pass
+
+
+class _ThreadedServer(SocketServer.ThreadingMixIn,
+                      BaseHTTPServer.HTTPServer):
+
+    """ An HTTP server which handles each request in a new thread
+    """
+
+    daemon_threads = True
+
+
+class NVCLStubServer(object):
+
+    """ Context manager which runs a stub NVCL endpoint on localhost, and
+        registers it with the NVCLEndpointRegistry while it is running.
+
+        The paths of the requests that the server receives are stored in
+        `requests` so that tests can check which calls were made.
+    """
+
+    def __init__(self, endpoint='stub'):
+        self.endpoint = endpoint
+        self.server = _ThreadedServer(('localhost', 0), _StubHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def url(self):
+        return 'http://localhost:{0}'.format(self.server.server_port)
+
+    def __enter__(self):
+        self.thread.start()
+        nvcl.NVCLEndpointRegistry().register(
+            self.endpoint,
+            wfsurl=self.url + '/wfs',
+            dataurl=self.url + '/data/',
+            downloadurl=self.url + '/download/',
+            update=True)
+        return self
+
+    def __exit__(self, *args):
+        del nvcl.NVCLEndpointRegistry()[self.endpoint]
+        self.server.shutdown()
+        self.server.server_close()
@@ -8,6 +8,8 @@
 """
 
 from pysiss import borehole as pybh
+from pysiss.borehole.borehole import OriginPosition
+from pysiss.utilities import get_unit_registry, transform_coordinates
 import numpy
 import unittest
 
@@ -167,5 +169,204 @@ class BoreholeTest(unittest.TestCase):
             lambda: dset.add_property(DENSITY, [1.3]))
 
 
+class SurveyTest(unittest.TestCase):
+
+    """ Tests for desurveying boreholes
+    """
+
+    def setUp(self):
+        self.borehole = pybh.Borehole("test")
+
+        # Builds from vertical to horizontal (east) over 100 metres
+        self.borehole.add_survey([0, 100], [90, 90], [90, 0])
+        self.radius = 100 / (numpy.pi / 2)
+
+    def test_vertical_without_survey(self):
+        """ Boreholes without a survey are vertical
+        """
+        points = pybh.Borehole("vertical").desurvey([0, 10, 100])
+        self.assertTrue(numpy.allclose(
+            points, [[0, 0, 0], [0, 0, -10], [0, 0, -100]]))
+
+    def test_straight(self):
+        """ Constant azimuth and dip give a straight line
+        """
+        survey = pybh.Survey([0, 50, 100], [90, 90, 90], [45, 45, 45])
+        for method in survey.methods:
+            points = survey.desurvey([100, 200], method)
+            offset = 100 / numpy.sqrt(2)
+            self.assertTrue(numpy.allclose(
+                points, [[offset, 0, -offset], [2 * offset, 0, -2 * offset]]))
+
+    def test_minimum_curvature(self):
+        """ Minimum curvature follows a circular arc between stations
+        """
+        points = self.borehole.desurvey([50, 100, 110])
+        self.assertTrue(numpy.allclose(points[0], [
+            self.radius * (1 - numpy.cos(numpy.pi / 4)), 0,
+            -self.radius * numpy.sin(numpy.pi / 4)]))
+        self.assertTrue(numpy.allclose(
+            points[1], [self.radius, 0, -self.radius]))
+        self.assertTrue(numpy.allclose(
+            points[2], [self.radius + 10, 0, -self.radius]))
+        self.assertTrue(numpy.allclose(self.borehole.survey.stations(),
+                                       [[0, 0, 0], [self.radius, 0,
+                                                    self.radius]]))
+
+    def test_tangential(self):
+        """ Tangential desurvey uses the direction at the upper station
+        """
+        points = self.borehole.desurvey([50, 100, 110], method='tangential')
+        self.assertTrue(numpy.allclose(
+            points, [[0, 0, -50], [0, 0, -100], [10, 0, -100]]))
+
+    def test_unknown_method(self):
+        """ Unknown methods raise a ValueError
+        """
+        self.assertRaises(ValueError, self.borehole.desurvey, [1],
+                          method='balanced')
+
+    def test_interval_dataset(self):
+        """ Interval datasets give the from and to positions
+        """
+        dataset = self.borehole.add_interval_dataset("intervals", [0, 50],
+                                                     [50, 100])
+        from_points, to_points = self.borehole.desurvey(dataset)
+        self.assertTrue(numpy.allclose(from_points[1], to_points[0]))
+        self.assertTrue(numpy.allclose(
+            to_points[1], [self.radius, 0, -self.radius]))
+
+    def test_collection_crs(self):
+        """ Collars are projected and the offsets added
+        """
+        degree = get_unit_registry().degree
+        metre = get_unit_registry().meter
+        self.borehole.origin_position = OriginPosition(
+            -30 * degree, 121 * degree, 400 * metre)
+        other = pybh.Borehole("other", OriginPosition(
+            -31 * degree, 117 * degree, 300 * metre))
+        other.add_point_dataset("samples", [10, 20])
+        self.borehole.add_point_dataset("samples", [100])
+        results = pybh.desurvey_boreholes([self.borehole, other],
+                                          dataset="samples", crs=28350)
+        collar = transform_coordinates([[121, -30, 400]], 4326, 28350)[0]
+        self.assertTrue(numpy.allclose(
+            results["test"], [collar + [self.radius, 0, -self.radius]]))
+        self.assertTrue(numpy.allclose(
+            results["other"][:, 2], [290, 280]))
+        self.assertTrue(numpy.allclose(
+            self.borehole.desurvey([100], crs=28350), results["test"]))
+
+
+class MergeTest(unittest.TestCase):
+
+    """ Test merging interval datasets to the union of their boundaries
+    """
+
+    def setUp(self):
+        self.borehole = pybh.Borehole("test")
+        geology = self.borehole.add_interval_dataset(
+            "geology", [0., 10., 25.], [10., 20., 30.])
+        geology.add_property(ROCK_TYPE, numpy.array(["SA", "SL", "SC"]))
+        assays = self.borehole.add_interval_dataset(
+            "assays", [5., 8., 12., 40.], [8., 12., 16., 42.])
+        assays.add_property(DENSITY, numpy.array([2.1, 2.2, 2.3, 2.4]))
+        logs = self.borehole.add_interval_dataset("logs", [15.], [26.])
+        logs.add_property(DENSITY, numpy.array([3.0]))
+
+    def test_merge_two(self):
+        """ Merged intervals have the union of the boundaries
+        """
+        merged = self.borehole.add_merged_interval_dataset(
+            "merged", "geology", "assays")
+        self.assertTrue(merged is self.borehole.interval_datasets["merged"])
+        self.assertEqual(list(merged.from_depths),
+                         [0, 5, 8, 10, 12, 16, 25, 40])
+        self.assertEqual(list(merged.to_depths),
+                         [5, 8, 10, 12, 16, 20, 30, 42])
+        self.assertEqual(list(merged.properties["rock"].values),
+                         ["SA", "SA", "SA", "SL", "SL", "SL", "SC", None])
+        self.assertTrue(numpy.allclose(
+            merged.properties["d"].values,
+            [numpy.nan, 2.1, 2.2, 2.2, 2.3, numpy.nan, numpy.nan, 2.4],
+            equal_nan=True))
+        self.assertEqual(list(merged.index_maps["assays"]),
+                         [-1, 0, 1, 1, 2, -1, -1, 3])
+
+    def test_merge_many(self):
+        """ More than two datasets are merged in one pass, and clashing
+            property names are prefixed with the dataset name
+        """
+        merged = self.borehole.add_merged_interval_dataset(
+            "merged", "geology", "assays", "logs")
+        self.assertEqual(list(merged.from_depths),
+                         [0, 5, 8, 10, 12, 15, 16, 20, 25, 26, 40])
+        self.assertEqual(sorted(merged.properties.keys()),
+                         ["d", "logs.d", "rock"])
+        logs = merged.properties["logs.d"]
+        self.assertEqual(logs.property_type.units, "g/cm3")
+        self.assertEqual(numpy.isnan(logs.values).sum(), 7)
+
+    def test_merge_is_lazy(self):
+        """ Property values aren't gathered until they are used
+        """
+        merged = self.borehole.add_merged_interval_dataset(
+            "merged", "geology", "assays")
+        self.assertFalse(merged.properties["d"].loaded)
+        merged.properties["d"].values
+        self.assertTrue(merged.properties["d"].loaded)
+
+
+class BackFlagTest(unittest.TestCase):
+
+    """ Test sampling interval properties at point depths
+    """
+
+    def setUp(self):
+        self.logs = pybh.IntervalDataSet("logs", [0., 10., 25.],
+                                         [10., 20., 30.])
+        self.logs.add_property(ROCK_TYPE, numpy.array(["SA", "SL", "SC"]))
+        self.logs.add_properties([DENSITY, IMPEDANCE],
+                                 [[2.1, 2.2, 2.3], [5., 6., 7.]])
+        self.samples = pybh.PointDataSet(
+            "samples", [-1., 0., 5., 10., 20., 22., 30., 31.])
+
+    def test_interval_index(self):
+        """ Depths in gaps or outside the dataset get -1
+        """
+        self.assertEqual(
+            list(self.logs.get_interval_index(self.samples.depths)),
+            [-1, 0, 0, 1, 1, -1, 2, -1])
+
+    def test_back_flag(self):
+        """ All properties are gathered onto the point dataset
+        """
+        index = self.logs.back_flag(self.samples)
+        self.assertEqual(list(index), [-1, 0, 0, 1, 1, -1, 2, -1])
+        self.assertEqual(list(self.samples.properties["rock"].values),
+                         [None, "SA", "SA", "SL", "SL", None, "SC", None])
+        self.assertTrue(numpy.allclose(
+            self.samples.properties["imp"].values,
+            [numpy.nan, 5, 5, 6, 6, numpy.nan, 7, numpy.nan],
+            equal_nan=True))
+        self.assertEqual(sorted(self.samples.block.names), ["d", "imp"])
+
+    def test_back_flag_some(self):
+        """ Properties can be chosen by name
+        """
+        self.logs.back_flag(self.samples, properties=["d"])
+        self.assertEqual(list(self.samples.properties.keys()), ["d"])
+
+    def test_to_point_dataset_copies(self):
+        """ Converted datasets don't share properties with the original
+        """
+        points = self.logs.to_point_dataset()
+        self.assertEqual(list(points.depths), [5, 15, 27.5])
+        points.properties["d"].values[0] = 0
+        self.assertEqual(self.logs.properties["d"].values[0], 2.1)
+        points.add_property(pybh.PropertyType("other"), [1, 2, 3])
+        self.assertTrue("other" not in self.logs.properties)
+
+
 if __name__ == "__main__":
     unittest.main()
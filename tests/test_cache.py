@@ -0,0 +1,195 @@
+""" file:   test_cache.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Sunday 18 January, 2015
+
+    description: Tests for the web service response cache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pysiss.webservices.cache import ResponseCache, CacheMiss, normalize_url
+
+
+class MockResponse(object):
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for idx in range(0, len(self.content), chunk_size):
+            yield self.content[idx:idx + chunk_size]
+
+    def close(self):
+        pass
+
+
+class MockSession(object):
+
+    """ Returns the URL as the response content and counts requests
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, stream=False):
+        self.requests.append(url)
+        return MockResponse('response for ' + url)
+
+
+class TestNormalizeURL(unittest.TestCase):
+
+    def test_query_order(self):
+        """ Query parameter order and empty parameters don't matter
+        """
+        self.assertEqual(
+            normalize_url('HTTP://Example.com/data?b=2&&a=1'),
+            normalize_url('http://example.com/data?a=1&b=2'))
+
+    def test_params(self):
+        """ Extra parameters are merged into the query
+        """
+        self.assertEqual(
+            normalize_url('http://example.com/data?a=1', params={'b': 2}),
+            'http://example.com/data?a=1&b=2')
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.session = MockSession()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_fetch(self):
+        """ Responses are only requested once, even from a new cache
+        """
+        url = 'http://example.com/data?a=1'
+        content = ResponseCache(self.cache_dir).fetch(self.session, url)
+        cache = ResponseCache(self.cache_dir)
+        self.assertEqual(cache.fetch(self.session, url), content)
+        self.assertEqual(len(self.session.requests), 1)
+        self.assertTrue(url in cache)
+
+    def test_open(self):
+        """ Streamed responses are stored and can be read back
+        """
+        url = 'http://example.com/data'
+        cache = ResponseCache(self.cache_dir)
+        for _ in range(2):
+            fhandle = cache.open(self.session, url, chunk_size=3)
+            self.assertEqual(fhandle.read(), 'response for ' + url)
+            fhandle.close()
+        self.assertEqual(len(self.session.requests), 1)
+
+    def test_open_oversize(self):
+        """ Responses bigger than the cache can still be opened
+        """
+        url = 'http://example.com/data'
+        cache = ResponseCache(self.cache_dir, max_size=5)
+        fhandle = cache.open(self.session, url, chunk_size=3)
+        self.assertEqual(fhandle.read(), 'response for ' + url)
+        fhandle.close()
+        self.assertFalse(url in cache)
+        self.assertEqual(cache.size, 0)
+
+    def test_content_addressed(self):
+        """ Identical responses are only stored once
+        """
+        cache = ResponseCache(self.cache_dir)
+        cache.put('http://example.com/a', 'some data')
+        cache.put('http://example.com/b', 'some data')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.cache_dir, 'objects'))), 1)
+
+    def test_ttl(self):
+        """ Expired responses are requested again
+        """
+        url = 'http://example.com/data'
+        cache = ResponseCache(self.cache_dir, ttls={'logs': 0})
+        cache.put(url, 'some data', service='logs')
+        self.assertEqual(cache.get(url), 'some data')
+        self.assertEqual(cache.get(url, service='logs'), None)
+
+    def test_eviction(self):
+        """ Least recently used responses are evicted
+        """
+        cache = ResponseCache(self.cache_dir)
+        cache.put('http://example.com/a', 'a' * 1000)
+        cache.max_size = 2 * cache.size
+        cache.put('http://example.com/b', 'b' * 1000)
+        cache.get('http://example.com/a')
+        cache.put('http://example.com/c', 'c' * 1000)
+        self.assertTrue('http://example.com/a' in cache)
+        self.assertFalse('http://example.com/b' in cache)
+        self.assertTrue('http://example.com/c' in cache)
+        self.assertTrue(cache.size <= cache.max_size)
+
+    def test_replaced(self):
+        """ Replaced responses don't leave their old content behind
+        """
+        url = 'http://example.com/data'
+        cache = ResponseCache(self.cache_dir)
+        cache.put('http://example.com/other', 'version 0')
+        for version in range(5):
+            cache.put(url, 'version {0}'.format(version))
+        self.assertEqual(cache.get(url), 'version 4')
+        self.assertEqual(len(cache), 2)
+        objects = os.listdir(os.path.join(self.cache_dir, 'objects'))
+        self.assertEqual(len(objects), 2)
+        self.assertEqual(cache.size, sum(
+            os.path.getsize(os.path.join(self.cache_dir, 'objects', name))
+            for name in objects))
+
+        # Shared content is kept while another entry still refers to it
+        cache.put('http://example.com/other', 'version 4')
+        cache.put(url, 'version 5')
+        self.assertEqual(cache.get('http://example.com/other'), 'version 4')
+
+    def test_orphans_evicted(self):
+        """ Objects that no entry refers to don't count towards the size
+        """
+        cache = ResponseCache(self.cache_dir)
+        cache.put('http://example.com/a', 'a' * 1000)
+        with cache._db:
+            cache._db.execute('DELETE FROM entries')
+        cache.max_size = cache.size + 1
+        cache.put('http://example.com/b', 'a' * 999)
+        self.assertTrue('http://example.com/b' in cache)
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.cache_dir, 'objects'))), 1)
+
+    def test_offline(self):
+        """ Offline caches serve expired responses but don't make requests
+        """
+        url = 'http://example.com/data'
+        cache = ResponseCache(self.cache_dir, default_ttl=0, offline=True)
+        cache.put(url, 'some data')
+        self.assertEqual(cache.fetch(self.session, url), 'some data')
+        self.assertRaises(CacheMiss, cache.fetch, self.session,
+                          'http://example.com/other')
+        self.assertEqual(self.session.requests, [])
+
+    def test_clear(self):
+        """ Clearing the cache removes everything
+        """
+        cache = ResponseCache(self.cache_dir)
+        cache.put('http://example.com/a', 'some data')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(
+            os.listdir(os.path.join(self.cache_dir, 'objects')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
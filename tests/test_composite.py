@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+""" file:   test_composite.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Friday 23 January, 2015
+
+    description: Tests for length-weighted compositing in
+        pysiss.borehole.analysis.composite
+"""
+
+from pysiss import borehole as pybh
+from pysiss.borehole.analysis.composite import composite, \
+    composite_boundaries
+
+import numpy
+import unittest
+
+GOLD = pybh.PropertyType(name="Au", units="ppm")
+COPPER = pybh.PropertyType(name="Cu", units="ppm")
+ROCK_TYPE = pybh.PropertyType(name="rock", isnumeric=False)
+
+
+def brute_force(from_depths, to_depths, values, comp_from, comp_to):
+    """ Composite by looping over the composites
+    """
+    result = []
+    for start, stop in zip(comp_from, comp_to):
+        overlap = numpy.clip(numpy.minimum(to_depths, stop)
+                             - numpy.maximum(from_depths, start), 0, None)
+        with numpy.errstate(invalid='ignore'):
+            result.append((overlap * values).sum() / overlap.sum())
+    return numpy.array(result)
+
+
+class TestComposite(unittest.TestCase):
+
+    """ Check the integral-based compositing engine
+    """
+
+    def setUp(self):
+        self.dataset = pybh.IntervalDataSet(
+            "assays", [0.0, 0.5, 1.7, 3.0, 6.0, 6.5],
+            [0.5, 1.7, 2.4, 4.0, 6.5, 8.0])
+        self.dataset.add_property(
+            GOLD, numpy.array([1., 2., 3., 4., 5., 6.]))
+        self.dataset.add_property(
+            COPPER, numpy.array([10., numpy.nan, 30., 40., 50., 60.]))
+        self.dataset.add_property(
+            ROCK_TYPE, numpy.array(["SA", "SA", "SL", "SL", "SL", "SC"]))
+
+    def test_boundaries(self):
+        """ Fixed-length composites restart at breaks
+        """
+        comp_from, comp_to = composite_boundaries(0.3, 5.1, 2., [3.])
+        self.assertTrue(numpy.allclose(comp_from, [0, 2, 3, 5]))
+        self.assertTrue(numpy.allclose(comp_to, [2, 3, 5, 5.1]))
+        comp_from, comp_to = composite_boundaries(0.3, 5.1, breaks=[3.])
+        self.assertTrue(numpy.allclose(comp_from, [0.3, 3]))
+        self.assertRaises(ValueError, composite_boundaries, 0, 1, -1)
+
+    def test_matches_brute_force(self):
+        """ Random composites match the overlap-weighted mean
+        """
+        rand = numpy.random.RandomState(42)
+        edges = numpy.cumsum(rand.uniform(0.1, 1, 400))
+        from_depths, to_depths = edges[::2], edges[1::2]
+        values = rand.normal(size=(3, 200))
+        comp_from = rand.uniform(0, edges[-1], 50)
+        comp_to = comp_from + rand.uniform(0.5, 5, 50)
+        result, _ = composite(from_depths, to_depths, values,
+                              comp_from, comp_to, min_coverage=0)
+        for row, prop_values in zip(result, values):
+            self.assertTrue(numpy.allclose(
+                row, brute_force(from_depths, to_depths, prop_values,
+                                 comp_from, comp_to), equal_nan=True))
+
+    def test_fixed_length(self):
+        """ Composites are weighted by length and drop gaps
+        """
+        comps = self.dataset.composite(length=2.)
+        self.assertEqual(list(comps.from_depths), [0, 2, 6])
+        self.assertEqual(list(comps.to_depths), [2, 4, 8])
+        self.assertTrue(numpy.allclose(comps.coverage, [1, 0.7, 1]))
+        gold = comps.properties["Au"].values
+        self.assertTrue(numpy.allclose(
+            gold, [(0.5 + 2.4 + 0.9) / 2., (1.2 + 4) / 1.4,
+                   (2.5 + 9) / 2.]))
+        copper = comps.properties["Cu"].values
+        self.assertTrue(numpy.isnan(copper[0]))
+        self.assertTrue(numpy.allclose(copper[1:], [(12 + 40) / 1.4, 57.5]))
+        self.assertTrue("rock" not in comps.properties)
+
+    def test_min_coverage(self):
+        """ Poorly sampled composites are NaN
+        """
+        comps = self.dataset.composite(length=2., min_coverage=0.8)
+        self.assertTrue(numpy.isnan(comps.properties["Au"].values[1]))
+        comps = self.dataset.composite(length=2., min_coverage=0.)
+        self.assertFalse(
+            numpy.isnan(comps.properties["Cu"].values[0]))
+
+    def test_domains(self):
+        """ Composites end at domain boundaries
+        """
+        comps = self.dataset.composite(domain="rock", min_coverage=0.)
+        self.assertEqual(list(comps.from_depths), [0, 1.7, 6.5])
+        self.assertEqual(list(comps.to_depths), [1.7, 6.5, 8])
+        self.assertEqual(list(comps.properties["rock"].values),
+                         ["SA", "SL", "SC"])
+        self.assertTrue(numpy.allclose(
+            comps.properties["Au"].values,
+            [(0.5 + 2.4) / 1.7, (2.1 + 4 + 2.5) / 2.2, 6]))
+
+    def test_composite_boreholes(self):
+        """ Collections are composited in parallel
+        """
+        boreholes = []
+        for idx in range(4):
+            borehole = pybh.Borehole("BH{0}".format(idx))
+            borehole.add_dataset(self.dataset)
+            boreholes.append(borehole)
+        boreholes.append(pybh.Borehole("empty"))
+        for processes in (1, 2):
+            results = pybh.composite_boreholes(
+                boreholes, "assays", processes=processes, length=2.)
+            self.assertEqual(sorted(results.keys()),
+                             ["BH0", "BH1", "BH2", "BH3"])
+            self.assertTrue(numpy.allclose(
+                results["BH3"].properties["Au"].values,
+                self.dataset.composite(length=2.).properties["Au"].values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+""" file:   test_interpolate.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Thursday 15 January, 2015
+
+    description: Tests for the resampling engines in
+        pysiss.borehole.analysis.interpolate
+"""
+
+from pysiss import borehole as pybh
+from pysiss.borehole.analysis.interpolate import nearest_indices, \
+    linear_weights, interpolate_linear, interpolate
+
+import numpy
+import unittest
+from scipy.interpolate import InterpolatedUnivariateSpline as Spline
+
+DENSITY = pybh.PropertyType(name="d", long_name="density", units="g/cm3")
+
+
+class TestInterpolate(unittest.TestCase):
+
+    """ Unit tests for the searchsorted-based interpolation engines
+    """
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.depths = numpy.cumsum(numpy.random.uniform(0.1, 1, 200))
+        self.values = numpy.random.normal(size=200)
+        self.new_depths = numpy.linspace(self.depths[0] - 2,
+                                         self.depths[-1] + 2, 1000)
+
+    def test_nearest_matches_argmin(self):
+        """ Nearest indices should match the brute force distance matrix
+        """
+        expected = numpy.argmin(
+            (self.depths - self.new_depths[:, numpy.newaxis]) ** 2, axis=-1)
+        self.assertTrue(numpy.all(
+            nearest_indices(self.depths, self.new_depths) == expected))
+
+    def test_nearest_ties(self):
+        """ Ties should resolve to the shallower sample
+        """
+        indices = nearest_indices([0., 1., 2.], [0.5, 1.5, 1.])
+        self.assertEqual(list(indices), [0, 1, 1])
+
+    def test_nearest_single_depth(self):
+        """ Everything is nearest to a single depth
+        """
+        indices = nearest_indices([3.], [0., 3., 10.])
+        self.assertEqual(list(indices), [0, 0, 0])
+
+    def test_linear_matches_spline(self):
+        """ Linear interpolation should match a first-order spline,
+            including extrapolation past the ends of the data
+        """
+        expected = Spline(self.depths, self.values, k=1)(self.new_depths)
+        result = interpolate_linear(self.depths, self.values, self.new_depths)
+        self.assertTrue(numpy.allclose(result, expected))
+
+    def test_linear_weights_exact(self):
+        """ Weights should be zero at sample depths
+        """
+        lower, weight = linear_weights([0., 1., 2.], [0., 1., 2.])
+        self.assertEqual(list(lower), [0, 1, 1])
+        self.assertTrue(numpy.allclose(weight, [0., 0., 1.]))
+
+    def test_batched_matches_spline(self):
+        """ Batched interpolation should match fitting each row separately
+        """
+        block = numpy.random.normal(size=(5, len(self.depths)))
+        for degree in (1, 2, 3, 4, 5):
+            result = interpolate(self.depths, block, self.new_depths,
+                                 degree=degree)
+            self.assertEqual(result.shape, (5, len(self.new_depths)))
+            for row, values in zip(result, block):
+                spl = Spline(self.depths, values, k=degree)
+                self.assertTrue(numpy.allclose(row, spl(self.new_depths)),
+                                'degree {0}'.format(degree))
+
+    def test_bad_degree(self):
+        """ Unsupported degrees raise a ValueError
+        """
+        for degree in (-1, 6, 1.5):
+            self.assertRaises(ValueError, interpolate, self.depths,
+                              self.values, self.new_depths, degree=degree)
+
+    def test_batched_nearest(self):
+        """ Batched nearest-neighbour gives the same samples for each row
+        """
+        block = numpy.vstack([self.values, 2 * self.values])
+        result = interpolate(self.depths, block, self.new_depths, degree=0)
+        indices = nearest_indices(self.depths, self.new_depths)
+        self.assertTrue(numpy.all(result[0] == self.values[indices]))
+        self.assertTrue(numpy.all(result[1] == 2 * self.values[indices]))
+
+    def test_batched_one_dimensional(self):
+        """ One-dimensional values give a one-dimensional result
+        """
+        result = interpolate(self.depths, self.values, self.new_depths)
+        self.assertEqual(result.shape, self.new_depths.shape)
+
+    def test_batched_wrong_size(self):
+        """ Values with the wrong number of samples raise a ValueError
+        """
+        self.assertRaises(ValueError, interpolate, self.depths,
+                          numpy.ones((2, 3)), self.new_depths)
+
+    def test_linear_needs_two_depths(self):
+        """ Linear interpolation with one depth should raise a ValueError
+        """
+        self.assertRaises(ValueError, linear_weights, [1.], [1., 2.])
+
+
+class TestPointDataSetResample(unittest.TestCase):
+
+    """ Check PointDataSet resampling uses the interpolation engines
+    """
+
+    def setUp(self):
+        depths = numpy.concatenate([numpy.linspace(0, 10, 101),
+                                    numpy.linspace(20, 30, 101)])
+        self.dataset = pybh.PointDataSet('test', depths)
+        self.dataset.add_property(DENSITY, numpy.sin(depths))
+        self.dataset.split_at_gaps()
+
+    def test_regularize_nearest(self):
+        """ Nearest-neighbour regularization gives existing values
+        """
+        newdom = self.dataset.regularize(fill_method='interpolate', degree=0)
+        values = newdom.properties['d'].values
+        self.assertTrue(numpy.all(numpy.in1d(
+            values, self.dataset.properties['d'].values)))
+
+    def test_resample_linear(self):
+        """ Linear resampling matches a first-order spline
+        """
+        new_depths = numpy.linspace(0, 30, 77)
+        newdom = self.dataset.resample(new_depths, fill_method='interpolate',
+                                       degree=1)
+        expected = Spline(self.dataset.depths,
+                          self.dataset.properties['d'].values, k=1)
+        self.assertTrue(numpy.allclose(newdom.properties['d'].values,
+                                       expected(new_depths)))
+
+    def test_resample_many_properties(self):
+        """ All numeric properties are resampled, non-numeric ones skipped
+        """
+        for idx in range(20):
+            self.dataset.add_property(
+                pybh.PropertyType('p{0}'.format(idx)),
+                idx * self.dataset.depths)
+        self.dataset.add_property(pybh.PropertyType('rock', isnumeric=False),
+                                  ['SA'] * self.dataset.size)
+        new_depths = numpy.linspace(0, 30, 45)
+        newdom = self.dataset.resample(new_depths, fill_method='interpolate',
+                                       degree=3)
+        self.assertEqual(len(newdom.properties), 21)
+        self.assertTrue('rock' not in newdom.properties)
+        for idx in range(20):
+            self.assertTrue(numpy.allclose(
+                newdom.properties['p{0}'.format(idx)].values,
+                idx * new_depths))
+
+    def test_resample_fills_gaps(self):
+        """ Resampled points in gaps get the median value
+        """
+        new_depths = numpy.linspace(0, 30, 61)
+        newdom = self.dataset.resample(new_depths, fill_method='median')
+        in_gap = numpy.logical_and(new_depths > 10, new_depths < 20)
+        medval = numpy.median(self.dataset.properties['d'].values)
+        self.assertTrue(numpy.allclose(
+            newdom.properties['d'].values[in_gap], medval))
+
+    def test_gaps_are_arrays(self):
+        """ Gaps and subdatasets are (from, to) arrays covering the data
+        """
+        self.assertTrue(numpy.allclose(self.dataset.gaps, [[10, 20]]))
+        self.assertTrue(numpy.allclose(self.dataset.subdatasets,
+                                       [[0, 10], [20, 30]]))
+
+    def test_resample_local_fills(self):
+        """ Local fills use the subdatasets either side of each gap
+        """
+        depths = numpy.array([0, 1, 2, 10, 11, 20, 21, 22, 23], dtype=float)
+        dataset = pybh.PointDataSet('gappy', depths)
+        dataset.add_property(DENSITY, numpy.array(
+            [1, 2, 6, 10, 20, 3, 4, 5, 100], dtype=float))
+        dataset.split_at_gaps(threshold=3)
+        self.assertTrue(numpy.allclose(dataset.gaps, [[2, 10], [11, 20]]))
+
+        new_depths = numpy.array([5, 15])
+        newdom = dataset.resample(new_depths, fill_method='local mean')
+        self.assertTrue(numpy.allclose(newdom.properties['d'].values,
+                                       [(3 + 15) / 2., (15 + 28) / 2.]))
+        newdom = dataset.resample(new_depths, fill_method='local median')
+        self.assertTrue(numpy.allclose(newdom.properties['d'].values,
+                                       [6, 7.5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
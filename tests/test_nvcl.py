@@ -7,8 +7,16 @@
 """
 
 import unittest
+import numpy
+import requests
+import shutil
+import tempfile
 import pysiss.webservices.nvcl as nvcl
 
+import nvcl_stub
+from nvcl_stub import NVCLStubServer
+from pysiss.webservices.cache import ResponseCache, CacheMiss
+
 
 class TestNVCLEndpointRegistry(unittest.TestCase):
 
@@ -95,3 +103,283 @@ class TestNVCLImporter(unittest.TestCase):
         """ Test some sample usage using the GSWA endpoint
         """
         self.importers['GSWA'].get_borehole('PDP2C', get_analytes=True)
+
+
+class TestNVCLBulkHarvest(unittest.TestCase):
+
+    """ Test bulk downloads using a local stub NVCL endpoint
+    """
+
+    def test_get_borehole(self):
+        """ Get a single borehole from the stub endpoint
+        """
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            bhl = importer.get_borehole('HOLE1')
+            self.assertEqual(bhl.name, 'HOLE1')
+            dataset = bhl.point_datasets['HOLE1 scalars']
+            self.assertEqual(list(dataset.depths), [1.0, 1.5, 2.0, 2.5, 3.0])
+
+            # Analytes should be typed
+            weights = dataset.properties['Wt1 uTSAS']
+            self.assertTrue(weights.property_type.isnumeric)
+            self.assertEqual(weights.values.dtype, numpy.float32)
+            groups = dataset.properties['Grp1 uTSAS']
+            self.assertFalse(groups.property_type.isnumeric)
+            self.assertEqual(list(groups.values.categories),
+                             ['KAOLIN', 'WHITE-MICA'])
+
+    def test_get_boreholes(self):
+        """ All boreholes are returned, and failures are reported without
+            stopping the batch
+        """
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            results = dict((ident, (bhl, error)) for ident, bhl, error
+                           in importer.get_boreholes(max_workers=3))
+
+            # The collection should only be requested once for the batch
+            wfs_requests = [r for r in server.requests
+                            if r.startswith('/wfs')]
+            self.assertEqual(len(wfs_requests), 1)
+
+        self.assertEqual(sorted(results.keys()), sorted(nvcl_stub.BOREHOLES))
+        for ident in ('HOLE1', 'HOLE2', 'HOLE3'):
+            bhl, error = results[ident]
+            self.assertTrue(error is None)
+            self.assertEqual(bhl.name, ident)
+            self.assertEqual(len(bhl.point_datasets), 1)
+        bhl, error = results['BROKEN']
+        self.assertTrue(bhl is None)
+        self.assertTrue(isinstance(error, requests.HTTPError))
+
+    def test_get_boreholes_subset(self):
+        """ Unknown boreholes are reported as errors
+        """
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            results = list(importer.get_boreholes(['HOLE2', 'NOTAHOLE'],
+                                                  get_analytes=False))
+        results = dict((ident, (bhl, err)) for ident, bhl, err in results)
+        self.assertEqual(results['HOLE2'][0].name, 'HOLE2')
+        self.assertTrue(isinstance(results['NOTAHOLE'][1], KeyError))
+
+
+class TestNVCLBoreholeIndex(unittest.TestCase):
+
+    """ Test caching of the borehole collection
+    """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    @staticmethod
+    def wfs_requests(server):
+        """ Return the number of WFS requests made to the server
+        """
+        return len([r for r in server.requests if r.startswith('/wfs')])
+
+    def test_index_reused(self):
+        """ The collection is only downloaded once per importer
+        """
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            for ident in ('HOLE1', 'HOLE2', 'HOLE1'):
+                importer.get_borehole(ident, get_analytes=False)
+            self.assertEqual(
+                sorted(importer.get_borehole_idents()),
+                sorted(nvcl_stub.BOREHOLES))
+            self.assertEqual(self.wfs_requests(server), 1)
+
+    def test_maxids(self):
+        """ Requests for a limited number of holes go to the server
+        """
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            importer.get_borehole_idents_and_urls(maxids=2)
+            self.assertTrue('maxFeatures=2' in server.requests[-1])
+
+    def test_disk_cache(self):
+        """ A fresh index on disk is used without a request
+        """
+        with NVCLStubServer() as server:
+            nvcl.NVCLImporter(server.endpoint, cache_dir=self.cache_dir)\
+                .get_borehole_idents()
+            importer = nvcl.NVCLImporter(server.endpoint,
+                                         cache_dir=self.cache_dir)
+            urls = importer.get_borehole_idents_and_urls()
+            self.assertEqual(self.wfs_requests(server), 1)
+            self.assertTrue(urls['HOLE1'].endswith('/borehole/HOLE1'))
+
+    def test_revalidate(self):
+        """ A stale index is revalidated with the ETag
+        """
+        with NVCLStubServer() as server:
+            nvcl.NVCLImporter(server.endpoint, cache_dir=self.cache_dir)\
+                .get_borehole_idents()
+            importer = nvcl.NVCLImporter(server.endpoint,
+                                         cache_dir=self.cache_dir,
+                                         index_ttl=0)
+            urls = importer.get_borehole_idents_and_urls()
+            self.assertEqual(self.wfs_requests(server), 2)
+            self.assertEqual(sorted(urls.keys()), sorted(nvcl_stub.BOREHOLES))
+
+            # Explicit refreshes always check with the server
+            importer.refresh_borehole_index()
+            self.assertEqual(self.wfs_requests(server), 3)
+
+
+class TestNVCLPlan(unittest.TestCase):
+
+    """ Test planning downloads from the dataset and log metadata
+    """
+
+    @staticmethod
+    def log_requests(server):
+        return [r for r in server.requests if 'getLogCollection' in r]
+
+    def test_plan(self):
+        """ Logs are requested if the dataset collection doesn't have them
+        """
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            for ident, nlogrequests in (('HOLE1', 1), ('HOLE3', 0)):
+                del server.requests[:]
+                plan = importer.plan_borehole(ident)
+                self.assertEqual(len(self.log_requests(server)),
+                                 nlogrequests)
+                dataset = plan['{0} scalars'.format(ident)]
+                self.assertEqual(dataset.ident, '{0}-dataset'.format(ident))
+                self.assertEqual(
+                    dataset.logs,
+                    [nvcl.NVCLLog('log-grp', 'Grp1 uTSAS', 5),
+                     nvcl.NVCLLog('log-wt', 'Wt1 uTSAS', 5)])
+
+    def test_get_borehole_with_plan(self):
+        """ Planned boreholes don't request metadata again
+        """
+        with NVCLStubServer() as server:
+            importer = nvcl.NVCLImporter(server.endpoint)
+            plan = importer.plan_borehole('HOLE1')
+            dataset = plan['HOLE1 scalars']
+            plan['HOLE1 scalars'] = dataset._replace(logs=dataset.logs[1:])
+            del server.requests[:]
+
+            bhl = importer.get_borehole('HOLE1', plan=plan)
+            self.assertEqual(len(self.log_requests(server)), 0)
+            self.assertFalse(any('getDatasetCollection' in r
+                                 for r in server.requests))
+            self.assertTrue(server.requests[-1].endswith('logid=log-wt'))
+            self.assertTrue('HOLE1 scalars' in bhl.point_datasets)
+
+
+class TestReadScalars(unittest.TestCase):
+
+    """ Test streaming CSV ingest
+    """
+
+    def read(self, csv, **kwargs):
+        return nvcl.read_scalars(csv.splitlines(True), **kwargs)
+
+    def test_types(self):
+        """ Numeric and categorical analytes are inferred
+        """
+        depths, columns = self.read(nvcl_stub.SCALARS, chunk_size=2)
+        columns = dict(columns)
+        self.assertEqual(list(depths), [1.0, 1.5, 2.0, 2.5, 3.0])
+        numpy.testing.assert_array_equal(
+            columns['Wt1 uTSAS'], [0.5, 0.25, 0.75, numpy.nan, 1.0])
+        self.assertEqual(columns['Wt1 uTSAS'].dtype, numpy.float32)
+        self.assertEqual(list(columns['Grp1 uTSAS'].codes),
+                         [0, 0, 1, -1, 0])
+
+    def test_declared_types(self):
+        """ Declared types override inference, and unparseable values are
+            set to NaN
+        """
+        depths, columns = self.read(
+            nvcl_stub.SCALARS, dtypes={'Grp1 uTSAS': 'float32',
+                                       'Wt1 uTSAS': 'category'})
+        columns = dict(columns)
+        self.assertTrue(numpy.isnan(columns['Grp1 uTSAS']).all())
+        self.assertEqual(list(columns['Wt1 uTSAS'].categories),
+                         ['0.5', '0.25', '0.75', '1.0'])
+        self.assertRaises(ValueError, self.read, nvcl_stub.SCALARS,
+                          dtypes={'Wt1 uTSAS': 'int8'})
+
+    def test_blank_first_chunk(self):
+        """ Analytes with no values in the first chunk have their types
+            inferred from their first values
+        """
+        csv = ('StartDepth,EndDepth,Min1,Wt\n'
+               + ''.join('{0},{0},,{0}\n'.format(depth)
+                         for depth in range(5000))
+               + '5000,5000,KAOLIN,1\n5001,5001,,2\n5002,5002,MICA,3\n')
+        depths, columns = self.read(csv, chunk_size=1000)
+        columns = dict(columns)
+        minerals = columns['Min1']
+        self.assertEqual(len(minerals), 5003)
+        self.assertEqual(list(minerals.categories), ['KAOLIN', 'MICA'])
+        self.assertEqual(list(minerals.codes[-4:]), [-1, 0, -1, 1])
+        self.assertTrue((minerals.codes[:5000] == -1).all())
+        self.assertEqual(columns['Wt'].dtype, numpy.float32)
+
+    def test_unsorted(self):
+        """ Out-of-order depths are sorted and duplicates dropped
+        """
+        csv = ('StartDepth,EndDepth,Wt\n'
+               '2.0,2.0,2\n1.0,1.0,1\n3.0,3.0,3\n1.0,1.0,10\n')
+        depths, columns = self.read(csv, size_hint=1, chunk_size=1)
+        self.assertEqual(list(depths), [1.0, 2.0, 3.0])
+        self.assertEqual(list(columns[0][1]), [1.0, 2.0, 3.0])
+
+
+class TestNVCLResponseCache(unittest.TestCase):
+
+    """ Test caching of NVCL data service responses
+    """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    @staticmethod
+    def data_requests(server):
+        """ Return the paths of the non-WFS requests made to the server
+        """
+        return [r for r in server.requests if not r.startswith('/wfs')]
+
+    def test_cached_borehole(self):
+        """ A second harvest of the same borehole is served from the cache
+        """
+        with NVCLStubServer() as server:
+            cache = ResponseCache(self.cache_dir, ttls=nvcl.NVCL_CACHE_TTLS)
+            importer = nvcl.NVCLImporter(server.endpoint, cache=cache)
+            bhl = importer.get_borehole('HOLE1')
+            nrequests = len(self.data_requests(server))
+            self.assertEqual(nrequests, 4)
+
+            importer = nvcl.NVCLImporter(server.endpoint, cache=cache)
+            cached_bhl = importer.get_borehole('HOLE1')
+            self.assertEqual(len(self.data_requests(server)), nrequests)
+            self.assertEqual(sorted(cached_bhl.datasets.keys()),
+                             sorted(bhl.datasets.keys()))
+
+    def test_offline(self):
+        """ Offline importers only use the cache
+        """
+        with NVCLStubServer() as server:
+            cache = ResponseCache(self.cache_dir)
+            importer = nvcl.NVCLImporter(server.endpoint, cache=cache)
+            importer.get_borehole('HOLE1')
+
+            cache.offline = True
+            nrequests = len(self.data_requests(server))
+            self.assertTrue(importer.get_borehole('HOLE1') is not None)
+            self.assertRaises(CacheMiss, importer.get_borehole, 'HOLE2')
+            self.assertEqual(len(self.data_requests(server)), nrequests)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+""" file:   test_property_block.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Friday 16 January, 2015
+
+    description: Tests for columnar property storage
+"""
+
+from pysiss import borehole as pybh
+
+import numpy
+import unittest
+
+
+class TestPropertyBlock(unittest.TestCase):
+
+    """ Unit tests for PropertyBlock and its use in DataSets
+    """
+
+    def setUp(self):
+        self.depths = numpy.linspace(0, 10, 11)
+        self.ptypes = [pybh.PropertyType('p{0}'.format(i)) for i in range(3)]
+        self.values = numpy.arange(33, dtype=float).reshape(3, 11)
+        self.dataset = pybh.PointDataSet('test', self.depths)
+        self.block = self.dataset.add_properties(self.ptypes, self.values)
+
+    def test_views(self):
+        """ Properties should be views into the block
+        """
+        for row, ptype in enumerate(self.ptypes):
+            prop = self.dataset.properties[ptype.name]
+            self.assertTrue(numpy.may_share_memory(prop.values,
+                                                   self.block.values))
+            self.assertTrue(numpy.all(prop.values == self.values[row]))
+
+    def test_wrong_shape(self):
+        """ A block with the wrong number of rows raises a ValueError
+        """
+        self.assertRaises(ValueError, pybh.PropertyBlock,
+                          self.ptypes, numpy.ones((2, 11)))
+
+    def test_numeric_values_no_copy(self):
+        """ get_numeric_values should return the block itself
+        """
+        ptypes, values = self.dataset.get_numeric_values()
+        self.assertTrue(values is self.block.values)
+        self.assertEqual([p.name for p in ptypes], self.block.names)
+
+    def test_add_property_into_block(self):
+        """ Replacing a numeric property writes into the block
+        """
+        self.dataset.add_property(self.ptypes[1], numpy.zeros(11))
+        self.assertTrue(numpy.all(self.block.values[1] == 0))
+        self.assertTrue(numpy.may_share_memory(
+            self.dataset.properties['p1'].values, self.block.values))
+
+    def test_extend(self):
+        """ Adding more properties extends the block and repoints the
+            existing properties
+        """
+        prop = self.dataset.properties['p0']
+        self.dataset.add_properties([pybh.PropertyType('q')],
+                                    numpy.ones((1, 11)))
+        self.assertEqual(len(self.dataset.block), 4)
+        self.assertTrue(numpy.may_share_memory(prop.values,
+                                               self.dataset.block.values))
+        self.assertTrue(numpy.all(prop.values == self.values[0]))
+
+    def test_consolidate(self):
+        """ Consolidating moves separately stored properties into the block
+        """
+        dataset = pybh.PointDataSet('test', self.depths)
+        dataset.add_property(self.ptypes[0], self.values[0])
+        dataset.add_property(self.ptypes[1], self.values[1].copy())
+        dataset.add_property(pybh.PropertyType('rock', isnumeric=False),
+                             ['SA'] * 11)
+        block = dataset.consolidate()
+        self.assertEqual(sorted(block.names), ['p0', 'p1'])
+        self.assertTrue(numpy.may_share_memory(
+            dataset.properties['p0'].values, block.values))
+        self.assertEqual(dataset.properties['rock'].values, ['SA'] * 11)
+
+    def test_get_interval(self):
+        """ Taking an interval keeps the values in a block
+        """
+        newdom = self.dataset.get_interval(2, 5)
+        self.assertEqual(newdom.block.values.shape, (3, 4))
+        self.assertTrue(numpy.all(newdom.properties['p2'].values ==
+                                  self.values[2, 2:6]))
+
+    def test_to_dataframe(self):
+        """ Dataframe columns match the block rows
+        """
+        self.dataset.add_property(pybh.PropertyType('rock', isnumeric=False),
+                                  numpy.asarray(['SA'] * 11))
+        frame = self.dataset.to_dataframe()
+        for row, ptype in enumerate(self.ptypes):
+            self.assertTrue(numpy.all(frame[ptype.name] == self.values[row]))
+        self.assertTrue(numpy.all(frame['rock'] == 'SA'))
+
+    def test_resample(self):
+        """ Resampled datasets store their values in a block
+        """
+        self.dataset.split_at_gaps()
+        newdom = self.dataset.resample(numpy.linspace(0, 10, 21),
+                                       fill_method='interpolate', degree=1)
+        self.assertEqual(newdom.block.values.shape, (3, 21))
+        self.assertTrue(numpy.allclose(newdom.properties['p0'].values,
+                                       numpy.linspace(0, 10, 21)))
+
+
+if __name__ == '__main__':
+    unittest.main()
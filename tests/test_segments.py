@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+""" file:   test_segments.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Friday 23 January, 2015
+
+    description: Tests for the segment reductions in
+        pysiss.borehole.analysis.segments
+"""
+
+from pysiss import borehole as pybh
+from pysiss.borehole.analysis.segments import interval_index, range_reduce, \
+    segment_reduce, label_reduce
+
+import numpy
+import unittest
+
+REDUCTIONS = {
+    'count': lambda x: numpy.sum(~numpy.isnan(x)),
+    'sum': lambda x: numpy.sum(x[~numpy.isnan(x)]),
+    'mean': lambda x: numpy.mean(x[~numpy.isnan(x)]),
+    'median': lambda x: numpy.median(x[~numpy.isnan(x)]),
+    'min': lambda x: numpy.min(x[~numpy.isnan(x)]),
+    'max': lambda x: numpy.max(x[~numpy.isnan(x)]),
+    'std': lambda x: numpy.std(x[~numpy.isnan(x)])
+}
+
+
+class TestSegments(unittest.TestCase):
+
+    """ Check the vectorized reductions against looping over the segments
+    """
+
+    def setUp(self):
+        rand = numpy.random.RandomState(42)
+        self.values = rand.normal(size=(3, 60))
+        self.values[1, 7] = numpy.nan
+        self.values[2, 20:25] = numpy.nan
+        self.starts = numpy.array([2, 2, 10, 20, 25, 25, 40, 59])
+        self.stops = numpy.append(self.starts[1:], 60)
+
+    def test_interval_index(self):
+        """ Depths are labelled with the interval containing them
+        """
+        depths = [-1, 0, 2, 3, 5, 8, 9]
+        self.assertEqual(list(interval_index([0, 5], [2, 8], depths)),
+                         [-1, 0, 0, -1, 1, 1, -1])
+        self.assertEqual(
+            list(interval_index([0, 5], [2, 8], depths, closed='left')),
+            [-1, 0, -1, -1, 1, -1, -1])
+        self.assertEqual(list(interval_index([], [], depths)), [-1] * 7)
+
+    def test_range_reduce(self):
+        """ Overlapping ranges give the same results as numpy
+        """
+        starts, stops = [0, 5, 3, 30, 10], [10, 15, 40, 30, 60]
+        for method, func in (('mean', numpy.mean), ('median', numpy.median)):
+            expected = [[func(row[a:b]) if b > a else numpy.nan
+                         for a, b in zip(starts, stops)]
+                        for row in self.values]
+            self.assertTrue(numpy.allclose(
+                range_reduce(self.values, starts, stops, method),
+                expected, equal_nan=True))
+
+    def test_segment_reduce(self):
+        """ Every reduction ignores NaNs and handles empty segments
+        """
+        for method, func in REDUCTIONS.items():
+            expected = []
+            for row in self.values:
+                expected.append([])
+                for start, stop in zip(self.starts, self.stops):
+                    segment = row[start:stop]
+                    if numpy.isnan(segment).all() \
+                            and method not in ('count', 'sum'):
+                        expected[-1].append(numpy.nan)
+                    else:
+                        expected[-1].append(func(segment))
+            result = segment_reduce(self.values, self.starts, method)
+            self.assertTrue(
+                numpy.allclose(result, expected, equal_nan=True), method)
+
+    def test_one_dimensional(self):
+        """ One-dimensional values give one-dimensional results
+        """
+        result = segment_reduce(self.values[0], [0, 30], 'max')
+        self.assertEqual(result.shape, (2,))
+        self.assertEqual(result[1], self.values[0, 30:].max())
+
+    def test_label_reduce(self):
+        """ Labels don't need to be contiguous
+        """
+        labels = numpy.tile(['b', 'a', 'c'], 20)
+        unique, result = label_reduce(self.values[0], labels, 'median')
+        self.assertEqual(list(unique), ['a', 'b', 'c'])
+        self.assertTrue(numpy.allclose(
+            result, [numpy.median(self.values[0][labels == l])
+                     for l in unique]))
+
+    def test_unknown_method(self):
+        """ Unknown reductions raise a ValueError
+        """
+        self.assertRaises(ValueError, segment_reduce,
+                          self.values, self.starts, 'mode')
+
+
+class TestSummarize(unittest.TestCase):
+
+    """ Check dataset summaries over subdatasets and labels
+    """
+
+    def setUp(self):
+        depths = numpy.array([0, 1, 2, 10, 11, 20, 21, 22, 23], dtype=float)
+        self.dataset = pybh.PointDataSet('gappy', depths)
+        self.dataset.add_property(pybh.PropertyType('d'), numpy.array(
+            [1, 2, 6, 10, 20, 3, 4, 5, 100], dtype=float))
+        self.dataset.add_property(pybh.PropertyType('rock', isnumeric=False),
+                                  numpy.array(list('AABBBAACC')))
+        self.dataset.split_at_gaps(threshold=3)
+
+    def test_subdatasets(self):
+        """ Summaries are indexed by subdataset
+        """
+        summary = self.dataset.summarize('max')
+        self.assertEqual(list(summary.columns), ['d'])
+        self.assertEqual(list(summary.index),
+                         [(0, 2), (10, 11), (20, 23)])
+        self.assertEqual(list(summary.d), [6, 20, 100])
+        self.assertEqual(list(self.dataset.summarize('count').d), [3, 2, 4])
+
+    def test_labels(self):
+        """ Summaries can be grouped by a property
+        """
+        summary = self.dataset.summarize('mean', labels='rock')
+        self.assertEqual(list(summary.index), ['A', 'B', 'C'])
+        self.assertTrue(numpy.allclose(summary.d, [2.5, 12, 52.5]))
+
+    def test_intervals(self):
+        """ Interval datasets are split at gaps between intervals
+        """
+        dataset = pybh.IntervalDataSet('intervals', [0, 1, 5, 6],
+                                       [1, 2, 6, 8])
+        dataset.add_property(pybh.PropertyType('d'), [1., 3., 5., 9.])
+        summary = dataset.summarize('mean')
+        self.assertEqual(list(summary.index), [(0, 2), (5, 8)])
+        self.assertEqual(list(summary.d), [2, 7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,11 +9,83 @@
 """
 
 from datetime import datetime
+from lxml import etree
+import copy
 import os
+import re
+import shutil
+import tempfile
+import time
 import unittest
+import xml.etree.ElementTree
 import requests
 
 import pysiss.borehole as pybh
+from pysiss.borehole.siss import borehole_generator
+
+from decorators import slow
+
+
+def replicate_boreholes(xml_file, nfeatures, out_file):
+    """ Write a copy of a GeoSciML document with the Borehole elements
+        repeated until there are nfeatures of them
+    """
+    tree = etree.parse(xml_file)
+    boreholes = [elem for elem in tree.iter(tag=etree.Element)
+                 if etree.QName(elem).localname == 'Borehole']
+    for idx in range(nfeatures - len(boreholes)):
+        template = boreholes[idx % len(boreholes)]
+        member = template.getparent()
+        if len(member) == 1:
+            # Copy the feature member wrapper too
+            member.addnext(copy.deepcopy(member))
+        else:
+            template.addnext(copy.deepcopy(template))
+    tree.write(out_file)
+
+
+def elementtree_lookups(xml_file):
+    """ Look up every borehole detail using ElementTree with uncompiled,
+        namespace-expanded paths (the old SISSBoreholeGenerator approach).
+
+        Returns the number of boreholes found.
+    """
+    tags = dict(('{{{0}}}Borehole'.format(borehole_generator.NS[key]), key)
+                for key in ('gsml', 'gsmlbh'))
+    prefixes = re.compile(r'(bh|gml|sa|xlink):')
+    suffix = re.compile(r'/(text\(\)|@[\w:]+)$')
+    nboreholes = 0
+    for _, elem in xml.etree.ElementTree.iterparse(xml_file):
+        if elem.tag not in tags:
+            continue
+        ns_key = tags[elem.tag]
+        namespaces = {'bh': borehole_generator.NS[ns_key],
+                      'gml': borehole_generator.GML_NS[ns_key],
+                      'sa': borehole_generator.SHAPE_NS[ns_key],
+                      'xlink': borehole_generator.NS['xlink']}
+        for path in borehole_generator.XPATHS[ns_key].values():
+            path = prefixes.sub(
+                lambda match: '{{{0}}}'.format(namespaces[match.group(1)]),
+                suffix.sub('', path))
+            elem.find(path)
+        elem.clear()
+        nboreholes += 1
+    return nboreholes
+
+
+def lxml_lookups(xml_file):
+    """ Look up every borehole detail using the compiled XPath expressions
+        in SISSBoreholeGenerator.
+
+        Returns the number of boreholes found.
+    """
+    nboreholes = 0
+    xpaths = pybh.SISSBoreholeGenerator.xpaths
+    for elem, ns_key in borehole_generator._iter_borehole_elts(xml_file):
+        for xpath in xpaths[ns_key].values():
+            xpath(elem)
+        nboreholes += 1
+    return nboreholes
 
 
 class SissTest(unittest.TestCase):
@@ -90,6 +162,63 @@ class SissTest(unittest.TestCase):
                            'upper corner': 125.0},
                           bh.details.get('cored interval').values)
 
+    def test_iter_boreholes(self):
+        """ Every Borehole element in a collection is returned, named with
+            its gml:id
+        """
+        xml_file = '{0}/geosciml/geo2test.xml'.format(self.test_dir)
+        bhs = list(self.siss.iter_boreholes(xml_file))
+        self.assertEquals(['gsml.borehole.150390', 'gsml.borehole.205822',
+                           'gsml.borehole.BUGD049', 'gsml.borehole.EBSAE6',
+                           'gsml.borehole.GSDD006'],
+                          [bh.name for bh in bhs])
+        self.assertEquals(-29.804238 * self.siss.unit_reg.degree,
+                          bhs[0].origin_position.latitude)
+        self.assertTrue(all(bh.details.get('driller') is not None
+                            for bh in bhs))
+
+        xml_file = '{0}/geosciml/geo3test.xml'.format(self.test_dir)
+        with open(xml_file) as fhandle:
+            bhs = list(self.siss.iter_boreholes(fhandle))
+        self.assertEquals(['M371484R308'], [bh.name for bh in bhs])
+        self.assertEquals('diamond core',
+                          bhs[0].details.get('drilling method').values)
+
+    @slow
+    def test_benchmark(self):
+        """ Compare detail lookups with ElementTree and precompiled lxml
+            XPath expressions on large collections of boreholes
+        """
+        nfeatures = 5000
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for version in ('geo2test', 'geo3test'):
+                xml_file = os.path.join(tmp_dir, version + '.xml')
+                replicate_boreholes(
+                    '{0}/geosciml/{1}.xml'.format(self.test_dir, version),
+                    nfeatures, xml_file)
+
+                timings = {}
+                for name, lookup in (('elementtree', elementtree_lookups),
+                                     ('lxml', lxml_lookups)):
+                    start = time.time()
+                    self.assertEquals(nfeatures, lookup(xml_file))
+                    timings[name] = time.time() - start
+
+                start = time.time()
+                self.assertEquals(
+                    nfeatures,
+                    sum(1 for _ in self.siss.iter_boreholes(xml_file)))
+                timings['generator'] = time.time() - start
+
+                print ('{0}: {1} boreholes, lookups with ElementTree '
+                       '{elementtree:.2f}s, lxml {lxml:.2f}s, full '
+                       'generator {generator:.2f}s').format(
+                           version, nfeatures, **timings)
+                self.assertTrue(timings['lxml'] < timings['elementtree'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_geosciml_nvcl_scanned_borehole(self):
         """ A test using an XML document corresponding to a scanned
             borehole GeoSciML URL.
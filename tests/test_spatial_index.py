@@ -0,0 +1,217 @@
+""" file:   test_spatial_index.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Tuesday 20 January, 2015
+
+    description: Tests for the spatial index and MappedFeatureCollection
+"""
+
+import unittest
+
+import numpy
+from shapely.geometry import box, Point
+
+from pysiss.utilities import STRTree, get_unit_registry
+from pysiss.coverage.vector import MappedFeature, MappedFeatureCollection, \
+    spatial_join, collar_coordinates
+from pysiss.borehole import Borehole
+from pysiss.borehole.borehole import OriginPosition
+
+
+def random_boxes(size, seed=42):
+    """ Make some random boxes in the unit square
+    """
+    rand = numpy.random.RandomState(seed)
+    corner = rand.uniform(0, 1, size=(size, 2))
+    extent = rand.uniform(0, 0.05, size=(size, 2))
+    return numpy.column_stack([corner, corner + extent])
+
+
+def brute_force(bounds, bbox):
+    """ Find the intersecting boxes by testing all of them
+    """
+    return numpy.flatnonzero(
+        (bounds[:, 0] <= bbox[2]) & (bounds[:, 2] >= bbox[0])
+        & (bounds[:, 1] <= bbox[3]) & (bounds[:, 3] >= bbox[1]))
+
+
+class TestSTRTree(unittest.TestCase):
+
+    """ Test queries against the STR-packed tree
+    """
+
+    def setUp(self):
+        self.bounds = random_boxes(2000)
+        self.tree = STRTree(self.bounds, node_capacity=8)
+
+    def test_levels(self):
+        """ Every level except the root is full-sized
+        """
+        self.assertEqual(len(self.tree), 2000)
+        self.assertEqual([len(level) for level in self.tree.levels],
+                         [2000, 250, 32, 4])
+        self.assertEqual(sorted(self.tree.order), range(2000))
+
+    def test_query(self):
+        """ Box queries match a brute force search
+        """
+        for bbox in [(0.2, 0.2, 0.3, 0.25), (0.5, 0.5, 0.5, 0.5),
+                     (-1, -1, 2, 2), (2, 2, 3, 3)]:
+            self.assertEqual(list(self.tree.query(bbox)),
+                             list(brute_force(self.bounds, bbox)))
+
+    def test_query_points(self):
+        """ Batched point queries match single queries
+        """
+        points = numpy.random.RandomState(1).uniform(0, 1, size=(300, 2))
+        point_idx, item_idx = self.tree.query_points(points[:, 0],
+                                                     points[:, 1])
+        for idx, (x, y) in enumerate(points):
+            self.assertEqual(list(item_idx[point_idx == idx]),
+                             list(brute_force(self.bounds, (x, y, x, y))))
+
+    def test_nearest(self):
+        """ Nearest neighbours are found in order of distance
+        """
+        centres = (self.bounds[:, :2] + self.bounds[:, 2:]) / 2.
+        distance = lambda idx: numpy.hypot(*(centres[idx] - (0.5, 0.5)))
+        nearest = self.tree.nearest(0.5, 0.5, k=5, distance=distance)
+        expected = numpy.argsort(
+            numpy.hypot(*(centres - (0.5, 0.5)).T))[:5]
+        self.assertEqual([idx for idx, _ in nearest], list(expected))
+
+    def test_empty(self):
+        """ Empty trees have no results
+        """
+        tree = STRTree([])
+        self.assertEqual(len(tree.query((0, 0, 1, 1))), 0)
+        self.assertEqual(tree.nearest(0, 0), [])
+
+
+class TestMappedFeatureCollection(unittest.TestCase):
+
+    """ Test spatial queries on a grid of square features
+    """
+
+    def setUp(self):
+        # 10 x 10 grid of unit squares, plus a circle over the middle
+        self.features = MappedFeatureCollection(
+            [MappedFeature(box(i, j, i + 1, j + 1), 'EPSG:4326',
+                           'square', ident='sq.{0}.{1}'.format(i, j))
+             for i in range(10) for j in range(10)], node_capacity=4)
+        self.features.append(MappedFeature(
+            Point(5, 5).buffer(1.5), 'EPSG:4326', 'circle', ident='circle'))
+
+    def test_containing(self):
+        """ Point-in-polygon queries check the shapes
+        """
+        self.assertEqual([f.ident for f in self.features.containing(2.5, 3.5)],
+                         ['sq.2.3'])
+        self.assertEqual(
+            sorted(f.ident for f in self.features.containing(5.5, 5.5)),
+            ['circle', 'sq.5.5'])
+        self.assertEqual(self.features.containing(20, 20), [])
+
+    def test_intersecting(self):
+        """ Box queries check the shapes
+        """
+        idents = [f.ident for f in
+                  self.features.intersecting((0.2, 0.2, 1.5, 0.5))]
+        self.assertEqual(sorted(idents), ['sq.0.0', 'sq.1.0'])
+
+    def test_nearest(self):
+        """ Nearest features are sorted by distance to the shape
+        """
+        nearest = self.features.nearest(12, 0.5, k=2)
+        self.assertEqual([f.ident for f, _ in nearest],
+                         ['sq.9.0', 'sq.9.1'])
+        self.assertAlmostEqual(nearest[0][1], 2.0)
+
+    def test_locate(self):
+        """ Batched point queries give the first containing feature
+        """
+        x = numpy.array([0.5, 5.5, 9.5, 20.0, 3.2])
+        y = numpy.array([0.5, 5.5, 0.5, 20.0, 7.9])
+        self.assertEqual(list(self.features.locate(x, y)),
+                         [0, 55, 90, -1, 37])
+        point_idx, feature_idx = self.features.query_points(x, y)
+        self.assertEqual(list(point_idx), [0, 1, 1, 2, 4])
+        self.assertEqual(list(feature_idx), [0, 55, 100, 90, 37])
+
+    def test_append_rebuilds(self):
+        """ Adding features invalidates the index
+        """
+        self.assertEqual(self.features.containing(20.5, 20.5), [])
+        self.features.append(MappedFeature(
+            box(20, 20, 21, 21), 'EPSG:4326', 'square', ident='far'))
+        self.assertEqual(
+            [f.ident for f in self.features.containing(20.5, 20.5)], ['far'])
+
+
+class TestSpatialJoin(unittest.TestCase):
+
+    """ Test joining boreholes to the features containing their collars
+    """
+
+    def setUp(self):
+        self.features = [
+            MappedFeature(box(120, -30, 121, -29), 'EPSG:4326', 'gu.granite',
+                          ident='mf.1'),
+            MappedFeature(box(120.5, -30, 122, -29), 'EPSG:4326',
+                          'gu.basalt', ident='mf.2')]
+        degree = get_unit_registry().degree
+        radian = get_unit_registry().radian
+        self.boreholes = [
+            Borehole('BH1', OriginPosition(-29.5 * degree, 120.2 * degree,
+                                           0)),
+            Borehole('BH2', OriginPosition(-29.5 * degree, 120.7 * degree,
+                                           0)),
+            Borehole('BH3', OriginPosition(numpy.radians(-29.5) * radian,
+                                           numpy.radians(121.5) * radian,
+                                           0)),
+            Borehole('BH4', OriginPosition(-10 * degree, 120.7 * degree, 0)),
+            Borehole('BH5')]
+
+    def test_collar_coordinates(self):
+        """ Coordinates are converted to degrees
+        """
+        lon, lat = collar_coordinates(self.boreholes)
+        self.assertTrue(numpy.allclose(lon[:4], [120.2, 120.7, 121.5, 120.7]))
+        self.assertTrue(numpy.allclose(lat[:4], [-29.5, -29.5, -29.5, -10]))
+        self.assertTrue(numpy.isnan(lon[4]) and numpy.isnan(lat[4]))
+
+    def test_first_match(self):
+        """ Each borehole gets the first feature containing it
+        """
+        joined = spatial_join(self.boreholes, self.features,
+                              detail_name='geology')
+        self.assertEqual(list(joined.index),
+                         ['BH1', 'BH2', 'BH3', 'BH4', 'BH5'])
+        self.assertEqual(list(joined.feature),
+                         ['mf.1', 'mf.1', 'mf.2', None, None])
+        self.assertEqual(joined.specification['BH3'], 'gu.basalt')
+        self.assertEqual(self.boreholes[0].details['geology'].values,
+                         'gu.granite')
+
+    def test_all_matches(self):
+        """ Overlapping features give a row each
+        """
+        joined = spatial_join(self.boreholes, self.features,
+                              all_matches=True)
+        self.assertEqual(list(joined.index),
+                         ['BH1', 'BH2', 'BH2', 'BH3', 'BH4', 'BH5'])
+        self.assertEqual(list(joined.feature),
+                         ['mf.1', 'mf.1', 'mf.2', 'mf.2', None, None])
+
+    def test_swap_axes(self):
+        """ Features with latitude first can be joined
+        """
+        features = [MappedFeature(box(-30, 120, -29, 121), 'EPSG:4326',
+                                  'gu.granite', ident='mf.1')]
+        joined = spatial_join(self.boreholes, features, swap_axes=True)
+        self.assertEqual(list(joined.feature),
+                         ['mf.1', 'mf.1', None, None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
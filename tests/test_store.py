@@ -0,0 +1,189 @@
+""" file:   test_store.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Wednesday 21 January, 2015
+
+    description: Tests for the columnar borehole store
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import pandas
+
+from pysiss import borehole as pybh
+from pysiss.borehole.borehole import OriginPosition
+from pysiss.borehole.store import LazyProperty
+from pysiss.utilities import get_unit_registry
+
+GOLD = pybh.PropertyType('Au', long_name='gold', units='ppm')
+COPPER = pybh.PropertyType('Cu', units='ppm', detection_limit=0.5)
+ROCK = pybh.PropertyType('rock', isnumeric=False)
+MINERAL = pybh.PropertyType('mineral', isnumeric=False)
+
+
+def make_borehole(name):
+    """ Make a borehole with some of everything
+    """
+    unit_reg = get_unit_registry()
+    borehole = pybh.Borehole(name, OriginPosition(
+        -30 * unit_reg.degree, 121 * unit_reg.degree, 400 * unit_reg.meter))
+    borehole.add_detail('driller', 'Acme Drilling')
+    borehole.add_survey([0, 100], [90, 90], [90, 60])
+    assays = borehole.add_point_dataset('assays', numpy.arange(1000.))
+    assays.add_property(GOLD, numpy.linspace(0, 1, 1000))
+    assays.add_property(COPPER, numpy.sqrt(numpy.arange(1000.)))
+    assays.add_property(MINERAL, pandas.Categorical(
+        ['KAOLIN', 'MICA', None, 'KAOLIN'] * 250))
+    logs = borehole.add_interval_dataset('logs', [0, 10, 25], [10, 20, 30])
+    logs.add_property(ROCK, numpy.array(['granite', 'basalt', 'granite'],
+                                        dtype=object))
+    return borehole
+
+
+class StoreTest(unittest.TestCase):
+
+    """ Tests for saving and loading boreholes
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'boreholes.db')
+        with pybh.BoreholeStore(self.path, chunk_size=128) as store:
+            store.save_all([make_borehole('BH1'), make_borehole('BH2')])
+        self.store = pybh.BoreholeStore(self.path, mode='r')
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_keys(self):
+        """ Stored boreholes are listed
+        """
+        self.assertEqual(self.store.keys(), ['BH1', 'BH2'])
+        self.assertEqual(len(self.store), 2)
+        self.assertTrue('BH1' in self.store)
+        self.assertFalse('BH3' in self.store)
+        self.assertRaises(KeyError, self.store.load, 'BH3')
+
+    def test_round_trip(self):
+        """ Loaded boreholes match the saved ones
+        """
+        original, loaded = make_borehole('BH1'), self.store['BH1']
+        self.assertEqual(loaded.origin_position.latitude,
+                         original.origin_position.latitude)
+        self.assertEqual(loaded.details['driller'].values, 'Acme Drilling')
+        self.assertTrue(numpy.allclose(loaded.survey.dips, [90, 60]))
+
+        assays = loaded.point_datasets['assays']
+        expected = original.point_datasets['assays']
+        self.assertTrue(numpy.array_equal(assays.depths, expected.depths))
+        for name in ('Au', 'Cu'):
+            self.assertTrue(numpy.array_equal(
+                assays.properties[name].values,
+                expected.properties[name].values))
+        copper = assays.properties['Cu'].property_type
+        self.assertEqual((copper.units, copper.detection_limit), ('ppm', 0.5))
+        minerals = assays.properties['mineral'].values
+        self.assertTrue(isinstance(minerals, pandas.Categorical))
+        self.assertEqual(list(minerals[:2]), ['KAOLIN', 'MICA'])
+        self.assertTrue(pandas.isnull(minerals[2]))
+
+        logs = loaded.interval_datasets['logs']
+        self.assertTrue(numpy.array_equal(logs.to_depths, [10, 20, 30]))
+        self.assertEqual(list(logs.properties['rock'].values),
+                         ['granite', 'basalt', 'granite'])
+
+    def test_missing_strings(self):
+        """ Missing values in string properties load back as None
+        """
+        borehole = pybh.Borehole('BH3')
+        logs = borehole.add_interval_dataset('logs', [0, 10, 25],
+                                             [10, 20, 30])
+        logs.add_property(ROCK, numpy.array(['granite', None, 'basalt'],
+                                            dtype=object))
+        path = os.path.join(self.tempdir, 'missing.db')
+        with pybh.BoreholeStore(path) as store:
+            store.save(borehole)
+        with pybh.BoreholeStore(path, mode='r') as store:
+            rock = store['BH3'].interval_datasets['logs'].properties['rock']
+            self.assertEqual(list(rock.values), ['granite', None, 'basalt'])
+
+    def test_lazy_loading(self):
+        """ Property values aren't read until they are used
+        """
+        assays = self.store['BH2'].point_datasets['assays']
+        gold, copper = assays.properties['Au'], assays.properties['Cu']
+        self.assertTrue(isinstance(gold, LazyProperty))
+        self.assertFalse(gold.loaded or copper.loaded)
+        self.assertAlmostEqual(gold.values[-1], 1)
+        self.assertTrue(gold.loaded)
+        self.assertFalse(copper.loaded)
+
+    def test_read_column_range(self):
+        """ Parts of a column can be read across chunk boundaries
+        """
+        depths_column = self.store._db.execute(
+            'SELECT MIN(id) FROM columns').fetchone()[0]
+        values = self.store.read_column(depths_column, 120, 300)
+        self.assertTrue(numpy.array_equal(values, numpy.arange(120., 300.)))
+        self.assertEqual(len(self.store.read_column(depths_column, 5, 5)), 0)
+
+    def test_replace_and_delete(self):
+        """ Saving a borehole again replaces it, and deleting removes its
+            columns
+        """
+        self.assertRaises(IOError, self.store.delete, 'BH1')
+        with pybh.BoreholeStore(self.path) as store:
+            ncolumns = store._db.execute(
+                'SELECT COUNT(*) FROM columns').fetchone()[0]
+            borehole = make_borehole('BH1')
+            del borehole.point_datasets['assays']
+            store.save(borehole)
+            self.assertEqual(store['BH1'].point_datasets, {})
+            del store['BH2']
+            self.assertEqual(store.keys(), ['BH1'])
+            self.assertEqual(store._db.execute(
+                'SELECT COUNT(*) FROM columns').fetchone()[0],
+                (ncolumns / 2) - 4)
+
+    def test_siss_round_trip(self):
+        """ Details of boreholes from GeoSciML documents survive a round
+            trip, including dates and quantities
+        """
+        xml_file = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                'geosciml', 'geo2test.xml')
+        original = pybh.SISSBoreholeGenerator().geosciml_to_borehole(
+            'geosciml2_test', xml_file)
+        with pybh.BoreholeStore(self.path) as store:
+            store.save(original)
+            loaded = store['geosciml2_test']
+        self.assertEqual(sorted(loaded.details.keys()),
+                         sorted(original.details.keys()))
+        for name in original.details.keys():
+            self.assertEqual(loaded.details[name].values,
+                             original.details[name].values)
+        date = loaded.details['date of drilling'].values
+        self.assertEqual(date, datetime.datetime(2009, 7, 27))
+        self.assertEqual(loaded.origin_position.latitude,
+                         original.origin_position.latitude)
+        self.assertEqual(
+            loaded.details['cored interval'].property_type.units,
+            original.details['cored interval'].property_type.units)
+
+    def test_unknown_types(self):
+        """ Values which can't be restored aren't stored
+        """
+        borehole = make_borehole('BH3')
+        borehole.add_detail('bad', object())
+        with pybh.BoreholeStore(self.path) as store:
+            self.assertRaises(TypeError, store.save, borehole)
+            self.assertFalse('BH3' in store)
+
+
+if __name__ == '__main__':
+    unittest.main()
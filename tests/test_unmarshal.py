@@ -0,0 +1,285 @@
+""" file:   test_unmarshal.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Monday 19 January, 2015
+
+    description: Tests for unmarshalling GeoSciML features
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import pysiss.vocabulary.unmarshal as unmarshal_module
+from pysiss.vocabulary.unmarshal import iter_unmarshal, unmarshal_all, \
+    unmarshal_parallel, UnmarshalError
+from pysiss.vocabulary.gml.unmarshallers import position
+from pysiss.metadata import MetadataRegistry
+
+from lxml import etree
+import numpy
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         'geosciml', 'mapped_features.xml')
+
+
+class TestIterUnmarshal(unittest.TestCase):
+
+    """ Test streaming unmarshalling
+    """
+
+    def test_mapped_features(self):
+        """ Every MappedFeature is unmarshalled, and shared specifications
+            survive the elements being cleared
+        """
+        features = list(iter_unmarshal(TEST_FILE))
+        self.assertEqual([f.ident for f in features],
+                         ['mf.1', 'mf.2', 'mf.3'])
+        self.assertEqual([f.specification for f in features],
+                         ['gu.granite', 'gu.granite', 'gu.basalt'])
+        self.assertEqual(features[1].metadata.find(
+            '{http://www.opengis.net/gml}name').text, 'Granite')
+        self.assertEqual(features[2].shape.geom_type, 'LineString')
+
+    def test_file_object(self):
+        """ File objects are read from but left open
+        """
+        with open(TEST_FILE, 'rb') as fhandle:
+            features = list(iter_unmarshal(fhandle))
+            self.assertFalse(fhandle.closed)
+        self.assertEqual(len(features), 3)
+
+    def test_elements_cleared(self):
+        """ Elements are cleared once they are unmarshalled
+        """
+        elements = []
+        original = unmarshal_module.unmarshal
+        unmarshal_module.unmarshal = elements.append
+        try:
+            for _ in iter_unmarshal(TEST_FILE):
+                pass
+        finally:
+            unmarshal_module.unmarshal = original
+        self.assertEqual(len(elements), 3)
+        for elem in elements:
+            self.assertEqual(len(elem), 0)
+            self.assertTrue(elem.getprevious() is None)
+
+    def test_tags(self):
+        """ Multiple tags can be requested
+        """
+        values = list(iter_unmarshal(
+            TEST_FILE, tags=['gsml:observationMethod',
+                             'gsml:positionalAccuracy']))
+        self.assertEqual(values, ['interpretation', '250'])
+
+    def test_syntax_error(self):
+        """ Malformed documents raise an error with the position
+        """
+        with open(TEST_FILE, 'rb') as fhandle:
+            content = fhandle.read()
+        truncated = StringIO(content[:content.index('mf.3') + 100])
+        results = []
+        with self.assertRaises(UnmarshalError) as context:
+            for feature in iter_unmarshal(truncated):
+                results.append(feature)
+        self.assertEqual(len(results), 2)
+        self.assertTrue(context.exception.position[0] > 1)
+        self.assertTrue('after 2 elements' in str(context.exception))
+
+    def test_unmarshal_all(self):
+        """ unmarshal_all still returns a list
+        """
+        self.assertEqual(len(unmarshal_all(TEST_FILE)), 3)
+
+
+class TestPosition(unittest.TestCase):
+
+    """ Test decoding coordinates into arrays
+    """
+
+    def element(self, xml):
+        """ Parse an element, declaring the gml namespace on it
+        """
+        return etree.fromstring(re.sub(
+            r'^<([\w:]+)', r'<\1 xmlns:gml="http://www.opengis.net/gml"',
+            xml))
+
+    def test_poslist_whitespace(self):
+        """ Vertices don't need to be on separate lines
+        """
+        coords = position(self.element(
+            '<gml:posList>1 2 3 4\n  5 6\t7 8</gml:posList>'))
+        self.assertEqual(coords.shape, (4, 2))
+        self.assertTrue(numpy.allclose(coords[-1], [7, 8]))
+
+    def test_srs_dimension(self):
+        """ srsDimension is read from the element or its ancestors
+        """
+        coords = position(self.element(
+            '<gml:posList srsDimension="3">1 2 3 4 5 6</gml:posList>'))
+        self.assertEqual(coords.shape, (2, 3))
+        ring = self.element(
+            '<gml:LinearRing srsDimension="3"><gml:posList>'
+            '0 0 1 1 0 1 1 1 1 0 0 1</gml:posList></gml:LinearRing>')
+        self.assertEqual(position(ring[0]).shape, (4, 3))
+        with self.assertRaises(ValueError):
+            position(self.element(
+                '<gml:posList srsDimension="3">1 2 3 4</gml:posList>'))
+
+    def test_coordinates(self):
+        """ gml:coordinates tuples are split with the cs and ts attributes
+        """
+        coords = position(self.element(
+            '<gml:coordinates>1.5,2 3,4.5</gml:coordinates>'))
+        self.assertTrue(numpy.allclose(coords, [[1.5, 2], [3, 4.5]]))
+        coords = position(self.element(
+            '<gml:coordinates cs=" " ts=";" decimal=",">'
+            '1,5 2 3;4 5,5 6</gml:coordinates>'))
+        self.assertTrue(numpy.allclose(coords, [[1.5, 2, 3], [4, 5.5, 6]]))
+
+    def test_bad_values(self):
+        """ Values which aren't numbers raise an error rather than
+            truncating the coordinates
+        """
+        for text, bad in (('1 2 3 x 5 6', 'x'), ('1 2 3,4', '3,4'),
+                          ('1 2 3 4 - 6', '-'), ('1 2 3 4x', '4x'),
+                          ('1 2 3 4.5.6', '4.5.6'), ('1,2 3 4', '1,2')):
+            with self.assertRaises(UnmarshalError) as context:
+                position(self.element(
+                    '<gml:posList>{0}</gml:posList>'.format(text)))
+            self.assertTrue(repr(bad) in str(context.exception), text)
+        with self.assertRaises(UnmarshalError):
+            position(self.element(
+                '<gml:coordinates>1.5,2 3,4.5 x,1</gml:coordinates>'))
+        coords = position(self.element('<gml:pos>1e3 -2.5E-1</gml:pos>'))
+        self.assertTrue(numpy.allclose(coords, [[1000, -0.25]]))
+
+    def test_empty(self):
+        """ Empty elements give None
+        """
+        self.assertTrue(position(self.element('<gml:pos/>')) is None)
+
+    def test_linestring(self):
+        """ Single line posLists are unmarshalled into shapes
+        """
+        features = list(iter_unmarshal(TEST_FILE))
+        self.assertEqual(len(features[2].shape.coords), 3)
+
+
+class TestParallelUnmarshal(unittest.TestCase):
+
+    """ Test unmarshalling with a process pool
+    """
+
+    def setUp(self):
+        MetadataRegistry().clear()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_matches_serial(self):
+        """ Features come back in document order with the same shapes as
+            serial unmarshalling
+        """
+        serial = list(iter_unmarshal(TEST_FILE))
+        parallel = list(unmarshal_parallel(TEST_FILE, processes=2,
+                                           chunks_per_process=2))
+        self.assertEqual([f.ident for f in parallel],
+                         [f.ident for f in serial])
+        for pfeat, sfeat in zip(parallel, serial):
+            self.assertTrue(pfeat.shape.equals(sfeat.shape))
+            self.assertEqual(pfeat.specification, sfeat.specification)
+
+    def test_metadata_merged(self):
+        """ Metadata from each worker is registered in this process, so
+            references across chunks resolve
+        """
+        features = list(unmarshal_parallel(TEST_FILE, processes=3,
+                                           chunks_per_process=1))
+        registry = MetadataRegistry()
+        self.assertTrue('gu.granite' in registry)
+        self.assertTrue('gu.basalt' in registry)
+        self.assertEqual(features[1].metadata.find(
+            '{http://www.opengis.net/gml}name').text, 'Granite')
+        self.assertEqual(features[1].type, features[0].type)
+
+    def test_no_features(self):
+        """ Files without the tag give no results
+        """
+        self.assertEqual(
+            list(unmarshal_parallel(TEST_FILE, tag='gsml:Borehole')), [])
+
+    def edit(self, old, new):
+        """ Write an edited copy of the test file, returning its path
+        """
+        with open(TEST_FILE, 'rb') as fhandle:
+            xml = fhandle.read()
+        self.assertTrue(old in xml)
+        filename = os.path.join(self.tmpdir, 'edited.xml')
+        with open(filename, 'wb') as fhandle:
+            fhandle.write(xml.replace(old, new, 1))
+        return filename
+
+    def check_parallel(self, filename, tag='gsml:MappedFeature',
+                       splittable=False):
+        """ Check whether a file can be split, and that parallel
+            unmarshalling matches serial unmarshalling
+        """
+        self.assertEqual(
+            unmarshal_module._element_ranges(filename, tag) is not None,
+            splittable)
+        summary = lambda obj: obj if isinstance(obj, basestring) \
+            else (obj.ident, obj.specification)
+        serial = map(summary, iter_unmarshal(filename, tags=tag))
+        MetadataRegistry().clear()
+        parallel = map(summary, unmarshal_parallel(
+            filename, tag=tag, processes=2, chunks_per_process=2))
+        self.assertEqual(parallel, serial)
+        return parallel
+
+    def test_self_closing(self):
+        """ Self-closing elements fall back to serial unmarshalling
+        """
+        self.assertEqual(
+            self.check_parallel(TEST_FILE, tag='gsml:specification'),
+            ['gu.granite', 'gu.granite', 'gu.basalt'])
+
+    def test_comments(self):
+        """ Tags in comments and CDATA sections aren't split on
+        """
+        self.check_parallel(self.edit(
+            '<gsml:MappedFeature gml:id="mf.2">',
+            '<!-- </gsml:MappedFeature> -->\n'
+            '    <gsml:MappedFeature gml:id="mf.2">'))
+        self.check_parallel(self.edit(
+            '<gml:description>A basalt',
+            '<gml:description><![CDATA[<gsml:MappedFeature>]]>A basalt'))
+
+    def test_namespace_between_elements(self):
+        """ Namespaces declared between the elements fall back to serial
+            unmarshalling
+        """
+        self.check_parallel(self.edit(
+            '    <gsml:MappedFeature gml:id="mf.3">',
+            '  </gml:featureMembers>\n'
+            '  <gml:featureMembers xmlns:geo="urn:geo">\n'
+            '    <gsml:MappedFeature gml:id="mf.3">'))
+
+    def test_namespace_not_in_scope(self):
+        """ Namespaces declared on elements which aren't ancestors of the
+            first element don't end up in the header
+        """
+        features = self.check_parallel(self.edit(
+            '<gml:featureMembers>',
+            '<wfs:extra xmlns:gml="urn:not-gml"/>\n  <gml:featureMembers>'),
+            splittable=True)
+        self.assertEqual(features[0], ('mf.1', 'gu.granite'))
+
+
+if __name__ == '__main__':
+    unittest.main()
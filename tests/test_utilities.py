@@ -6,9 +6,17 @@
     description: unittests for pysiss/borehole/utilities.py
 """
 
+import os
 import unittest
 import numpy
-from pysiss.utilities import mask_all_nans
+from pysiss.utilities import mask_all_nans, get_unit_registry, parse_units, \
+    normalize_srs, get_transformer, transform_coordinates, project_many, \
+    is_latitude_first, collar_position
+from pysiss.vocabulary.unmarshal import iter_unmarshal
+from pysiss.coverage.vector import MappedFeature, MappedFeatureCollection
+from shapely.geometry import Point, LineString, Polygon, MultiPolygon
+from pysiss.borehole import SISSBoreholeGenerator
+from pysiss.borehole.borehole import Borehole, OriginPosition
 
 
 class TestMaskNans(unittest.TestCase):
@@ -32,3 +40,129 @@ class TestMaskNans(unittest.TestCase):
         self.assertRaises(ValueError, mask_all_nans,
                           "i'm a string",
                           range(10))
+
+
+class TestUnits(unittest.TestCase):
+
+    """ Testing the shared unit registry
+    """
+
+    def test_shared_registry(self):
+        "Registry should only be created once"
+        self.assertTrue(get_unit_registry() is get_unit_registry())
+        self.assertTrue(
+            SISSBoreholeGenerator().unit_reg is get_unit_registry())
+
+    def test_parse_units(self):
+        "Unit labels should be parsed once and cached"
+        unit_reg = get_unit_registry()
+        self.assertEqual(parse_units('m'), 1 * unit_reg.meter)
+        self.assertTrue(parse_units('m') is parse_units('m'))
+
+
+class TestProjection(unittest.TestCase):
+
+    """ Testing reprojection of coordinates and shapes
+    """
+
+    def test_normalize_srs(self):
+        "srsNames in different forms give the same EPSG code"
+        for srs in (4326, 'EPSG:4326', 'urn:ogc:def:crs:EPSG::4326',
+                    'urn:ogc:def:crs:EPSG:6.6:4326',
+                    'http://www.opengis.net/gml/srs/epsg.xml#4326'):
+            self.assertEqual(normalize_srs(srs), 'EPSG:4326')
+
+    def test_transformer_cached(self):
+        "Transformers are built once for each pair"
+        self.assertTrue(get_transformer('EPSG:4283', 28350)
+                        is get_transformer('urn:ogc:def:crs:EPSG::4283',
+                                           'EPSG:28350'))
+
+    def test_transform_coordinates(self):
+        "GDA94 coordinates are transformed into MGA zone 50"
+        coords = transform_coordinates([[121, -30, 5], [117, -31, 10]],
+                                       'EPSG:4283', 28350)
+        self.assertTrue(numpy.allclose(coords[0],
+                                       [885948.583, 6674471.653, 5]))
+        self.assertTrue(numpy.allclose(coords[:, 2], [5, 10]))
+        roundtrip = transform_coordinates(coords, 28350, 4283)
+        self.assertTrue(numpy.allclose(roundtrip[1], [117, -31, 10]))
+
+    def test_project_many(self):
+        "Geometries keep their structure through reprojection"
+        hole = [(116.2, -31.2), (116.4, -31.2), (116.4, -31.4)]
+        shapes = [Point(116, -31),
+                  LineString([(116, -31), (117, -32)]),
+                  Polygon([(116, -31), (117, -31), (117, -32)], [hole]),
+                  MultiPolygon([Polygon([(116, -31), (117, -31),
+                                         (117, -32)])])]
+        projected = project_many(shapes, 28350, 4326)
+        self.assertEqual([s.geom_type for s in projected],
+                         [s.geom_type for s in shapes])
+        self.assertEqual(len(projected[2].interiors), 1)
+        back = project_many(projected, 4326, 28350)
+        for original, shape in zip(shapes, back):
+            self.assertTrue(original.almost_equals(shape, decimal=6))
+
+    def test_reproject_features(self):
+        "Features in different projections are reprojected together"
+        features = MappedFeatureCollection([
+            MappedFeature(Point(121, -30).buffer(0.1), 'EPSG:4283', 'a'),
+            MappedFeature(Point(885948.583, 6674471.653).buffer(100),
+                          'urn:ogc:def:crs:EPSG::28350', 'b')])
+        features.reproject(28350)
+        self.assertEqual([f.projection for f in features],
+                         ['EPSG:28350', 'EPSG:28350'])
+        self.assertEqual(len(features.containing(885948.583, 6674471.653)),
+                         2)
+        features[1].reproject('EPSG:4283')
+        self.assertTrue(features[1].shape.contains(Point(121, -30)))
+
+    def test_axis_order(self):
+        "URNs use the reference system's axis order, other names x/y"
+        self.assertTrue(is_latitude_first('urn:ogc:def:crs:EPSG::4326'))
+        self.assertFalse(is_latitude_first('urn:ogc:def:crs:EPSG::28350'))
+        self.assertFalse(is_latitude_first('EPSG:4326'))
+        self.assertFalse(is_latitude_first(4326))
+        coords = transform_coordinates([[-30, 121]],
+                                       'urn:ogc:def:crs:EPSG::4283', 28350)
+        self.assertTrue(numpy.allclose(coords[0], [885948.583, 6674471.653]))
+
+    def test_bad_axis_order(self):
+        "Coordinates which can't be transformed raise an error"
+        self.assertRaises(ValueError, transform_coordinates,
+                          [[-30, 121]], 4326, 28350)
+        coords = transform_coordinates([[numpy.nan, numpy.nan]], 4326, 28350)
+        self.assertFalse(numpy.isfinite(coords).any())
+
+    def test_reproject_unmarshalled(self):
+        "Latitude-first GML features can be reprojected"
+        filename = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                'geosciml', 'mapped_features.xml')
+        features = MappedFeatureCollection(iter_unmarshal(filename))
+        self.assertRaises(ValueError, features.reproject, 28350)
+        features.reproject(28350, swap_axes=True)
+        corners = transform_coordinates([[120, -31], [121, -30]], 4326,
+                                        28350)
+        bounds = features[0].shape.bounds
+        self.assertTrue(numpy.isfinite(bounds).all())
+        self.assertTrue(numpy.allclose(
+            [bounds[0], bounds[1], bounds[2], bounds[3]],
+            [corners[0, 0], corners[0, 1], corners[1, 0], corners[1, 1]],
+            atol=2e4))
+        self.assertTrue(features[0].shape.contains(Point(
+            *transform_coordinates([[120.5, -30.5]], 4326, 28350)[0])))
+
+    def test_collar_position(self):
+        "Collar positions are converted to degrees and metres"
+        unit_reg = get_unit_registry()
+        borehole = Borehole('BH1', OriginPosition(
+            numpy.radians(-30) * unit_reg.radian, 120.5,
+            2 * unit_reg.kilometer))
+        self.assertTrue(numpy.allclose(collar_position(borehole),
+                                       [120.5, -30, 2000]))
+        borehole = Borehole('BH2', OriginPosition(-30, None, None))
+        longitude, latitude, elevation = collar_position(borehole)
+        self.assertTrue(numpy.isnan(longitude))
+        self.assertEqual((latitude, elevation), (-30, 0))
+        self.assertTrue(numpy.isnan(collar_position(Borehole('BH3'))).all())
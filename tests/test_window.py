@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+""" file:   test_window.py
+    author: Jess Robertson
+            CSIRO Mineral Resources Flagship
+    date:   Friday 16 January, 2015
+
+    description: Tests for depth windows on datasets
+"""
+
+from pysiss import borehole as pybh
+
+import numpy
+import unittest
+
+DENSITY = pybh.PropertyType(name="d", long_name="density", units="g/cm3")
+
+
+class TestPointWindow(unittest.TestCase):
+
+    """ Unit tests for PointDataSet.window
+    """
+
+    def setUp(self):
+        self.dataset = pybh.PointDataSet('test', numpy.linspace(0, 10, 101))
+        self.dataset.add_property(DENSITY, numpy.sin(self.dataset.depths))
+
+    def test_matches_get_interval(self):
+        """ Windows should contain the same data as get_interval
+        """
+        for from_depth, to_depth in [(2, 5), (2.05, 4.95), (-1, 11), (0, 0)]:
+            window = self.dataset.window(from_depth, to_depth)
+            interval = self.dataset.get_interval(from_depth, to_depth)
+            self.assertTrue(numpy.all(window.depths == interval.depths))
+            self.assertTrue(numpy.all(window.properties['d'].values ==
+                                      interval.properties['d'].values))
+
+    def test_views(self):
+        """ Windows should not copy data
+        """
+        window = self.dataset.window(2, 5)
+        self.assertTrue(numpy.may_share_memory(window.depths,
+                                               self.dataset.depths))
+        self.assertTrue(numpy.may_share_memory(
+            window.properties['d'].values,
+            self.dataset.properties['d'].values))
+
+    def test_block_views(self):
+        """ Windows of columnar datasets are views of the block
+        """
+        self.dataset.consolidate()
+        window = self.dataset.window(2, 5)
+        self.assertTrue(numpy.may_share_memory(window.block.values,
+                                               self.dataset.block.values))
+
+    def test_empty(self):
+        """ Empty windows raise an AssertionError, like get_interval
+        """
+        self.assertRaises(AssertionError, self.dataset.window, 20, 30)
+
+    def test_interval_indices(self):
+        """ Interval indices are inclusive at both ends
+        """
+        indices = self.dataset.get_interval_indices(1, 2)
+        self.assertEqual(list(indices), range(10, 21))
+
+
+class TestIntervalWindow(unittest.TestCase):
+
+    """ Unit tests for IntervalDataSet.window
+    """
+
+    def setUp(self):
+        self.dataset = pybh.IntervalDataSet('test', [0, 1, 3, 4, 7],
+                                            [1, 2, 4, 6, 8])
+        self.dataset.add_property(DENSITY, numpy.arange(5.))
+
+    def test_matches_get_interval(self):
+        """ Windows should contain the same data as get_interval
+        """
+        for from_depth, to_depth in [(0, 4), (0.5, 6), (1, 8), (-1, 10)]:
+            window = self.dataset.window(from_depth, to_depth)
+            interval = self.dataset.get_interval(from_depth, to_depth)
+            self.assertTrue(numpy.all(window.from_depths ==
+                                      interval.from_depths))
+            self.assertTrue(numpy.all(window.to_depths == interval.to_depths))
+            self.assertTrue(numpy.all(window.properties['d'].values ==
+                                      interval.properties['d'].values))
+
+    def test_contained(self):
+        """ Only completely contained intervals are returned
+        """
+        window = self.dataset.window(0.5, 6)
+        self.assertEqual(list(window.from_depths), [1, 3, 4])
+        self.assertTrue(numpy.may_share_memory(
+            window.properties['d'].values,
+            self.dataset.properties['d'].values))
+
+
+if __name__ == '__main__':
+    unittest.main()